@@ -1,63 +1,96 @@
 import time
 from concurrent import futures
-from typing import Type, Generator, Any
-
-from bounded_pool_executor import BoundedThreadPoolExecutor
-from concurrent import futures
+from typing import Type, Generator, Any, Optional
 
+from app.applications.workers import worker_pool, RemotePage
 from app.domain.facebook import FacebookPageFactory
-from app.domain.facebook_business_page import FacebookBusinessPage
-from app.domain.facebook_web_page import FacebookWebPage
 from app.domain.utils.logutils import init_logger
-from app.domain.utils.tracker import tracker
-from app.infrastructure.repositories import RedisRepository, RedisWebRepository, OrderItemRepository
-from app.infrastructure.schemas import FacebookItem
-from app.infrastructure.settings import LOG_DIR, FACEBOOK_THREADS
+from app.domain.utils.metrics import ITEMS_PROCESSED, ITEMS_UPDATED
+from app.domain.utils.progress import OrderProgress, ProgressCallback
+from app.domain.utils.scheduler import executor
+from app.domain.utils.tracing import traced
+from app.domain.utils.tracker import ItemTracker
+from app.infrastructure.repositories import (
+    RedisRepository, RedisWebRepository, OrderItemRepository, FacebookPageCacheRepository, SnapshotRepository,
+    CheckpointRepository
+)
+from app.infrastructure.schemas import FacebookRecord
+from app.infrastructure.settings import LOG_DIR, FACEBOOK_MAX_THREADS, PAGE_CACHE_ENABLED, SNAPSHOT_ENABLED, \
+    RABBITMQ_PROGRESS_INTERVAL, CHECKPOINT_ENABLED
 
 
 class FacebookBusinessService:
-    def __init__(self, oid: str, search_type: str, keyword: str):
+    def __init__(self, oid: str, search_type: str, keyword: str, on_progress: Optional[ProgressCallback] = None,
+                 item_ids: Optional[list[int]] = None, run_key: Optional[str] = None):
         self.search_type: str = search_type
         self.oid: str = oid
         self.keyword: str = keyword
+        # A shard of the order processes only its items and keeps its own checkpoint
+        self.item_ids = item_ids
+        self.run_key: str = run_key or oid
+        self.progress = OrderProgress(oid, on_progress, RABBITMQ_PROGRESS_INTERVAL)
 
         self.parser: Type[FacebookPageFactory] = FacebookPageFactory
-        self.page = self.parser.create_page(self.search_type)
+        self.page = create_page(self.search_type)
         self.repository = OrderItemRepository()
+        self.checkpoint = order_checkpoint(search_type)
         self.logger = init_logger(filename="facebook_business.log", logdir=str(LOG_DIR))
         self.logger.info(f'=================== START PROCESS Facebook {self.search_type.upper()} SERVICE =================')
         self.logger.info(f'oid={oid} | search_type={search_type}')
 
+    @traced('service.process')
     def process(self) -> int:
         updated_amount = 0
         try:
-            items = self.repository.get_items(oid=self.oid)
+            items = self.repository.get_items(oid=self.oid, ids=self.item_ids)
 
             self.logger.info(f"Imported {len(items)} items.")
-            for chunk in self.chunks_generator(items, FACEBOOK_THREADS):
+            items, updated_amount = self.resume(items)
+            self.progress.add_total(len(items))
+            for chunk in self.chunks_generator(items, FACEBOOK_MAX_THREADS):
                 result = []
-                with BoundedThreadPoolExecutor(FACEBOOK_THREADS) as executor:
-                    futures_list = [
-                        executor.submit(self.__worker, item)
-                        for item in chunk
-                    ]
+                futures_list = [
+                    executor.submit(self.oid, self.__worker, item)
+                    for item in chunk
+                ]
 
-                    for finished in futures.as_completed(futures_list):
-                        if finished.result() is not None:
-                            result.append(finished.result())
+                for finished in futures.as_completed(futures_list):
+                    if finished.result() is not None:
+                        result.append(finished.result())
 
                 saved = self.repository.save_items(oid=self.oid, items=result)
                 updated_amount += saved
+                if self.checkpoint:
+                    self.checkpoint.mark_done(self.run_key, result, saved)
+                ITEMS_PROCESSED.labels(self.search_type).inc(len(chunk))
+                ITEMS_UPDATED.labels(self.search_type).inc(saved)
+                self.progress.saved(len(chunk), saved)
                 self.logger.info(f"{saved} items updated in 1 chunk.")
 
         except Exception as e:
             self.logger.error(f"Error in process: {e}")
 
+        if self.checkpoint:
+            self.checkpoint.clear(self.run_key)
         self.logger.info(f"Final DB: {updated_amount} items updated!")
         self.logger.info(f'================ END PROCESS Facebook {self.search_type.upper()} SERVICE ================')
         return updated_amount
 
-    def __worker(self, item: FacebookItem) -> FacebookItem:
+    def resume(self, items: list[FacebookRecord]) -> tuple[list[FacebookRecord], int]:
+        """
+        Drop the items saved before the order was interrupted.
+        :return: Items left to process and the number of items already updated.
+        """
+        if not self.checkpoint:
+            return items, 0
+
+        done, updated = self.checkpoint.load(self.run_key)
+        if done:
+            items = [item for item in items if self.checkpoint.item_key(item) not in done]
+            self.logger.info(f"Resumed from checkpoint: {len(done)} items already done, {len(items)} left.")
+        return items, updated
+
+    def __worker(self, item: FacebookRecord) -> FacebookRecord:
         result = item
         try:
             result = self.page.worker(item)
@@ -73,19 +106,23 @@ class FacebookBusinessService:
 
 
 class FacebookGoogleService:
-    def __init__(self, oid: str, search_type: str):
+    def __init__(self, oid: str, search_type: str, on_progress: Optional[ProgressCallback] = None):
         self.search_type: str = search_type
         self.oid: str = oid
+        self.progress = OrderProgress(oid, on_progress, RABBITMQ_PROGRESS_INTERVAL)
 
         self.parser: Type[FacebookPageFactory] = FacebookPageFactory
-        self.page = self.parser.create_page(self.search_type)
-        self.repository = RedisRepository()
+        self.page = create_page(self.search_type)
+        self.tracker = ItemTracker(oid)
+        self.repository = RedisRepository(self.tracker)
+        self.checkpoint = order_checkpoint(search_type)
         self.logger = init_logger(filename="facebook_google.log", logdir=str(LOG_DIR))
         self.logger.info(f'=================== START PROCESS Facebook {self.search_type.upper()} SERVICE =================')
         self.logger.info(f'oid={oid} | search_type={search_type}')
 
+    @traced('service.process')
     def process(self) -> int:
-        updated_amount = 0
+        updated_amount = self.resume()
         psd_processed = False
         while not psd_processed:
             try:
@@ -96,20 +133,25 @@ class FacebookGoogleService:
                     continue
 
                 self.logger.info(f"Imported {len(items)} items.")
-                for chunk in self.chunks_generator(items, FACEBOOK_THREADS):
+                self.progress.add_total(len(items))
+                for chunk in self.chunks_generator(items, FACEBOOK_MAX_THREADS):
                     result = []
-                    with BoundedThreadPoolExecutor(FACEBOOK_THREADS) as executor:
-                        futures_list = [
-                            executor.submit(self.__worker, item)
-                            for item in chunk
-                        ]
+                    futures_list = [
+                        executor.submit(self.oid, self.__worker, item)
+                        for item in chunk
+                    ]
 
-                        for finished in futures.as_completed(futures_list):
-                            if finished.result() is not None:
-                                result.append(finished.result())
+                    for finished in futures.as_completed(futures_list):
+                        if finished.result() is not None:
+                            result.append(finished.result())
 
                     saved = self.repository.save_items(self.oid, result)
                     updated_amount += saved
+                    if self.checkpoint:
+                        self.checkpoint.mark_done(self.oid, result, saved)
+                    ITEMS_PROCESSED.labels(self.search_type).inc(len(chunk))
+                    ITEMS_UPDATED.labels(self.search_type).inc(saved)
+                    self.progress.saved(len(chunk), saved)
                     self.logger.info(f"{saved} items updated in 1 chunk.")
 
             except Exception as e:
@@ -117,11 +159,32 @@ class FacebookGoogleService:
 
         self.repository.clean_redis_key(self.oid)
         self.repository.batch_insert(self.oid)
+        if self.checkpoint:
+            self.checkpoint.clear(self.oid)
+        self.tracker.clear()
         self.logger.info(f"Final DB: {updated_amount} items updated!")
         self.logger.info(f'================ END PROCESS Facebook {self.search_type.upper()} SERVICE ================')
         return updated_amount
 
-    def __worker(self, item: FacebookItem) -> FacebookItem:
+    def resume(self) -> int:
+        """
+        Restore the items saved before the order was interrupted: they are marked as
+        processed, so get_items skips them, and go to batch_insert with the new ones.
+        :return: Number of items already updated.
+        """
+        self.tracker.reset()
+        if not self.checkpoint:
+            return 0
+
+        done, updated = self.checkpoint.load(self.oid)
+        for web, item in done.items():
+            self.tracker.processed(web)
+            self.tracker.add(item)
+        if done:
+            self.logger.info(f"Resumed from checkpoint: {len(done)} items already done.")
+        return updated
+
+    def __worker(self, item: FacebookRecord) -> FacebookRecord:
         result = item
         try:
             result = self.page.worker(item)
@@ -137,13 +200,16 @@ class FacebookGoogleService:
 
 
 class FacebookWebService:
-    def __init__(self, oid: str, search_type: str):
+    def __init__(self, oid: str, search_type: str, on_progress: Optional[ProgressCallback] = None):
         self.search_type: str = search_type
         self.oid: str = oid
+        self.progress = OrderProgress(oid, on_progress, RABBITMQ_PROGRESS_INTERVAL)
 
         self.parser: Type[FacebookPageFactory] = FacebookPageFactory
-        self.page = self.parser.create_page(self.search_type)
-        self.repository = RedisWebRepository()
+        self.page = create_page(self.search_type)
+        self.tracker = ItemTracker(oid)
+        self.repository = RedisWebRepository(self.tracker)
+        self.checkpoint = order_checkpoint(search_type)
         self.logger = init_logger(filename="facebook_web.log", logdir=str(LOG_DIR))
         self.logger.info(f'=================== START PROCESS Facebook {self.search_type.upper()} SERVICE =================')
         self.logger.info(f'oid={oid} | search_type={search_type}')
@@ -151,8 +217,9 @@ class FacebookWebService:
     def __del__(self):
         self.logger.info(f'================ END PROCESS Facebook {self.search_type.upper()} SERVICE ================')
 
+    @traced('service.process')
     def process(self) -> int:
-        updated_amount = 0
+        updated_amount = self.resume()
         waited = 0
         max_wait = 300 # 5 minutes
         while waited < max_wait:
@@ -166,19 +233,24 @@ class FacebookWebService:
                 waited = 0
                 max_wait = 1 # Lower wait time after getting first items
                 self.logger.info(f"Imported {len(items)} items.")
+                self.progress.add_total(len(items))
                 result: list[Any] = []
-                with futures.ThreadPoolExecutor(max_workers=FACEBOOK_THREADS) as executor:
-                    future_to_item = {
-                        executor.submit(self.__worker, item): item
-                        for item in items
-                    }
-                    for future in futures.as_completed(future_to_item):
-                        res = future.result()
-                        if res is not None:
-                            result.append(res)
+                future_to_item = {
+                    executor.submit(self.oid, self.__worker, item): item
+                    for item in items
+                }
+                for future in futures.as_completed(future_to_item):
+                    res = future.result()
+                    if res is not None:
+                        result.append(res)
 
                 saved = self.repository.save_items(self.oid, result)
                 updated_amount += saved
+                if self.checkpoint:
+                    self.checkpoint.mark_done(self.oid, result, saved)
+                ITEMS_PROCESSED.labels(self.search_type).inc(len(items))
+                ITEMS_UPDATED.labels(self.search_type).inc(saved)
+                self.progress.saved(len(items), saved)
                 self.logger.info(f"{saved} items updated in this batch.")
 
             except Exception as e:
@@ -188,14 +260,33 @@ class FacebookWebService:
 
         # self.repository.clean_redis_key(self.oid)
         self.repository.batch_insert(self.oid)
-        
+        if self.checkpoint:
+            self.checkpoint.clear(self.oid)
         # Очищаем трекер после завершения обработки
-        tracker.clear()
-        
+        self.tracker.clear()
+
         self.logger.info(f"Final DB: {updated_amount} items updated!")
         return updated_amount
 
-    def __worker(self, item: FacebookItem) -> FacebookItem:
+    def resume(self) -> int:
+        """
+        Restore the items saved before the order was interrupted: they are marked as
+        processed, so get_items skips them, and go to batch_insert with the new ones.
+        :return: Number of items already updated.
+        """
+        self.tracker.reset()
+        if not self.checkpoint:
+            return 0
+
+        done, updated = self.checkpoint.load(self.oid)
+        for web, item in done.items():
+            self.tracker.processed(web)
+            self.tracker.add(item)
+        if done:
+            self.logger.info(f"Resumed from checkpoint: {len(done)} items already done.")
+        return updated
+
+    def __worker(self, item: FacebookRecord) -> FacebookRecord:
         result = item
         try:
             result = self.page.worker(item)
@@ -210,9 +301,31 @@ class FacebookWebService:
             yield data[i:i + size]
 
 
-FacebookPageFactory.register_page("business", FacebookBusinessPage)
-FacebookPageFactory.register_page("web", FacebookWebPage)
-FacebookPageFactory.register_page("google", FacebookBusinessPage)
+def create_page(search_type: str):
+    """
+    Page of the search type, or its stand-in when the items are processed by the worker processes.
+    """
+    if worker_pool.running:
+        return RemotePage(search_type, worker_pool)
+    return FacebookPageFactory.create_page(search_type, cache=page_cache(), snapshots=snapshot_store())
+
+
+def page_cache() -> FacebookPageCacheRepository | None:
+    return FacebookPageCacheRepository() if PAGE_CACHE_ENABLED else None
+
+
+def snapshot_store() -> SnapshotRepository | None:
+    return SnapshotRepository() if SNAPSHOT_ENABLED else None
+
+
+def order_checkpoint(search_type: str) -> CheckpointRepository | None:
+    return CheckpointRepository(search_type) if CHECKPOINT_ENABLED else None
+
+
+# The page modules are imported when their search type is first used
+FacebookPageFactory.register_page("business", "app.domain.facebook_business_page:FacebookBusinessPage")
+FacebookPageFactory.register_page("web", "app.domain.facebook_web_page:FacebookWebPage")
+FacebookPageFactory.register_page("google", "app.domain.facebook_business_page:FacebookBusinessPage")
 
 
 if __name__ == "__main__":
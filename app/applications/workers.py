@@ -0,0 +1,322 @@
+import itertools
+import math
+import multiprocessing as mp
+import queue
+import threading
+from concurrent.futures import Future
+from multiprocessing.connection import Connection, wait
+from typing import Optional
+
+import psutil
+
+from app.domain.utils.logutils import init_logger, log_context, log_fields
+from app.domain.utils.metrics import mark_process_dead
+from app.domain.utils.profiler import install_profiler
+from app.domain.utils.scheduler import Deferred, task_deferred_since
+from app.domain.utils.tracing import setup_tracing, trace_carrier, attached
+from app.infrastructure.schemas import FacebookRecord
+from app.infrastructure.settings import LOG_DIR, FACEBOOK_THREADS, FACEBOOK_PROCESS_MAX_RSS_MB
+
+logger = init_logger(filename="facebook.log", logdir=str(LOG_DIR))
+
+
+def _process_rss_mb(process: psutil.Process) -> float:
+    # The browsers and chromedrivers are children of the worker, their memory counts too
+    rss = process.memory_info().rss
+    for child in process.children(recursive=True):
+        try:
+            rss += child.memory_info().rss
+        except psutil.Error:
+            pass
+    return rss / 2 ** 20
+
+
+def _worker_main(slot: int, tasks, results: Connection, threads: int, max_rss_mb: int) -> None:
+    """
+    Worker process: runs page.worker for the items from the task queue in its own threads,
+    with its own browsers. Stops taking tasks when its memory grows over max_rss_mb,
+    finishes the tasks it has and exits, so the supervisor starts a fresh one.
+    """
+    from app.applications.services import FacebookPageFactory, page_cache, snapshot_store
+
+    setup_tracing()
+    # kill -USR2 <pid of the worker> profiles the worker process
+    install_profiler(port=0)
+    process = psutil.Process()
+    pages, pages_lock = {}, threading.Lock()
+    recycle = threading.Event()
+    results_lock = threading.Lock()
+
+    def send(message: tuple) -> None:
+        with results_lock:
+            results.send(message)
+
+    def get_page(search_type: str):
+        with pages_lock:
+            if search_type not in pages:
+                pages[search_type] = FacebookPageFactory.create_page(
+                    search_type, cache=page_cache(), snapshots=snapshot_store())
+            return pages[search_type]
+
+    def run() -> None:
+        while not recycle.is_set():
+            try:
+                task = tasks.get(timeout=1)
+            except queue.Empty:
+                continue
+            if task is None:
+                return
+
+            task_id, search_type, item, fields, carrier, deferral = task
+            # The item can be deferred only if the executor task it came from can
+            token = task_deferred_since.set(deferral[0]) if deferral else None
+            try:
+                with log_fields(**fields), attached(carrier):
+                    result = get_page(search_type).worker(item)
+                send(('done', process.pid, task_id, result, None))
+            except Deferred as deferred:
+                send(('deferred', process.pid, task_id, deferred.delay))
+            except Exception as err:
+                send(('done', process.pid, task_id, None, repr(err)))
+            finally:
+                if token is not None:
+                    task_deferred_since.reset(token)
+
+            if max_rss_mb and _process_rss_mb(process) > max_rss_mb:
+                recycle.set()
+
+    workers = [threading.Thread(target=run, name=f'fb-process-{slot}-{n}') for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    if recycle.is_set():
+        logger.info(f"Worker process {slot} ({process.pid}) recycled at {_process_rss_mb(process):.0f} MB")
+    # Браузеры, которые не закрылись, не должны пережить процесс
+    for child in process.children(recursive=True):
+        try:
+            child.kill()
+        except psutil.Error:
+            pass
+    send(('exit', process.pid, slot))
+
+
+def _deferral() -> tuple:
+    # task_deferred_since of the executor task which submits the item, empty outside the executor
+    try:
+        return (task_deferred_since.get(),)
+    except LookupError:
+        return ()
+
+
+class WorkerPool:
+    """
+    Supervisor of the worker processes (main.py --processes K). The services stay in the
+    main process and hand every item to RemotePage, which sends it to the least loaded
+    worker over its own multiprocessing queue; results come back over a pipe per worker,
+    so a worker killed in the middle of a write can't block the others. The supervisor
+    remembers which items each worker has, so when a worker dies or is recycled its
+    unfinished items go to the others.
+    """
+
+    def __init__(self):
+        self.ctx = mp.get_context('spawn')
+        self.lock = threading.Lock()
+        self.counter = itertools.count()
+        self.pending: dict[int, tuple[Future, tuple]] = {}
+        self.processes: dict[int, mp.Process] = {}
+        self.queues: dict[int, mp.Queue] = {}
+        # Task ids sent to the worker processes, by pid
+        self.assigned: dict[int, set[int]] = {}
+        self.results: dict[Connection, int] = {}
+        # Slots whose worker is being replaced, and the tasks which came while no worker was up
+        self.replacing: set[int] = set()
+        self.waiting: list[tuple] = []
+        self.size = 0
+        self.threads = 0
+        self.max_rss_mb = 0
+        self.stopping = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self.size > 0 and not self.stopping.is_set()
+
+    def start(self, processes: int, threads: int = None, max_rss_mb: int = FACEBOOK_PROCESS_MAX_RSS_MB) -> 'WorkerPool':
+        """
+        Start the worker processes.
+        :param processes: Number of worker processes.
+        :param threads: Threads per process (default: FACEBOOK_THREADS split between the processes).
+        :param max_rss_mb: Memory of a worker with its browsers after which it is recycled (0 - never).
+        """
+        self.threads = threads or max(1, math.ceil(FACEBOOK_THREADS / processes))
+        self.max_rss_mb = max_rss_mb
+        self.size = processes
+        for slot in range(processes):
+            self.__spawn(slot)
+
+        threading.Thread(target=self.__read_results, name='fb-pool-results', daemon=True).start()
+        threading.Thread(target=self.__watch, name='fb-pool-watch', daemon=True).start()
+        logger.info(f"Started {processes} worker processes x {self.threads} threads")
+        return self
+
+    def stop(self) -> None:
+        self.stopping.set()
+        # The respawn threads may still be adding workers, __spawn stops the ones which come late
+        with self.lock:
+            processes, self.processes = self.processes, {}
+            queues, self.queues = self.queues, {}
+            self.size = 0
+        for tasks in queues.values():
+            for _ in range(self.threads):
+                tasks.put(None)
+        for process in processes.values():
+            process.join(timeout=30)
+            if process.is_alive():
+                process.kill()
+            mark_process_dead(process.pid)
+
+    def submit(self, search_type: str, item: FacebookRecord) -> Future:
+        future = Future()
+        task = (next(self.counter), search_type, item, log_context.get(), trace_carrier(), _deferral())
+        with self.lock:
+            self.pending[task[0]] = (future, task)
+        self.__dispatch(task)
+        return future
+
+    def __dispatch(self, task: tuple) -> None:
+        with self.lock:
+            slots = [slot for slot, process in self.processes.items() if process.pid in self.assigned]
+            if not slots:
+                # Every worker is being replaced: the task goes to the first one which is up
+                self.waiting.append(task)
+                return
+            slot = min(slots, key=lambda s: len(self.assigned[self.processes[s].pid]))
+            self.assigned[self.processes[slot].pid].add(task[0])
+            tasks = self.queues[slot]
+        tasks.put(task)
+
+    def __spawn(self, slot: int) -> None:
+        tasks = self.ctx.Queue()
+        reader, writer = self.ctx.Pipe(duplex=False)
+        process = self.ctx.Process(
+            target=_worker_main,
+            args=(slot, tasks, writer, self.threads, self.max_rss_mb),
+            name=f'fb-process-{slot}',
+            daemon=True,
+        )
+        process.start()
+        writer.close()
+        with self.lock:
+            stopped = self.stopping.is_set()
+            if not stopped:
+                self.processes[slot] = process
+                self.queues[slot] = tasks
+                self.assigned[process.pid] = set()
+                self.results[reader] = process.pid
+                waiting, self.waiting = self.waiting, []
+        if stopped:
+            # The pool was stopped while the worker was starting
+            process.kill()
+            process.join()
+            reader.close()
+            return
+        for task in waiting:
+            self.__dispatch(task)
+
+    def __read_results(self) -> None:
+        while not self.stopping.is_set():
+            with self.lock:
+                readers = list(self.results)
+            for reader in wait(readers, timeout=1):
+                try:
+                    message = reader.recv()
+                except (EOFError, OSError):
+                    # The worker is gone, the watcher replaces it
+                    with self.lock:
+                        self.results.pop(reader, None)
+                    reader.close()
+                    continue
+                self.__handle(message)
+
+    def __handle(self, message: tuple) -> None:
+        kind, pid = message[:2]
+        if kind in ('done', 'deferred'):
+            task_id = message[2]
+            with self.lock:
+                self.assigned.get(pid, set()).discard(task_id)
+                future, _ = self.pending.pop(task_id, (None, None))
+            if future is None or future.done():
+                return
+            if kind == 'deferred':
+                # RemotePage.worker raises it in the executor, which runs the item again later
+                future.set_exception(Deferred(message[3]))
+            elif message[4]:
+                future.set_exception(RuntimeError(message[4]))
+            else:
+                future.set_result(message[3])
+        elif kind == 'exit':
+            self.__replace(message[2], pid)
+
+    def __watch(self) -> None:
+        while not self.stopping.wait(1):
+            with self.lock:
+                dead = [(slot, process) for slot, process in self.processes.items() if not process.is_alive()]
+            for slot, process in dead:
+                if process.exitcode:
+                    logger.error(f"Worker process {slot} ({process.pid}) died with code {process.exitcode}")
+                self.__replace(slot, process.pid)
+
+    def __replace(self, slot: int, pid: int) -> None:
+        """
+        Take the slot out of the dispatch and start a fresh worker in it. Called by the
+        results reader ('exit') and by the watcher; only the first of them replaces the worker.
+        """
+        with self.lock:
+            process = self.processes.get(slot)
+            if self.stopping.is_set() or process is None or process.pid != pid or slot in self.replacing:
+                return
+            self.replacing.add(slot)
+            del self.processes[slot]
+            del self.queues[slot]
+            task_ids = self.assigned.pop(pid, set())
+            tasks = [self.pending[task_id][1] for task_id in task_ids if task_id in self.pending]
+
+        for task in tasks:
+            self.__dispatch(task)
+        if tasks:
+            logger.warning(f"Worker process {slot} ({pid}) is gone, {len(tasks)} items sent to the other workers")
+        # The join can take up to 30 s, the results of the other workers must not wait for it
+        threading.Thread(target=self.__respawn, args=(slot, process),
+                         name=f'fb-pool-respawn-{slot}', daemon=True).start()
+
+    def __respawn(self, slot: int, process: mp.Process) -> None:
+        try:
+            process.join(timeout=30)
+            if process.is_alive():
+                process.kill()
+            mark_process_dead(process.pid)
+            if not self.stopping.is_set():
+                self.__spawn(slot)
+        except Exception as err:
+            logger.error(f"Error replacing worker process {slot}: {err}")
+        finally:
+            with self.lock:
+                self.replacing.discard(slot)
+
+
+class RemotePage:
+    """
+    Stands in for the page of the search type in the services when the worker
+    processes are running: page.worker is done by a worker process.
+    """
+
+    def __init__(self, search_type: str, pool: WorkerPool):
+        self.search_type = search_type
+        self.pool = pool
+
+    def worker(self, item: FacebookRecord) -> Optional[FacebookRecord]:
+        return self.pool.submit(self.search_type, item).result()
+
+
+worker_pool = WorkerPool()
@@ -1,5 +1,8 @@
+import importlib
+import time
 from abc import ABC, abstractmethod
-from typing import Type, Optional
+from typing import Type, Optional, Iterable, Callable
+from urllib.parse import urlsplit, urlunsplit
 
 from selenium.webdriver.chrome.webdriver import WebDriver
 
@@ -9,134 +12,224 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.by import By
 from selenium.common.exceptions import TimeoutException
 
-from app.domain.utils.logutils import init_logger
-from app.domain.utils.proxy_manager import pmd, pwm
+from app.domain.utils.concurrency import controller
+from app.domain.utils.logutils import init_logger, log_fields
+from app.domain.utils.metrics import (
+    observe, BROWSER_LAUNCH, PAGE_LOAD, READY_WAIT, PARSE_FIELD, FETCH_ATTEMPTS
+)
+from app.domain.utils.proxy_manager import get_pmd, get_pwm
+from app.domain.utils.rate_limiter import rate_limiter
+from app.domain.utils.retry import FailureKind, RetryPolicy, classify_content, is_login_redirect
+from app.domain.utils.scheduler import Deferred, task_deferred_since
+from app.domain.utils.tracing import span
 from app.domain.utils.wdm import SeleniumBaseWebDriver
-from app.infrastructure.schemas import FacebookItem
-from app.infrastructure.settings import LOG_DIR, WDM_PROXY
+from app.infrastructure.schemas import FacebookRecord
+from app.infrastructure.settings import LOG_DIR, WDM_PROXY, PAGE_CACHE_INFLIGHT_WAIT, PAGE_CACHE_INFLIGHT_RETRY
+
+INTRO_TAB = 'intro'
+ABOUT_TAB = 'about'
+ABOUT_TAB_PATH = 'about_contact_and_basic_info'
+
+# Value of task_deferred_since outside the executor: the item can't be deferred there
+_NOT_DEFERRABLE = object()
+
+# Tabs are tried in this order when choosing which one can supply the missing fields.
+TAB_PRIORITY = (ABOUT_TAB, INTRO_TAB)
+
+# XPath markers which show that a field has been rendered on a profile tab.
+FIELD_MARKERS = {
+    'logo': {
+        INTRO_TAB: '//svg//image',
+    },
+    'title': {
+        INTRO_TAB: '//h1',
+        ABOUT_TAB: '//h1',
+    },
+    'address': {
+        INTRO_TAB: '//img[contains(@src,"8k_Y-oVxbuU.png")]',
+        ABOUT_TAB: '//i[@data-visualcompletion="css-img" and contains(@style, "-84px -126px")]',
+    },
+    'phone': {
+        INTRO_TAB: '//img[contains(@src,"Dc7-7AgwkwS.png")]',
+        ABOUT_TAB: '//i[@data-visualcompletion="css-img" and contains(@style, "-63px -126px")]',
+    },
+    'email': {
+        INTRO_TAB: '//img[contains(@src,"2PIcyqpptfD.png")]',
+        ABOUT_TAB: '//i[@data-visualcompletion="css-img" and contains(@style, "0px -155px")]',
+    },
+    'description': {
+        INTRO_TAB: '//div[contains(@class,"xieb3on")]',
+    },
+}
+
+
+def wait_for_fields(driver: WebDriver, xpaths: Iterable[str], timeout: int) -> bool:
+    """
+    Wait until every XPath marker is present on the page.
+    :param driver: WebDriver with the loaded page.
+    :param xpaths: XPath markers of the requested fields.
+    :param timeout: Maximum wait in seconds.
+    :return: True if all markers were found before the timeout, False otherwise.
+    """
+    xpaths = list(xpaths)
+    try:
+        WebDriverWait(driver, timeout).until(
+            lambda d: all(d.find_elements(By.XPATH, xpath) for xpath in xpaths))
+        return True
+    except TimeoutException:
+        return False
+
+
+def timed_wait_for_fields(driver: WebDriver, xpaths: Iterable[str], timeout: int) -> bool:
+    with observe(READY_WAIT):
+        return wait_for_fields(driver, xpaths, timeout)
+
+
+def proxy_tier(proxy_domain: Optional[str]) -> str:
+    return 'pool' if proxy_domain else 'residential'
 
 
 class FacebookBaseParser:
+    # 4 попытки через пул прокси, последняя через residential
+    retry_policy = RetryPolicy(max_attempts=5, pool_attempts=4)
+
     def __init__(self, search_type: str = 'business'):
         self.logger = init_logger(filename=f"facebook_{search_type}.log", logdir=str(LOG_DIR))
 
     def initialize_driver(self, proxy: str = None) -> Optional[WebDriver]:
         try:
-            return SeleniumBaseWebDriver.driver_factory(proxy=proxy)
+            with observe(BROWSER_LAUNCH):
+                return SeleniumBaseWebDriver.driver_factory(proxy=proxy)
         except Exception as e:
             self.logger.error(f"Error initializing WebDriver: {e}")
             return None
 
-    def fetch_content(self, link: str) -> str:
+    def fetch_content(self, link: str, ready_xpaths: list[str] = None) -> str | None:
+        """
+        :return: Page content, an empty string if it could not be loaded or None if the page is dead.
+        """
         result = ''
         try:
-            content = self._fetch_with_driver(link)
-            if content:
+            content = self._fetch_with_driver(link, ready_xpaths=ready_xpaths)
+            if content or content is None:
                 result = content
         except Exception as err:
             self.logger.error(err)
         return result
 
-    def _verify_cloudflare_captcha(self, selector: Selector) -> bool:
-        result = False
-        try:
-            text = selector.xpath("//head/title/text()").get(default="")
-            if "just a moment" in text.strip().lower():
-                result = True
-        except Exception as err:
-            self.logger.error(err)
-        return result
+    def _fetch_with_driver(self, url: str, ready_xpaths: list[str] = None) -> str | None:
+        pmd = get_pmd()
+        failures: list[FailureKind] = []
+        for i in range(self.retry_policy.max_attempts):
+            if failures:
+                time.sleep(self.retry_policy.delay(failures))
 
-    def _fetch_with_driver(self, url: str) -> str | None:
-        result = ''
-        captcha = False
-        driver = None
-        for i in range(5):
-            if pmd.get_active_proxy_count() < 1 or i == 4:
-                proxy_domain = None
-                proxy = WDM_PROXY
-            else:
+            proxy_domain = None
+            if not self.retry_policy.use_residential(i, failures) and pmd.get_active_proxy_count() > 0:
                 proxy_domain = pmd.get_proxy() or None
-                proxy = f'socks5://{proxy_domain}'
+            proxy = f'socks5://{proxy_domain}' if proxy_domain else WDM_PROXY
+
+            if rate_limiter:
+                # The token is taken before the browser is launched, no browser waits for it
+                rate_limiter.acquire(proxy_domain)
+            started = time.monotonic()
+            with log_fields(url=url, proxy=proxy_domain or 'residential', attempt=i + 1), \
+                    span('facebook.fetch_attempt', tier=proxy_tier(proxy_domain)) as attempt_span:
+                content, failure = self._load_page(url, proxy, proxy_domain, ready_xpaths, attempt=i + 1)
+                attempt_span.set_attribute('result', failure.value if failure else 'ok')
+            FETCH_ATTEMPTS.labels(proxy_tier(proxy_domain), failure.value if failure else 'ok').inc()
+            if proxy_domain is not None:
+                pmd.record_result(failure)
+                pmd.set_proxy(proxy_domain, is_bad=failure in (FailureKind.CAPTCHA, FailureKind.LOGIN_WALL))
+            if failure is None:
+                # The concurrency controller gets the load time of the page, without the retries
+                controller.record(True, time.monotonic() - started)
+                return content
+
+            failures.append(failure)
+            if not self.retry_policy.should_retry(i, failure):
+                break
+
+        # None: the page itself is not available, it's not worth fetching again
+        if failures and failures[-1] == FailureKind.DEAD_PAGE:
+            return None
+        controller.record(False, 0)
+        return ''
 
-            if proxy_domain is None and proxy != WDM_PROXY:
-                self.logger.info(f'{proxy}: Bad proxy')
-                continue
+    def _load_page(self, url: str, proxy: str, proxy_domain: Optional[str], ready_xpaths: list[str] = None,
+                   attempt: int = 1) -> tuple[str, Optional[FailureKind]]:
+        """
+        Load the page once through the proxy.
+        :return: Page content and None, or an empty content and the failure.
+        """
+        driver = self.initialize_driver(proxy=proxy)
+        if not driver:
+            return '', FailureKind.DRIVER_INIT
 
-            try:
-                driver = self.initialize_driver(proxy=proxy)
-                if not driver:
-                    continue
+        try:
+            with observe(PAGE_LOAD.labels(proxy_tier(proxy_domain))):
                 driver.get(url)
                 WebDriverWait(driver, 10).until(
                     EC.presence_of_element_located((By.XPATH, "//html[@id='facebook']")))
 
-                content = driver.page_source
-                selector = Selector(text=content)
-                captcha = self._verify_cloudflare_captcha(selector)
+            if is_login_redirect(driver.current_url):
+                self.logger.info(f'{proxy} [{attempt}]: Url - {url} - login redirect')
+                return '', FailureKind.LOGIN_WALL
 
-                if content and not captcha:
-                    self.logger.info(f'{proxy} [{i + 1}]: Url - {url} - True')
-                    result = content
-                elif not content:
-                    self.logger.info(f'{proxy} [{i + 1}]: Url - {url} - no content')
-                elif captcha:
-                    self.logger.info(f"{proxy} [{i + 1}]: Url - {url} - captcha cloudflare")
+            if ready_xpaths and not timed_wait_for_fields(driver, ready_xpaths, timeout=10):
+                self.logger.info(f'{proxy} [{attempt}]: Url - {url} - requested fields not rendered')
 
-            except (TimeoutException, Exception):
-                self.logger.warning(f'{proxy} [{i + 1}]: Url - {url} - failed to retrieve the page content...')
+            content = driver.page_source
+            failure = classify_content(content)
+            self.logger.info(f'{proxy} [{attempt}]: Url - {url} - {failure.value if failure else True}')
+            return ('' if failure else content), failure
 
-            finally:
-                driver.quit()
-                if proxy_domain is not None:
-                    if captcha:
-                        pmd.set_proxy(proxy_domain, is_bad=True)
-                    else:
-                        pmd.set_proxy(proxy_domain, is_bad=False)
-                if result:
-                    break
+        except Exception:
+            self.logger.warning(f'{proxy} [{attempt}]: Url - {url} - failed to retrieve the page content...')
+            return '', FailureKind.NETWORK
 
-        return result
+        finally:
+            try:
+                driver.quit()
+            except Exception as e:
+                self.logger.warning(f"Error closing driver: {e}")
 
 
 class FacebookWeb2Parser:
+    # Первая попытка через обычный прокси, остальные через residential
+    retry_policy = RetryPolicy(max_attempts=3, pool_attempts=1)
+
     def __init__(self, search_type: str = 'business'):
         self.logger = init_logger(filename=f"facebook_{search_type}.log", logdir=str(LOG_DIR))
 
     def initialize_driver(self, proxy: str = None) -> Optional[WebDriver]:
         try:
-            return SeleniumBaseWebDriver.driver_factory(proxy=proxy)
+            with observe(BROWSER_LAUNCH):
+                return SeleniumBaseWebDriver.driver_factory(proxy=proxy)
         except Exception as e:
             self.logger.error(f"Error initializing WebDriver: {e}")
             return None
 
-    def fetch_content(self, link: str) -> str:
+    def fetch_content(self, link: str, ready_xpaths: list[str] = None) -> str | None:
+        """
+        :return: Page content, an empty string if it could not be loaded or None if the page is dead.
+        """
         result = ''
         try:
-            content = self._fetch_with_driver(link)
-            if content:
+            content = self._fetch_with_driver(link, ready_xpaths=ready_xpaths)
+            if content or content is None:
                 result = content
         except Exception as err:
             self.logger.error(err)
         return result
 
-    def _verify_cloudflare_captcha(self, selector: Selector) -> bool:
-        result = False
-        try:
-            text = selector.xpath("//head/title/text()").get(default="")
-            if "just a moment" in text.strip().lower():
-                result = True
-        except Exception as err:
-            self.logger.error(err)
-        return result
-
     def _check_login_redirect(self, driver: WebDriver, original_url: str) -> bool:
         """
         Проверяет, произошло ли перенаправление на страницу логина
         """
         try:
             current_url = driver.current_url
-            if "login" in current_url.lower() or "login" in current_url:
+            if is_login_redirect(current_url):
                 self.logger.warning(f"Redirected to login page. Original: {original_url}, Current: {current_url}")
                 return True
             return False
@@ -144,179 +237,349 @@ class FacebookWeb2Parser:
             self.logger.error(f"Error checking login redirect: {e}")
             return False
 
-    def _fetch_with_driver(self, url: str) -> str | None:
-        result = ''
-        captcha = False
-        driver = None
-
-        # Увеличиваем количество попыток до 10: 5 с обычными прокси + 5 с residential
-        max_attempts = 3
-        regular_proxy_attempts = 1  # Первые 5 попыток с обычными прокси
+    def _fetch_with_driver(self, url: str, ready_xpaths: list[str] = None) -> str | None:
+        pwm = get_pwm()
+        failures: list[FailureKind] = []
 
         # Логируем начальное состояние прокси
         proxy_stats = pwm.get_proxy_stats()
         self.logger.info(f"Starting fetch for {url}. Proxy stats: {proxy_stats}")
 
+        max_attempts = self.retry_policy.max_attempts
         for i in range(max_attempts):
-            # Определяем тип прокси для текущей попытки
-            if i < regular_proxy_attempts and not pwm.should_use_only_residential():
-                # Первые 5 попыток: используем обычные прокси (если не превышен лимит неудач)
-                if pwm.get_active_proxy_count() < 1:
-                    proxy_domain = None
-                    proxy = WDM_PROXY
-                    self.logger.info(
-                        f"Attempt {i + 1}/{max_attempts}: No regular proxies available, using residential: {proxy}")
-                else:
+            if failures:
+                time.sleep(self.retry_policy.delay(failures))
+
+            # Обычные прокси, пока не превышен лимит неудач и не было капчи или логина
+            proxy_domain = None
+            if not self.retry_policy.use_residential(i, failures) and not pwm.should_use_only_residential():
+                if pwm.get_active_proxy_count() > 0:
                     proxy_domain = pwm.get_proxy() or None
-                    if proxy_domain:
-                        proxy = f'socks5://{proxy_domain}'
-                        self.logger.info(f"Attempt {i + 1}/{max_attempts}: Using regular proxy: {proxy}")
-                    else:
-                        proxy = WDM_PROXY
-                        proxy_domain = None
-                        self.logger.info(
-                            f"Attempt {i + 1}/{max_attempts}: No regular proxy available, using residential: {proxy}")
-            else:
-                # Последние 5 попыток или превышен лимит неудач: используем residential прокси
-                proxy_domain = None
-                proxy = WDM_PROXY
-                if pwm.should_use_only_residential():
-                    self.logger.info(f"Attempt {i + 1}/{max_attempts}: Using residential proxy (regular limit exceeded): {proxy}")
-                else:
-                    self.logger.info(f"Attempt {i + 1}/{max_attempts}: Using residential proxy: {proxy}")
-
-            if proxy_domain is None and proxy != WDM_PROXY:
-                self.logger.info(f'{proxy}: Bad proxy')
-                continue
+            proxy = f'socks5://{proxy_domain}' if proxy_domain else WDM_PROXY
+            self.logger.info(
+                f"Attempt {i + 1}/{max_attempts}: Using {'regular' if proxy_domain else 'residential'} proxy: {proxy}")
+
+            if rate_limiter:
+                # The token is taken before the browser is launched, no browser waits for it
+                rate_limiter.acquire(proxy_domain)
+            started = time.monotonic()
+            with log_fields(url=url, proxy=proxy_domain or 'residential', attempt=i + 1), \
+                    span('facebook.fetch_attempt', tier=proxy_tier(proxy_domain)) as attempt_span:
+                content, failure = self._load_page(url, proxy, proxy_domain, ready_xpaths, attempt=i + 1)
+                attempt_span.set_attribute('result', failure.value if failure else 'ok')
+            FETCH_ATTEMPTS.labels(proxy_tier(proxy_domain), failure.value if failure else 'ok').inc()
+            if proxy_domain is not None:
+                pwm.record_result(failure)
+                self._report_proxy(pwm, proxy_domain, failure)
+            if failure is None:
+                # The concurrency controller gets the load time of the page, without the retries
+                controller.record(True, time.monotonic() - started)
+                return content
+
+            failures.append(failure)
+            if not self.retry_policy.should_retry(i, failure):
+                break
+
+        self.logger.error(f"Failed to fetch content for {url} after {len(failures)} attempts: "
+                          f"{', '.join(failure.value for failure in failures)}")
+        # Логируем финальное состояние прокси
+        final_proxy_stats = pwm.get_proxy_stats()
+        self.logger.info(f"Final proxy stats after failed attempts: {final_proxy_stats}")
+        # None: the page itself is not available, it's not worth fetching again
+        if failures[-1] == FailureKind.DEAD_PAGE:
+            return None
+        controller.record(False, 0)
+        return ''
+
+    def _report_proxy(self, pwm, proxy_domain: str, failure: Optional[FailureKind]) -> None:
+        if failure is None or failure in (FailureKind.EMPTY_CONTENT, FailureKind.DEAD_PAGE):
+            pwm.set_proxy(proxy_domain, is_bad=False)
+            return
+
+        if failure == FailureKind.LOGIN_WALL:
+            # Сразу удаляем прокси из очереди без возврата
+            pwm.remove_proxy(proxy_domain)
+            self.logger.info(f"Removed proxy {proxy_domain} from queue due to login redirect")
+        else:
+            pwm.set_proxy(proxy_domain, is_bad=True)
+            self.logger.info(f"Marked proxy {proxy_domain} as bad: {failure.value}")
+        pwm.increment_regular_proxy_failures()  # Увеличиваем счетчик неудач
+
+    def _load_page(self, url: str, proxy: str, proxy_domain: Optional[str], ready_xpaths: list[str] = None,
+                   attempt: int = 1) -> tuple[str, Optional[FailureKind]]:
+        """
+        Load the page once through the proxy.
+        :return: Page content and None, or an empty content and the failure.
+        """
+        driver = self.initialize_driver(proxy=proxy)
+        if not driver:
+            self.logger.warning(f"Failed to initialize driver with proxy: {proxy}")
+            return '', FailureKind.DRIVER_INIT
 
+        try:
+            # Ждем загрузки основного HTML
             try:
-                driver = self.initialize_driver(proxy=proxy)
-                if not driver:
-                    self.logger.warning(f"Failed to initialize driver with proxy: {proxy}")
-                    if proxy_domain:
-                        pwm.set_proxy(proxy_domain, is_bad=True)
-                        pwm.increment_regular_proxy_failures()  # Увеличиваем счетчик неудач
-                        self.logger.info(f"Marked proxy {proxy_domain} as bad due to driver initialization failure")
-                    continue
-
-                # Загружаем страницу
-                driver.get(url)
-
-                # Ждем загрузки основного HTML
-                try:
+                with observe(PAGE_LOAD.labels(proxy_tier(proxy_domain))):
+                    driver.get(url)
                     WebDriverWait(driver, 10).until(
                         EC.presence_of_element_located((By.XPATH, "//html[@id='facebook']")))
-                except TimeoutException:
-                    self.logger.warning(f"Timeout waiting for Facebook page to load with proxy: {proxy}")
-                    if proxy_domain:
-                        pwm.set_proxy(proxy_domain, is_bad=True)
-                        pwm.increment_regular_proxy_failures()  # Увеличиваем счетчик неудач
-                        self.logger.info(f"Marked proxy {proxy_domain} as bad due to page load timeout")
-                    continue
-
-                # Проверяем на перенаправление на страницу логина
-                login_detected = False
-                if self._check_login_redirect(driver, url):
-                    self.logger.warning(f'{proxy} [{i + 1}]: Login redirect detected - removing proxy from queue')
-                    login_detected = True
-                    if proxy_domain:
-                        # Сразу удаляем прокси из очереди без возврата
-                        pwm.remove_proxy(proxy_domain)
-                        pwm.increment_regular_proxy_failures()  # Увеличиваем счетчик неудач
-                        self.logger.info(f"Removed proxy {proxy_domain} from queue due to login redirect")
-                    continue
-
+            except TimeoutException:
+                self.logger.warning(f"Timeout waiting for Facebook page to load with proxy: {proxy}")
+                return '', FailureKind.NETWORK
+
+            # Проверяем на перенаправление на страницу логина
+            if self._check_login_redirect(driver, url):
+                self.logger.warning(f'{proxy} [{attempt}]: Login redirect detected')
+                return '', FailureKind.LOGIN_WALL
+
+            if ready_xpaths:
+                # Ждем только те поля, которых не хватает, и выходим как только они появились
+                if not timed_wait_for_fields(driver, ready_xpaths, timeout=20):
+                    self.logger.info(f"Requested fields not rendered after 20 seconds for {url}")
+            else:
                 # Ждем загрузки AJAX контента
-                import time
                 time.sleep(3)  # Ждем 3 секунды для загрузки AJAX
 
                 # Дополнительное ожидание для загрузки AJAX контента
                 try:
-                    WebDriverWait(driver, 20).until(
-                        EC.presence_of_element_located((By.XPATH, "//div[contains(@class,'xieb3on')]")))
+                    with observe(READY_WAIT):
+                        WebDriverWait(driver, 20).until(
+                            EC.presence_of_element_located((By.XPATH, "//div[contains(@class,'xieb3on')]")))
                 except TimeoutException:
                     self.logger.info(f"xieb3on elements not found after 20 seconds for {url}")
+                    self._log_diagnostics(driver)
 
-                    # Диагностика: проверим, что есть на странице
-                    try:
-                        # Проверим, есть ли вообще div элементы
-                        all_divs = driver.find_elements(By.TAG_NAME, "div")
-                        self.logger.info(f"Total div elements on page: {len(all_divs)}")
-
-                        # Проверим, есть ли элементы с классом, содержащим 'x'
-                        x_elements = driver.find_elements(By.XPATH, "//div[contains(@class,'x')]")
-                        self.logger.info(f"Div elements with 'x' in class: {len(x_elements)}")
-
-                        # Проверим title страницы
-                        title = driver.title
-                        self.logger.info(f"Page title: {title}")
-
-                        # Проверим URL после загрузки
-                        current_url = driver.current_url
-                        self.logger.info(f"Current URL: {current_url}")
-
-                    except Exception as e:
-                        self.logger.error(f"Error during diagnostics: {e}")
-
-                content = driver.page_source
-                selector = Selector(text=content)
-                captcha = self._verify_cloudflare_captcha(selector)
-
-                if content and not captcha:
-                    self.logger.info(f'{proxy} [{i + 1}]: Url - {url} - True')
-                    result = content
-                    break  # Успешно получили контент
-                elif not content:
-                    self.logger.info(f'{proxy} [{i + 1}]: Url - {url} - no content')
-                elif captcha:
-                    self.logger.info(f"{proxy} [{i + 1}]: Url - {url} - captcha cloudflare")
-
-            except (TimeoutException, Exception) as e:
-                self.logger.warning(
-                    f'{proxy} [{i + 1}]: Url - {url} - failed to retrieve the page content... Error: {e}')
-                if proxy_domain:
-                    pwm.increment_regular_proxy_failures()  # Увеличиваем счетчик неудач
-
-            finally:
-                if driver:
-                    try:
-                        driver.quit()
-                    except Exception as e:
-                        self.logger.warning(f"Error closing driver: {e}")
-                if proxy_domain is not None and not login_detected:
-                    if captcha:
-                        pwm.set_proxy(proxy_domain, is_bad=True)
-                        pwm.increment_regular_proxy_failures()  # Увеличиваем счетчик неудач
-                        self.logger.info(f"Marked proxy {proxy_domain} as bad due to captcha")
-                    else:
-                        pwm.set_proxy(proxy_domain, is_bad=False)
-
-        if not result:
-            self.logger.error(f"Failed to fetch content for {url} after {max_attempts} attempts")
-            # Логируем финальное состояние прокси
-            final_proxy_stats = pwm.get_proxy_stats()
-            self.logger.info(f"Final proxy stats after failed attempts: {final_proxy_stats}")
+            content = driver.page_source
+            failure = classify_content(content)
+            self.logger.info(f'{proxy} [{attempt}]: Url - {url} - {failure.value if failure else True}')
+            return ('' if failure else content), failure
 
-        return result
+        except Exception as e:
+            self.logger.warning(
+                f'{proxy} [{attempt}]: Url - {url} - failed to retrieve the page content... Error: {e}')
+            return '', FailureKind.NETWORK
+
+        finally:
+            try:
+                driver.quit()
+            except Exception as e:
+                self.logger.warning(f"Error closing driver: {e}")
+
+    def _log_diagnostics(self, driver: WebDriver) -> None:
+        # Диагностика: проверим, что есть на странице
+        try:
+            # Проверим, есть ли вообще div элементы
+            all_divs = driver.find_elements(By.TAG_NAME, "div")
+            self.logger.info(f"Total div elements on page: {len(all_divs)}")
+
+            # Проверим, есть ли элементы с классом, содержащим 'x'
+            x_elements = driver.find_elements(By.XPATH, "//div[contains(@class,'x')]")
+            self.logger.info(f"Div elements with 'x' in class: {len(x_elements)}")
+
+            # Проверим title страницы
+            self.logger.info(f"Page title: {driver.title}")
+
+            # Проверим URL после загрузки
+            self.logger.info(f"Current URL: {driver.current_url}")
+
+        except Exception as e:
+            self.logger.error(f"Error during diagnostics: {e}")
 
 
 class Page(ABC):
+    required_fields: list[str] = []
+    cache_namespace: str = ''
+    cache = None  # FacebookPageCacheRepository, passed by the service
+    snapshots = None  # SnapshotRepository, passed by the service
+
+    @abstractmethod
+    def worker(self, item: FacebookRecord) -> Optional[FacebookRecord]:
+        pass
+
+    @abstractmethod
+    def parse_page(self, selector: Selector) -> FacebookRecord:
+        pass
+
     @abstractmethod
-    def worker(self, item: FacebookItem) -> Optional[FacebookItem]:
+    def merge_item(self, item: FacebookRecord, page: FacebookRecord) -> FacebookRecord:
         pass
 
+    def fetch_page(self, url: str, fields: list[str]) -> Optional[FacebookRecord]:
+        """
+        Return the parsed values of the facebook page tab which can supply the fields.
+        The shared page cache is consulted first, the page is fetched only on a miss.
+        If the page is being fetched by another container, its result is awaited for
+        up to PAGE_CACHE_INFLIGHT_WAIT: in the executor the item is deferred (Deferred)
+        and gives its thread back meanwhile, elsewhere the cache is polled.
+        :param url: Facebook page url.
+        :param fields: Names of the missing fields.
+        :return: Parsed page or None if the page is not available.
+        """
+        tab = self.select_tab(fields)
+        tab_url = self.build_tab_url(url, tab)
+
+        token = None
+        if self.cache:
+            found, page = self.cached_page(url, tab_url, fields)
+            if found:
+                return page
+            token = self.cache.claim(self.cache_namespace, tab_url)
+            if token is None:
+                # Another container is fetching the page: wait for its result, or take the page
+                # over if it finished without the fields we need
+                deferred_since = task_deferred_since.get(_NOT_DEFERRABLE)
+                if deferred_since is _NOT_DEFERRABLE:
+                    found, page, token = self.wait_for_page(url, tab_url, fields)
+                    if found:
+                        return page
+                elif deferred_since is None or time.monotonic() - deferred_since < PAGE_CACHE_INFLIGHT_WAIT:
+                    # The item gives its thread back and runs again later, the cache is checked again then
+                    raise Deferred(PAGE_CACHE_INFLIGHT_RETRY)
+
+        try:
+            return self.load_page(url, tab_url, tab, fields)
+        finally:
+            if token:
+                self.cache.release(self.cache_namespace, tab_url, token)
+
+    def wait_for_page(self, url: str, tab_url: str, fields: list[str]) -> tuple[bool, Optional[FacebookRecord], Optional[str]]:
+        """
+        Poll the cache for the page another container is fetching, for up to PAGE_CACHE_INFLIGHT_WAIT.
+        :return: True and the page on a hit, or False, None and the token if the fetch was taken over.
+        """
+        token = None
+        deadline = time.monotonic() + PAGE_CACHE_INFLIGHT_WAIT
+        while token is None and time.monotonic() < deadline:
+            time.sleep(1)
+            found, page = self.cached_page(url, tab_url, fields)
+            if found:
+                return True, page, None
+            token = self.cache.claim(self.cache_namespace, tab_url)
+        return False, None, token
+
+    def cached_page(self, url: str, tab_url: str, fields: list[str]) -> tuple[bool, Optional[FacebookRecord]]:
+        """
+        Look the page up in the shared page cache.
+        :return: True and the page (None for a dead page) on a hit, False and None on a miss.
+        """
+        dead, cached = self.cache.lookup(self.cache_namespace, tab_url, url)
+        if dead:
+            return True, None
+        if cached and all(cached['page'].get(field) or field in cached['fields'] for field in fields):
+            return True, FacebookRecord.from_dict(cached['page'])
+        return False, None
+
+    def load_page(self, url: str, tab_url: str, tab: str, fields: list[str]) -> Optional[FacebookRecord]:
+        content = self.fetch_content(tab_url, ready_xpaths=self.ready_xpaths(fields, tab))
+        if content is None:
+            # Removed, age-gated or login-only: later orders skip the page
+            if self.cache:
+                self.cache.set_dead(url)
+            return None
+        if not content:
+            return None
+
+        if self.snapshots:
+            self.snapshots.save(tab_url, content, self.cache_namespace, fields)
+
+        with span('facebook.parse', url=tab_url):
+            page = self.parse_page(Selector(text=content))
+        # A page without a title may be rendered only partly (slow render, changed markup):
+        # it isn't cached, the next order fetches it again. Dead pages are detected by
+        # classify_content (fetch_content returns None)
+        if self.cache and page.title:
+            self.cache.set(self.cache_namespace, tab_url, fields, page.to_dict(exclude_unset=True))
+        return page
+
+    @staticmethod
+    def parse_fields(selector: Selector, parsers: dict[str, Callable[[Selector], str]]) -> dict[str, str]:
+        """
+        Run the field parsers on the page, timing each of them.
+        :param parsers: Parser of the page by field name.
+        :return: Parsed values by field name.
+        """
+        values = {}
+        for field, parse in parsers.items():
+            with observe(PARSE_FIELD.labels(field)):
+                values[field] = parse(selector)
+        return values
+
+    def missing_fields(self, item: FacebookRecord) -> list[str]:
+        """
+        Return the required fields which are still empty in the item.
+        :param item: FacebookRecord to check.
+        :return: Names of the missing fields.
+        """
+        return [field for field in self.required_fields if not getattr(item, field)]
+
+    @staticmethod
+    def select_tab(fields: list[str]) -> str:
+        """
+        Choose the profile tab which can supply all the requested fields.
+        :param fields: Names of the missing fields.
+        :return: INTRO_TAB or ABOUT_TAB.
+        """
+        for tab in TAB_PRIORITY:
+            if all(tab in FIELD_MARKERS.get(field, {}) for field in fields):
+                return tab
+        return INTRO_TAB
+
+    @staticmethod
+    def ready_xpaths(fields: list[str], tab: str) -> list[str]:
+        """
+        Return the XPath markers to wait for on the tab before reading the page source.
+        """
+        return [FIELD_MARKERS[field][tab] for field in fields if tab in FIELD_MARKERS.get(field, {})]
+
+    @staticmethod
+    def build_tab_url(url: str, tab: str) -> str:
+        """
+        Build the url of the profile tab from the facebook page url.
+        :param url: Facebook page url.
+        :param tab: INTRO_TAB or ABOUT_TAB.
+        :return: Url of the tab.
+        """
+        if tab != ABOUT_TAB:
+            return url
+
+        parts = urlsplit(url.strip())
+        path = parts.path.rstrip('/')
+        if path.endswith('/profile.php'):
+            query = '&'.join(q for q in parts.query.split('&') if q and not q.startswith('sk='))
+            query = f'{query}&sk={ABOUT_TAB_PATH}' if query else f'sk={ABOUT_TAB_PATH}'
+            return urlunsplit((parts.scheme, parts.netloc, path, query, ''))
+
+        segments = path.split('/')
+        if segments[-1].startswith('about'):
+            segments = segments[:-1]
+        return urlunsplit((parts.scheme, parts.netloc, '/'.join(segments + [ABOUT_TAB_PATH]), '', ''))
+
 class FacebookPageFactory:
     _registry = {}
 
     @classmethod
-    def register_page(cls, page_type: str, page_class: Type[Page], **kwargs):
-        if not issubclass(page_class, Page):
+    def register_page(cls, page_type: str, page_class: Type[Page] | str, **kwargs):
+        """
+        Register the page class of the page type. The class can be given as
+        'module:Class', then its module is imported when the page type is first used.
+        """
+        if not isinstance(page_class, str) and not issubclass(page_class, Page):
             raise TypeError(f"{page_class} must be a subclass of Page")
         cls._registry[page_type] = page_class
 
     @classmethod
-    def create_page(cls, page_type: str, **kwargs) -> Page:
+    def page_class(cls, page_type: str) -> Type[Page]:
         page_class = cls._registry.get(page_type)
         if not page_class:
             raise ValueError(f"Unknown page type: {page_type}")
-        return page_class(**kwargs)
+        if isinstance(page_class, str):
+            module, _, name = page_class.partition(':')
+            page_class = getattr(importlib.import_module(module), name)
+            if not issubclass(page_class, Page):
+                raise TypeError(f"{page_class} must be a subclass of Page")
+            cls._registry[page_type] = page_class
+        return page_class
+
+    @classmethod
+    def create_page(cls, page_type: str, **kwargs) -> Page:
+        return cls.page_class(page_type)(**kwargs)
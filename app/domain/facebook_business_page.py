@@ -6,7 +6,8 @@ from parsel import Selector
 
 from app.domain.facebook import Page, FacebookBaseParser
 from app.domain.utils.logutils import init_logger
-from app.infrastructure.schemas import FacebookItem
+from app.domain.utils.tracing import traced
+from app.infrastructure.schemas import FacebookRecord, merge_records
 from app.infrastructure.settings import LOG_DIR
 
 logger = init_logger(filename="facebook_business.log", logdir=str(LOG_DIR))
@@ -444,24 +445,31 @@ class FacebookBusinessParser:
 
 
 class FacebookBusinessPage(Page, FacebookBusinessParser, FacebookBaseParser):
-    def __init__(self):
+    cache_namespace = 'business'
+
+    def __init__(self, cache=None, snapshots=None):
         super().__init__(search_type='business')
         self.required_fields = ['logo', 'address', 'phone', 'email', 'title']
+        self.cache = cache
+        self.snapshots = snapshots
 
-    def worker(self, item: FacebookItem) -> FacebookItem:
+    def worker(self, item: FacebookRecord) -> FacebookRecord:
         result = item
         try:
             urls = self.extract_facebook_urls(item)
             for web in urls:
-                content = self.fetch_content(web)
-                result = self.extract_item(content, item)
-                if self.is_complete(result):
+                missing = self.missing_fields(result)
+                if not missing:
                     break
+
+                page = self.fetch_page(web, missing)
+                if page:
+                    result = self.merge_item(result, page)
         except Exception as err:
             logger.error(err)
         return result
 
-    def extract_facebook_urls(self, item: FacebookItem) -> list[str]:
+    def extract_facebook_urls(self, item: FacebookRecord) -> list[str]:
         social_links = [social.strip() for social in item.social.split(' | ')]
 
         if not self.is_complete(item):
@@ -469,50 +477,50 @@ class FacebookBusinessPage(Page, FacebookBusinessParser, FacebookBaseParser):
                 return [link for link in social_links if "facebook.com" in link]
         return []
 
-    def is_complete(self, item: FacebookItem) -> bool:
+    def is_complete(self, item: FacebookRecord) -> bool:
         """
         Check if the item has all required fields filled.
-        :param item: FacebookItem to check.
+        :param item: FacebookRecord to check.
         :return: True if all required fields are filled, False otherwise.
         """
         return all(getattr(item, field) for field in self.required_fields)
 
-    def extract_item(self, content: str, item: FacebookItem) -> Optional[FacebookItem]:
+    @traced('facebook.extract_item')
+    def extract_item(self, content: str, item: FacebookRecord) -> Optional[FacebookRecord]:
         try:
             selector = Selector(text=content)
-            result = FacebookItem(
-                logo=self.parse_logo(selector),
-                address=self.parse_address(selector),
-                phone=self.parse_phone(selector),
-                email=self.parse_email(selector),
-                web=self.parse_web(selector),
-                service=self.parse_service(selector),
-                descr=self.parse_descr(selector),
-                rating=self.parse_rating(selector),
-                category=self.parse_category(selector),
-                likes=self.parse_likes_followers(selector),
-                title=self.parse_title(selector),
-                price_range=self.parse_price_range(selector),
-                price_delivery=self.parse_price_delivery(selector)
-            )
-
-            for field in item.model_fields:
-                item_value = getattr(item, field)
-                result_value = getattr(result, field)
-                if not item_value and result_value:
-                    setattr(result, field, item_value)
-
-            return result
+            return self.merge_item(item, self.parse_page(selector))
 
         except Exception as err:
             logger.error(err)
             return None
 
+    def parse_page(self, selector: Selector) -> FacebookRecord:
+        return FacebookRecord(**self.parse_fields(selector, {
+            'logo': self.parse_logo,
+            'address': self.parse_address,
+            'phone': self.parse_phone,
+            'email': self.parse_email,
+            'web': self.parse_web,
+            'service': self.parse_service,
+            'descr': self.parse_descr,
+            'rating': self.parse_rating,
+            'category': self.parse_category,
+            'likes': self.parse_likes_followers,
+            'title': self.parse_title,
+            'price_range': self.parse_price_range,
+            'price_delivery': self.parse_price_delivery,
+        }))
+
+    def merge_item(self, item: FacebookRecord, page: FacebookRecord) -> FacebookRecord:
+        # Keep the original values and fill only the empty ones
+        return merge_records(item, page)
+
 
 if __name__ == "__main__":
     # Example usage
     p = FacebookBusinessPage()
-    i = FacebookItem(
+    i = FacebookRecord(
         social="https://www.facebook.com/pages/Kims-BBQ-Restaurant/121801967878515",
         keyword="example"
     )
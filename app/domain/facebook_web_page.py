@@ -6,7 +6,8 @@ from parsel import Selector
 
 from app.domain.facebook import Page, FacebookBaseParser, FacebookWeb2Parser
 from app.domain.utils.logutils import init_logger
-from app.infrastructure.schemas import FacebookItem
+from app.domain.utils.tracing import traced
+from app.infrastructure.schemas import FacebookRecord, merge_records
 from app.infrastructure.settings import LOG_DIR
 
 logger = init_logger(filename="facebook_web.log", logdir=str(LOG_DIR))
@@ -498,39 +499,72 @@ class FacebookWebParser:
 
 
 class FacebookWebPage(Page, FacebookWebParser, FacebookWeb2Parser):
-    def __init__(self):
+    cache_namespace = 'web'
+
+    def __init__(self, cache=None, snapshots=None):
         super().__init__(search_type='business')
         self.required_fields = ['logo', 'address', 'phone', 'email', 'title']
+        self.cache = cache
+        self.snapshots = snapshots
 
-    def worker(self, item: FacebookItem) -> FacebookItem:
+    def worker(self, item: FacebookRecord) -> FacebookRecord:
         result = item
         try:
             urls = self.extract_facebook_urls(item)
             for web in urls:
-                content = self.fetch_content(web)
-                if content:
-                    result = self.extract_item(content, item)
-                if self.is_complete(result):  # Проверяем result, а не item
+                missing = self.missing_fields(result)
+                if not missing:  # Проверяем result, а не item
                     break
+
+                page = self.fetch_page(web, missing)
+                if page:
+                    result = self.merge_item(result, page)
         except Exception as err:
             logger.error(err)
         return result
 
-    def extract_facebook_urls(self, item: FacebookItem) -> list[str]:
+    def extract_facebook_urls(self, item: FacebookRecord) -> list[str]:
         social_links = [social.strip() for social in item.social.split(' | ')]
 
         if any("facebook.com" in link for link in social_links or []):
             return [link for link in social_links if "facebook.com" in link]
         return []
 
-    def is_complete(self, item: FacebookItem) -> bool:
+    def is_complete(self, item: FacebookRecord) -> bool:
         """
         Check if the item has all required fields filled.
-        :param item: FacebookItem to check.
+        :param item: FacebookRecord to check.
         :return: True if all required fields are filled, False otherwise.
         """
         return all(getattr(item, field) for field in self.required_fields)
 
+    def missing_fields(self, item: FacebookRecord) -> list[str]:
+        """
+        Return the required fields which are still empty in the item.
+        Description is requested too while it is empty or truncated.
+        :param item: FacebookRecord to check.
+        :return: Names of the missing fields.
+        """
+        missing = super().missing_fields(item)
+        if self._description_incomplete(item.description):
+            missing.append('description')
+        return missing
+
+    @staticmethod
+    def _description_incomplete(description: str) -> bool:
+        """
+        Определяет, можно ли улучшить описание данными из Facebook:
+        описание пустое или содержит '...' в начале или середине.
+        """
+        if not description or description.strip() == '':
+            return True
+
+        if '...' not in description:
+            return False
+
+        # Если '...' в конце - описание считается полным
+        return description.find('...') != len(description) - 3
+
     def _should_update_description(self, original_desc: str, new_desc: str) -> bool:
         """
         Определяет, нужно ли обновлять поле description.
@@ -551,92 +585,47 @@ class FacebookWebPage(Page, FacebookWebParser, FacebookWeb2Parser):
         # Если новое описание пустое - НЕ обновляем
         if not new_desc or new_desc.strip() == '':
             return False
-        
-        # Если исходное описание пустое - обновляем
-        if not original_desc or original_desc.strip() == '':
-            return True
-        
-        # Если исходное описание не содержит '...' - НЕ обновляем
-        if '...' not in original_desc:
-            return False
-        
-        # Проверяем, где находится '...'
-        dots_index = original_desc.find('...')
-        
-        # Если '...' в конце - НЕ обновляем
-        if dots_index == len(original_desc) - 3:
-            return False
-        
-        # Если '...' в начале или середине - обновляем
-        return True
 
-    def extract_item(self, content: str, item: FacebookItem) -> Optional[FacebookItem]:
+        return self._description_incomplete(original_desc)
+
+    @traced('facebook.extract_item')
+    def extract_item(self, content: str, item: FacebookRecord) -> Optional[FacebookRecord]:
         try:
             selector = Selector(text=content)
-
-            # Создаем новый объект с данными из парсинга
-            parsed_description = self.parse_descr(selector)
-            
-            parsed_data = {
-                'keyword': item.keyword,  # Сохраняем исходный keyword
-                'title': self.parse_title(selector),
-                'description': parsed_description,
-                'web': item.web,  # СОХРАНЯЕМ ИСХОДНЫЙ web, НЕ ИЗМЕНЯЕМ!
-                'phone': self.parse_phone(selector),
-                'email': self.parse_email(selector),
-                'logo': self.parse_logo(selector),
-                'address': self.parse_address(selector),
-                'service': '',
-                'rating': '',
-                'category': '',
-                'likes': '',
-                'price_range': '',
-                'price_delivery': '',
-                'social': item.social,  # Сохраняем исходный social
-                'builtwith': item.builtwith,  # Сохраняем исходный builtwith
-                'keyword_match_log': '',
-                'relevance_log': '',
-                'search_type': '',
-                'relevance': 0
-            }
-            
-            result = FacebookItem(**parsed_data)
-
-            # Логика обновления: обновляем только пустые поля
-            for field in item.model_fields:
-                item_value = getattr(item, field)
-                result_value = getattr(result, field)
-
-                # Специальная обработка для поля description
-                if field == 'description':
-                    if self._should_update_description(item_value, result_value):
-                        setattr(result, field, result_value)
-                        logger.info(f"Facebook found description: '{result_value}'")
-                    else:
-                        setattr(result, field, item_value)
-                # Для остальных полей - стандартная логика
-                else:
-                    # Если исходное поле пустое, а новое значение есть - используем новое
-                    if not item_value and result_value:
-                        setattr(result, field, result_value)
-                    # Если исходное поле не пустое - сохраняем исходное
-                    elif item_value:
-                        setattr(result, field, item_value)
-                    # ВАЖНО: Если исходное поле не пустое, а новое пустое - сохраняем исходное
-                    elif item_value and not result_value:
-                        setattr(result, field, item_value)
-
-            return result
+            return self.merge_item(item, self.parse_page(selector))
 
         except Exception as err:
             logger.error(err)
             return None
 
+    def parse_page(self, selector: Selector) -> FacebookRecord:
+        # Создаем новый объект с данными из парсинга
+        return FacebookRecord(**self.parse_fields(selector, {
+            'title': self.parse_title,
+            'description': self.parse_descr,
+            'phone': self.parse_phone,
+            'email': self.parse_email,
+            'logo': self.parse_logo,
+            'address': self.parse_address,
+        }))
+
+    def merge_item(self, item: FacebookRecord, page: FacebookRecord) -> FacebookRecord:
+        # Логика обновления: обновляем только пустые поля, исходные значения
+        # (keyword, web, social, builtwith и т.д.) сохраняются
+        # Специальная обработка для поля description
+        if self._should_update_description(item.description, page.description):
+            logger.info(f"Facebook found description: '{page.description}'")
+            description = page.description
+        else:
+            description = item.description
+
+        return merge_records(item, page, description=description)
+
 
 if __name__ == "__main__":
     # Example usage
     p = FacebookWebPage()
-    i = FacebookItem(
+    i = FacebookRecord(
         social="https://www.facebook.com/pages/Kims-BBQ-Restaurant/121801967878515",
         keyword="example"
     )
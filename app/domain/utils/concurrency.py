@@ -0,0 +1,140 @@
+import statistics
+import threading
+import time
+
+import psutil
+
+from app.domain.utils.logutils import init_logger
+from app.domain.utils.proxy_manager import loaded_managers
+from app.infrastructure.settings import (
+    LOG_DIR, FACEBOOK_THREADS, FACEBOOK_MIN_THREADS, FACEBOOK_MAX_THREADS, FACEBOOK_ADAPTIVE_THREADS,
+    FACEBOOK_THREADS_PER_PROXY
+)
+
+logger = init_logger(filename="facebook.log", logdir=str(LOG_DIR))
+
+
+class ConcurrencyController:
+    """
+    AIMD limit of the concurrent page fetches of the container. Every interval the
+    limit grows by one while the fetches succeed, and is cut by the backoff factor
+    when the success rate drops (captchas, login walls, dead proxies), the page
+    latency grows well over the recent best, or the host runs out of CPU or RAM.
+    The limit is also capped by the number of healthy proxies (per_proxy fetches each).
+    """
+    min_samples = 10
+    target_success = 0.8
+    latency_factor = 2.0
+    backoff = 0.7
+    max_cpu = 90.0
+    max_ram = 90.0
+    # The best latency drifts towards the current one, so a single fast interval
+    # doesn't make the latency check fire for good
+    best_decay = 0.1
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int, interval: float = 15.0,
+                 adaptive: bool = True, per_proxy: int = 0):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self._limit = min(max(initial, self.min_limit), self.max_limit)
+        self.interval = interval
+        self.adaptive = adaptive
+        self.per_proxy = per_proxy
+        self.lock = threading.Lock()
+        self.successes = 0
+        self.failures = 0
+        self.latencies: list[float] = []
+        self.best_latency = None
+        self.adjusted = time.monotonic()
+
+    @property
+    def limit(self) -> int:
+        if self.adaptive and time.monotonic() - self.adjusted >= self.interval:
+            self.adjust()
+        return self._limit
+
+    def record(self, success: bool, latency: float) -> None:
+        """
+        Record the outcome of a page fetch.
+        :param success: True if the page content was received.
+        :param latency: Duration of the successful attempt in seconds.
+        """
+        with self.lock:
+            if success:
+                self.successes += 1
+                self.latencies.append(latency)
+            else:
+                self.failures += 1
+
+    def adjust(self) -> None:
+        with self.lock:
+            now = time.monotonic()
+            if now - self.adjusted < self.interval:
+                return
+            self.adjusted = now
+            successes, failures, latencies = self.successes, self.failures, self.latencies
+            self.successes, self.failures, self.latencies = 0, 0, []
+
+            reason = self._overload_reason(successes, failures, latencies)
+            previous = self._limit
+            if reason:
+                self._limit = max(self.min_limit, int(self._limit * self.backoff))
+            elif successes + failures >= self.min_samples:
+                self._limit = min(self.max_limit, self._limit + 1)
+
+            cap = self.proxy_cap()
+            if cap is not None and self._limit > cap:
+                self._limit = cap
+                reason = reason or f"capped by the healthy proxies at {cap}"
+
+        if self._limit != previous:
+            logger.info(f"Concurrency limit {previous} -> {self._limit}" + (f" ({reason})" if reason else ""))
+
+    def _overload_reason(self, successes: int, failures: int, latencies: list[float]) -> str:
+        # Called with the lock held
+        cpu = psutil.cpu_percent(interval=None)
+        ram = psutil.virtual_memory().percent
+        if cpu > self.max_cpu:
+            return f"cpu {cpu:.0f}%"
+        if ram > self.max_ram:
+            return f"ram {ram:.0f}%"
+
+        total = successes + failures
+        if total >= self.min_samples and successes / total < self.target_success:
+            return f"success rate {successes / total:.0%}"
+
+        if len(latencies) >= self.min_samples:
+            latency = statistics.median(latencies)
+            best = self.best_latency
+            if best is None or latency < best:
+                self.best_latency = latency
+            else:
+                self.best_latency = best + self.best_decay * (latency - best)
+                if latency > best * self.latency_factor:
+                    return f"latency {latency:.1f}s, best {best:.1f}s"
+        return ""
+
+    def proxy_cap(self):
+        """
+        The most fetches the healthy proxies of the pool can take, None if not limited.
+        """
+        if not self.per_proxy:
+            return None
+        healthy = healthy_proxy_count()
+        if healthy is None:
+            return None
+        return max(self.min_limit, healthy * self.per_proxy)
+
+
+def healthy_proxy_count():
+    # The proxy pool is not bootstrapped just to be counted
+    managers = loaded_managers()
+    if not managers:
+        return None
+    return max(manager.get_healthy_proxy_count() for manager in managers)
+
+
+controller = ConcurrencyController(
+    FACEBOOK_THREADS, FACEBOOK_MIN_THREADS, FACEBOOK_MAX_THREADS, adaptive=FACEBOOK_ADAPTIVE_THREADS,
+    per_proxy=FACEBOOK_THREADS_PER_PROXY
+)
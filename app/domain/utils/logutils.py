@@ -1,8 +1,137 @@
+import atexit
+import contextvars
+import json
 import logging
+import logging.handlers
+import queue
+import sys
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 
+from app.infrastructure.settings import LOG_DIR, LOG_LEVEL, LOG_LEVELS, LOG_JSON, LOG_CONSOLE
+
+TEXT_FORMAT = '%(asctime)s %(filename)s [%(lineno)s] %(levelname)s: %(message)s'
+
+# Поля текущего заказа / загрузки страницы (oid, url, proxy, attempt), которые пишутся в каждую строку лога
+log_context: contextvars.ContextVar[dict] = contextvars.ContextVar('log_context', default={})
+
+_lock = threading.Lock()
+_queue: queue.SimpleQueue = queue.SimpleQueue()
+_listener: logging.handlers.QueueListener | None = None
+_router: '_FileRouter | None' = None
+
+
+@contextmanager
+def log_fields(**fields):
+    """
+    Add the fields to the log records written inside the block, in this thread
+    and in the tasks it submits to the executor.
+    """
+    token = log_context.set({**log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        log_context.reset(token)
+
+
+class _ContextFilter(logging.Filter):
+    # Runs in the thread which logs, where the context is
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.fields = log_context.get()
+        return True
+
+
+class _TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            line += ' [' + ' '.join(f'{key}={value}' for key, value in fields.items()) + ']'
+        return line
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'file': record.filename,
+            'line': record.lineno,
+            'thread': record.threadName,
+            'msg': record.getMessage(),
+            **getattr(record, 'fields', {}),
+        }
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _FileRouter(logging.Handler):
+    """
+    Writes the records to the log file of their logger. Runs in the listener thread only.
+    """
+
+    def __init__(self, formatter: logging.Formatter):
+        super().__init__()
+        self.formatter = formatter
+        self.files: dict[str, str] = {}
+        self.handlers: dict[str, logging.FileHandler] = {}
+
+    def route(self, name: str, path: str) -> None:
+        self.files[name] = path
+
+    def emit(self, record: logging.LogRecord) -> None:
+        path = self.files.get(record.name) or str(Path(LOG_DIR, 'facebook.log'))
+        handler = self.handlers.get(path)
+        if handler is None:
+            handler = self.handlers[path] = logging.FileHandler(path, mode='a', encoding='utf-8', delay=True)
+            handler.setFormatter(self.formatter)
+        handler.emit(record)
+
+    def close(self) -> None:
+        for handler in self.handlers.values():
+            handler.close()
+        super().close()
+
+
+def configure_logging() -> None:
+    """
+    Configure the logging of the process once: the threads only put the records into
+    a queue, a background listener formats them and writes the files and the console.
+    """
+    global _listener, _router
+    with _lock:
+        if _listener is not None:
+            return
+
+        formatter = _JsonFormatter() if LOG_JSON else _TextFormatter(TEXT_FORMAT)
+        _router = _FileRouter(formatter)
+        handlers = [_router]
+        if LOG_CONSOLE:
+            console = logging.StreamHandler()
+            console.setFormatter(formatter)
+            handlers.append(console)
+
+        queue_handler = logging.handlers.QueueHandler(_queue)
+        queue_handler.addFilter(_ContextFilter())
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(LOG_LEVEL)
+        for name, level in LOG_LEVELS.items():
+            logging.getLogger(name).setLevel(level)
+
+        _listener = logging.handlers.QueueListener(_queue, *handlers)
+        _listener.start()
+        atexit.register(_listener.stop)
+
 
 def init_logger(filename=None, logdir=None):
+    """
+    Logger of the calling module which writes to the log file.
+    Can be called any number of times, the logging is configured once.
+    """
     if not filename:
         filename = Path(__file__).stem
     else:
@@ -12,24 +141,8 @@ def init_logger(filename=None, logdir=None):
     else:
         logdir = Path(logdir).absolute()
 
-    lp = "{}.log".format(str(logdir.joinpath(logdir, filename)))
-    try:
-        logging.basicConfig(filename=lp,
-                            filemode='a',
-                            force=True,
-                            level=logging.INFO,
-                            format='%(asctime)s %(filename)s [%(lineno)s] %(levelname)s: %(message)s')
-
-        formatter = logging.Formatter('%(asctime)s %(filename)s [%(lineno)s] %(levelname)s: %(message)s')
-        console = logging.StreamHandler()
-        console.setLevel(logging.INFO)
-        console.setFormatter(formatter)
-        logging.getLogger('').addHandler(console)
-        logger = logging.getLogger(lp)
-
-        if not logger:
-            raise Exception("Logging initialization error.")
-        result = logger
-    except Exception as err:
-        raise SystemExit(err)
-    return result
+    configure_logging()
+    module = sys._getframe(1).f_globals.get('__name__', 'app')
+    name = f"{module}.{filename}"
+    _router.route(name, str(logdir.joinpath(f"{filename}.log")))
+    return logging.getLogger(name)
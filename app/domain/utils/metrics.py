@@ -0,0 +1,117 @@
+import atexit
+import functools
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+from app.infrastructure.settings import LOG_DIR, METRICS_PORT
+
+if METRICS_PORT and 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+    # The metrics of the worker processes (--processes) are written to the files in this dir
+    # and summed up by the main process on scrape. It has to be set before prometheus_client
+    # is imported, the workers inherit it. A fresh dir per run, so the old counters don't come back
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='fb-metrics-')
+    atexit.register(shutil.rmtree, os.environ['PROMETHEUS_MULTIPROC_DIR'], ignore_errors=True)
+
+from prometheus_client import CollectorRegistry, Counter, Histogram, multiprocess, start_http_server
+from prometheus_client.core import GaugeMetricFamily
+
+from app.domain.utils.logutils import init_logger
+
+logger = init_logger(filename="facebook.log", logdir=str(LOG_DIR))
+
+# Buckets of the browser and page timings, seconds
+PAGE_BUCKETS = (0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 45, 60, 90)
+# Buckets of the parsing and the store round trips, seconds
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+BROWSER_LAUNCH = Histogram(
+    'fb_browser_launch_seconds', 'Time to start a browser', buckets=PAGE_BUCKETS)
+PAGE_LOAD = Histogram(
+    'fb_page_load_seconds', 'Time to load the facebook page through the proxy',
+    ['tier'], buckets=PAGE_BUCKETS)
+READY_WAIT = Histogram(
+    'fb_ready_wait_seconds', 'Time waiting for the requested fields to render', buckets=PAGE_BUCKETS)
+PARSE_FIELD = Histogram(
+    'fb_parse_field_seconds', 'Time to parse a field of the page', ['field'], buckets=FAST_BUCKETS)
+FETCH_ATTEMPTS = Counter(
+    'fb_fetch_attempts_total', 'Page load attempts by proxy tier and result (ok or the failure)',
+    ['tier', 'result'])
+STORE_LATENCY = Histogram(
+    'fb_store_seconds', 'Round trip of the repository operations', ['store', 'operation'], buckets=FAST_BUCKETS)
+ITEMS_PROCESSED = Counter(
+    'fb_items_processed_total', 'Items processed', ['search_type'])
+ITEMS_UPDATED = Counter(
+    'fb_items_updated_total', 'Items updated', ['search_type'])
+
+
+class ExecutorCollector:
+    """
+    Gauges of the executor of the main process, read on scrape.
+    Not in the metric files: the live values of a single process aren't summed up.
+    """
+
+    def collect(self):
+        from app.domain.utils.concurrency import controller
+        from app.domain.utils.scheduler import executor
+
+        yield GaugeMetricFamily('fb_executor_queue_depth', 'Page tasks waiting for a thread', value=executor.pending())
+        yield GaugeMetricFamily('fb_executor_running', 'Page tasks running', value=executor.running)
+        yield GaugeMetricFamily('fb_concurrency_limit', 'Current limit of the concurrent page fetches',
+                                value=controller.limit)
+
+
+@contextmanager
+def observe(histogram):
+    """
+    Observe the duration of the block in the histogram (with its labels applied).
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - started)
+
+
+def timed_store(store: str, operation: str = None):
+    """
+    Decorator of the repository methods: observe their round trip.
+    """
+    def decorator(func):
+        histogram = STORE_LATENCY.labels(store, operation or func.__name__)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with observe(histogram):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def metrics_registry() -> CollectorRegistry:
+    """
+    Registry of the served metrics: the metrics of this process and of its
+    worker processes, alive or gone, and the executor gauges.
+    """
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(ExecutorCollector())
+    return registry
+
+
+def start_metrics_server(port: int) -> None:
+    """
+    Serve the metrics over http on the port (/metrics) from a background thread.
+    """
+    start_http_server(port, registry=metrics_registry())
+    logger.info(f"Metrics are served on :{port}/metrics")
+
+
+def mark_process_dead(pid: int) -> None:
+    """
+    Drop the live gauges of the worker process which exited; its counters and histograms are kept.
+    """
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,155 @@
+"""
+Sampling profiler which can be switched on in a running container.
+The stacks of all the threads are sampled for some seconds and written as folded
+stacks (flamegraph.pl / speedscope / inferno), one file per view:
+    fetch - the page fetch threads (fb-worker-*, fb-process-*),
+    loop  - the thread of the asyncio loop of the broker,
+    other - everything else.
+Triggered by SIGUSR2 (profiles PROFILER_SECONDS) or by GET /profile?seconds=N&view=fetch
+on PROFILER_PORT, which also returns the profile.
+"""
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+
+from app.domain.utils.logutils import init_logger
+from app.infrastructure.settings import LOG_DIR, PROFILER_PORT, PROFILER_SECONDS, PROFILER_INTERVAL, PROFILE_DIR
+
+logger = init_logger(filename="facebook.log", logdir=str(LOG_DIR))
+
+VIEWS = ('fetch', 'loop', 'other')
+FETCH_THREADS = ('fb-worker-', 'fb-process-')
+# Профиль длиннее не снимается, чтобы забытый запрос не держал поток
+MAX_SECONDS = 600
+
+_loop_ident: int | None = None
+_running = threading.Lock()
+
+
+def _view(ident: int, names: dict[int, str]) -> str:
+    if ident == _loop_ident:
+        return 'loop'
+    if names.get(ident, '').startswith(FETCH_THREADS):
+        return 'fetch'
+    return 'other'
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+
+def sample(seconds: float, interval: float = PROFILER_INTERVAL) -> dict[str, Counter]:
+    """
+    Sample the stacks of all the threads of the process.
+    :return: Number of samples of every stack (root first), by view.
+    """
+    stacks = {view: Counter() for view in VIEWS}
+    own = threading.get_ident()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            stacks[_view(ident, names)][tuple(stack)] += 1
+        time.sleep(interval)
+    return stacks
+
+
+def fold(stacks: Counter) -> str:
+    return ''.join(f"{';'.join(stack)} {count}\n" for stack, count in stacks.most_common())
+
+
+def profile(seconds: float = PROFILER_SECONDS) -> dict[str, Counter] | None:
+    """
+    Profile the process and write the views to PROFILE_DIR.
+    :return: The stacks by view, or None if a profile is already being taken.
+    """
+    if not _running.acquire(blocking=False):
+        logger.warning("Profiler is already running")
+        return None
+    try:
+        seconds = min(seconds, MAX_SECONDS)
+        logger.info(f"Profiling {os.getpid()} for {seconds}s")
+        stacks = sample(seconds)
+    finally:
+        _running.release()
+
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    prefix = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+    for view, counter in stacks.items():
+        Path(PROFILE_DIR, f"{prefix}-{view}.folded").write_text(fold(counter), encoding='utf-8')
+    logger.info(f"Profile written to {PROFILE_DIR}/{prefix}-*.folded "
+                f"({', '.join(f'{view}: {sum(c.values())} samples' for view, c in stacks.items())})")
+    return stacks
+
+
+class _ProfileHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != '/profile':
+            self.send_error(404)
+            return
+        query = parse_qs(url.query)
+        try:
+            seconds = float(query.get('seconds', [PROFILER_SECONDS])[0])
+        except ValueError:
+            self.send_error(400, 'seconds must be a number')
+            return
+        view = query.get('view', [None])[0]
+        if view is not None and view not in VIEWS:
+            self.send_error(400, f"view must be one of {', '.join(VIEWS)}")
+            return
+
+        stacks = profile(seconds)
+        if stacks is None:
+            self.send_error(409, 'Profiler is already running')
+            return
+        if view:
+            body = fold(stacks[view])
+        else:
+            # All the views in one flamegraph, under the root frame of their view
+            body = ''.join(fold(Counter({(name, *stack): n for stack, n in stacks[name].items()})) for name in VIEWS)
+        data = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def install_profiler(port: int = PROFILER_PORT, loop_thread: bool = False) -> None:
+    """
+    Profile the process on SIGUSR2 and, if port is set, on GET /profile.
+    Must be called from the main thread.
+    :param loop_thread: The calling thread runs the asyncio loop (the 'loop' view).
+    """
+    global _loop_ident
+    if loop_thread:
+        _loop_ident = threading.get_ident()
+
+    if hasattr(signal, 'SIGUSR2'):
+        def on_signal(signum, frame):
+            # The handler runs in the main thread, the profile is taken in the background
+            threading.Thread(target=profile, name='fb-profiler', daemon=True).start()
+        signal.signal(signal.SIGUSR2, on_signal)
+
+    if port:
+        server = ThreadingHTTPServer(('0.0.0.0', port), _ProfileHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name='fb-profiler-http', daemon=True).start()
+        logger.info(f"Profiler is served on :{port}/profile")
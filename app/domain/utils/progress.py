@@ -0,0 +1,64 @@
+import threading
+import time
+from typing import Callable, Optional
+
+ProgressCallback = Callable[[dict], None]
+
+
+class OrderProgress:
+    """
+    Counts the items of an order which are already saved and reports the progress
+    to the callback, at most once per interval.
+    """
+
+    def __init__(self, oid: str, callback: Optional[ProgressCallback] = None, interval: float = 0):
+        self.oid = oid
+        self.callback = callback
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.reported = 0.0
+        self.total = 0
+        self.done = 0
+        self.updated = 0
+
+    def add_total(self, count: int) -> None:
+        """
+        Add items to process (the web and google orders get their items in batches).
+        """
+        with self.lock:
+            self.total += count
+
+    def saved(self, done: int, updated: int) -> None:
+        """
+        Record a saved chunk and report the progress if the interval has passed.
+        :param done: Items processed in the chunk.
+        :param updated: Items updated in the chunk.
+        """
+        with self.lock:
+            self.done += done
+            self.updated += updated
+            now = time.monotonic()
+            if self.callback is None or now - self.reported < self.interval:
+                return
+            self.reported = now
+            event = self.event(now)
+
+        try:
+            self.callback(event)
+        except Exception:
+            # Прогресс не должен ломать обработку заказа
+            pass
+
+    def event(self, now: float = None) -> dict:
+        elapsed = (now or time.monotonic()) - self.started
+        remaining = max(self.total - self.done, 0)
+        throughput = self.done / elapsed if elapsed > 0 else 0.0
+        return {
+            'oid': self.oid,
+            'items_done': self.done,
+            'items_remaining': remaining,
+            'updated_amount': self.updated,
+            'throughput': round(throughput, 3),
+            'eta': round(remaining / throughput, 1) if throughput else None,
+        }
@@ -11,7 +11,6 @@ from bounded_pool_executor import BoundedThreadPoolExecutor
 
 from app.domain.utils.logutils import init_logger
 from app.infrastructure.settings import WDM_PROXY, LOG_DIR
-from app.presentation.grpc_api import GRPC
 
 logging.getLogger("httpx").setLevel(logging.WARNING)
 logging.getLogger("httpcore").setLevel(logging.WARNING)
@@ -38,6 +37,8 @@ class ProxyManager:
         self.lock = threading.Lock()
         self.total_proxy = self.good_proxies.qsize()
         self.proxies = proxies
+        self.imported = 0
+        self.results = defaultdict(int)  # Результаты загрузок страниц через прокси пула: ok или тип ошибки
 
     def import_proxies(self):
         """
@@ -57,6 +58,7 @@ class ProxyManager:
                     pass  # Прокси не работает, игнорируем
                 except Exception as e:
                     logger.error(f"Ошибка при проверке прокси {proxy}: {e}")
+        self.imported = self.good_proxies.qsize()
 
 
     @staticmethod
@@ -140,6 +142,53 @@ class ProxyManager:
         """
         return len(self.banned_proxies)
 
+    def get_healthy_proxy_count(self):
+        """
+        Return the number of proxies which passed the check and are not banned,
+        including the ones in use.
+
+        Returns:
+            int: The number of healthy proxies.
+        """
+        return max(self.imported - len(self.banned_proxies), 0)
+
+    def record_result(self, failure=None):
+        """
+        Учитывает результат загрузки страницы через прокси пула.
+
+        Args:
+            failure: FailureKind загрузки или None, если страница загружена.
+        """
+        with self.lock:
+            self.results[failure.value if failure else 'ok'] += 1
+
+    def result_rates(self):
+        """
+        Доля успешных загрузок, капч и логинов среди загрузок через прокси пула.
+        """
+        with self.lock:
+            results = dict(self.results)
+        attempts = sum(results.values())
+        rate = lambda key: round(results.get(key, 0) / attempts, 4) if attempts else 0.0
+        return {
+            'attempts': attempts,
+            'success_rate': rate('ok'),
+            'captcha_rate': rate('captcha'),
+            'login_rate': rate('login_wall'),
+        }
+
+    def get_proxy_stats(self):
+        """
+        Возвращает статистику по прокси
+        """
+        return {
+            'total': self.total_proxy,
+            'active': self.good_proxies.qsize(),
+            'banned': len(self.banned_proxies),
+            'failed': len(self.failed_proxies),
+            **self.result_rates(),
+        }
+
 
 class ProxyWebManager:
     """
@@ -162,6 +211,8 @@ class ProxyWebManager:
         self.lock = threading.Lock()
         self.total_proxy = len(proxies)
         self.proxies = proxies
+        self.imported = 0
+        self.results = defaultdict(int)  # Результаты загрузок страниц через прокси пула: ok или тип ошибки
         self.regular_proxy_failures = 0  # Глобальный счетчик неудачных попыток с обычными прокси
         logger.info(f"Initialized ProxyManager with {self.total_proxy} proxies")
 
@@ -185,6 +236,7 @@ class ProxyWebManager:
                 except Exception as e:
                     logger.error(f"Ошибка при проверке прокси {proxy}: {e}")
 
+        self.imported = self.good_proxies.qsize()
         logger.info(f"Proxy import completed. Good proxies: {self.good_proxies.qsize()}")
 
 
@@ -279,6 +331,41 @@ class ProxyWebManager:
         """
         return len(self.banned_proxies)
 
+    def get_healthy_proxy_count(self):
+        """
+        Return the number of proxies which passed the check and are not banned,
+        including the ones in use.
+
+        Returns:
+            int: The number of healthy proxies.
+        """
+        return max(self.imported - len(self.banned_proxies), 0)
+
+    def record_result(self, failure=None):
+        """
+        Учитывает результат загрузки страницы через прокси пула.
+
+        Args:
+            failure: FailureKind загрузки или None, если страница загружена.
+        """
+        with self.lock:
+            self.results[failure.value if failure else 'ok'] += 1
+
+    def result_rates(self):
+        """
+        Доля успешных загрузок, капч и логинов среди загрузок через прокси пула.
+        """
+        with self.lock:
+            results = dict(self.results)
+        attempts = sum(results.values())
+        rate = lambda key: round(results.get(key, 0) / attempts, 4) if attempts else 0.0
+        return {
+            'attempts': attempts,
+            'success_rate': rate('ok'),
+            'captcha_rate': rate('captcha'),
+            'login_rate': rate('login_wall'),
+        }
+
     def get_proxy_stats(self):
         """
         Возвращает статистику по прокси
@@ -289,7 +376,8 @@ class ProxyWebManager:
             'banned': len(self.banned_proxies),
             'failed': len(self.failed_proxies),
             'regular_failures': self.regular_proxy_failures,
-            'max_regular_failures': self.max_regular_proxy_failures
+            'max_regular_failures': self.max_regular_proxy_failures,
+            **self.result_rates(),
         }
 
     def should_use_only_residential(self):
@@ -325,9 +413,40 @@ class ProxyWebManager:
 
 
 
-PROXIES = GRPC.get_proxies()
-pmd = ProxyManager(PROXIES)
-pmd.import_proxies()
+_managers: dict = {}
+_managers_lock = threading.Lock()
+
+
+def _get_managers() -> dict:
+    """
+    Import and check the proxies on the first call. Modules which only parse
+    pages (re-parsing of snapshots, benchmarks) never bootstrap the proxy pool.
+    """
+    with _managers_lock:
+        if not _managers:
+            from app.presentation.grpc_api import GRPC
+
+            proxies = GRPC.get_proxies()
+            pmd = ProxyManager(proxies)
+            pmd.import_proxies()
+
+            pwm = ProxyWebManager(proxies)
+            pwm.import_proxies()
+
+            _managers.update(pmd=pmd, pwm=pwm)
+    return _managers
+
+
+def loaded_managers() -> list:
+    """
+    Return the proxy managers if the proxies have already been imported, without importing them.
+    """
+    return list(_managers.values())
+
+
+def get_pmd() -> ProxyManager:
+    return _get_managers()['pmd']
+
 
-pwm = ProxyWebManager(PROXIES)
-pwm.import_proxies()
\ No newline at end of file
+def get_pwm() -> ProxyWebManager:
+    return _get_managers()['pwm']
@@ -0,0 +1,136 @@
+import threading
+import time
+from typing import Optional
+
+import redis
+
+from app.domain.utils.logutils import init_logger
+from app.infrastructure.redis_pool import get_redis
+from app.infrastructure.settings import (
+    LOG_DIR, RATE_LIMIT_ENABLED, RATE_LIMIT_SHARED, RATE_LIMIT_DB,
+    RATE_LIMIT_DOMAIN_RATE, RATE_LIMIT_DOMAIN_BURST, RATE_LIMIT_PROXY_RATE, RATE_LIMIT_PROXY_BURST
+)
+
+logger = init_logger(filename="facebook.log", logdir=str(LOG_DIR))
+
+
+class TokenBucket:
+    """
+    Token bucket of one process. A request reserves a token even when the bucket is
+    empty and waits until the token is refilled, so the waiting requests are paced
+    at the rate in the order they came.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Take a token.
+        :return: Seconds to wait before the request.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+
+class RedisTokenBucket:
+    """
+    Token bucket shared by all the containers. The refill and the reservation are
+    done in one script with the Redis clock, so the containers' clocks don't matter.
+    """
+    RESERVE_SCRIPT = """
+    local rate = tonumber(ARGV[1])
+    local burst = tonumber(ARGV[2])
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(state[1]) or burst
+    local updated = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - updated) * rate) - 1
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+    redis.call('EXPIRE', KEYS[1], math.ceil((burst - tokens) / rate) + 60)
+    if tokens >= 0 then
+        return '0'
+    end
+    return tostring(-tokens / rate)
+    """
+
+    def __init__(self, client: redis.Redis, key: str, rate: float, burst: float):
+        self.key = key
+        self.rate = rate
+        self.burst = burst
+        self.script = client.register_script(self.RESERVE_SCRIPT)
+        self.fallback = TokenBucket(rate, burst)
+
+    def reserve(self) -> float:
+        try:
+            return float(self.script(keys=[self.key], args=[self.rate, self.burst]))
+        except (redis.RedisError, ValueError) as e:
+            logger.error(f"Error reserving a token of {self.key}, using the local bucket: {e}")
+            return self.fallback.reserve()
+
+
+class RateLimiter:
+    """
+    Paces the page loads: a global bucket for facebook.com and a bucket per proxy
+    of the pool. The residential proxy rotates its exit ips, so it is only paced
+    by the global bucket.
+    """
+    prefix = 'fb_rate'
+
+    def __init__(self, domain_rate: float, domain_burst: float, proxy_rate: float, proxy_burst: float,
+                 client: Optional[redis.Redis] = None):
+        self.proxy_rate = proxy_rate
+        self.proxy_burst = proxy_burst
+        self.client = client
+        self.lock = threading.Lock()
+        self.domain = self._bucket('facebook.com', domain_rate, domain_burst)
+        self.proxies: dict[str, TokenBucket | RedisTokenBucket] = {}
+
+    def _bucket(self, name: str, rate: float, burst: float) -> TokenBucket | RedisTokenBucket | None:
+        if rate <= 0:
+            return None
+        if self.client is not None:
+            return RedisTokenBucket(self.client, f"{self.prefix}:{name}", rate, burst)
+        return TokenBucket(rate, burst)
+
+    def acquire(self, proxy: Optional[str] = None) -> float:
+        """
+        Wait until the page of facebook.com can be loaded through the proxy.
+        :param proxy: Proxy of the pool (host:port) or None for the residential proxy.
+        :return: Seconds waited.
+        """
+        wait = 0.0
+        if proxy and self.proxy_rate > 0:
+            with self.lock:
+                bucket = self.proxies.get(proxy)
+                if bucket is None:
+                    bucket = self.proxies[proxy] = self._bucket(f"proxy:{proxy}", self.proxy_rate, self.proxy_burst)
+            wait = bucket.reserve()
+        if self.domain is not None:
+            wait = max(wait, self.domain.reserve())
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+def create_rate_limiter() -> Optional[RateLimiter]:
+    if not RATE_LIMIT_ENABLED:
+        return None
+    client = None
+    if RATE_LIMIT_SHARED:
+        client = get_redis(RATE_LIMIT_DB)
+    return RateLimiter(
+        RATE_LIMIT_DOMAIN_RATE, RATE_LIMIT_DOMAIN_BURST, RATE_LIMIT_PROXY_RATE, RATE_LIMIT_PROXY_BURST, client
+    )
+
+
+rate_limiter = create_rate_limiter()
@@ -0,0 +1,110 @@
+import random
+import re
+from enum import Enum
+from typing import Optional
+
+from parsel import Selector
+
+
+class FailureKind(str, Enum):
+    """
+    Why a page load attempt failed.
+    """
+    NETWORK = 'network'            # the page did not load: timeout, proxy or connection error
+    CAPTCHA = 'captcha'            # cloudflare "Just a moment..."
+    LOGIN_WALL = 'login_wall'      # redirected to the facebook login
+    EMPTY_CONTENT = 'empty_content'
+    DRIVER_INIT = 'driver_init'    # the browser did not start
+    DEAD_PAGE = 'dead_page'        # the page is removed or not available
+
+
+# Titles of the pages facebook shows instead of a removed page
+DEAD_PAGE_TITLES = ('page not found', 'content not found')
+
+# Text of the pages which are removed or age-gated.
+# These don't depend on the proxy, the page is the same from any ip.
+DEAD_PAGE_MARKERS = re.compile(
+    r"this (?:content|page) isn.t available"
+    r"|the link you followed may be broken"
+    r"|page may have been removed"
+    r"|you must be (?:at least )?\d+ years? old"
+    r"|age.restricted",
+    re.IGNORECASE,
+)
+
+# Text of the login prompts. Facebook shows them to logged out visitors of live pages
+# too, so they only tell that this load hit the login wall, not that the page is dead
+LOGIN_WALL_MARKERS = re.compile(
+    r"you must log in to (?:continue|see this)"
+    r"|log in to see (?:this|more from)",
+    re.IGNORECASE,
+)
+
+
+def classify_content(content: str) -> Optional[FailureKind]:
+    """
+    Check the loaded page html.
+    :return: The failure or None if the page can be parsed.
+    """
+    if not content:
+        return FailureKind.EMPTY_CONTENT
+    selector = Selector(text=content)
+    title = selector.xpath("//head/title/text()").get(default="").strip().lower()
+    if "just a moment" in title:
+        return FailureKind.CAPTCHA
+    if any(marker in title for marker in DEAD_PAGE_TITLES) or DEAD_PAGE_MARKERS.search(title):
+        return FailureKind.DEAD_PAGE
+    # A live page has its name in h1, the visible text is only searched when it's missing:
+    # the scripts of any page carry the translations of these messages
+    if not selector.xpath("//h1"):
+        text = " ".join(selector.xpath("//body//text()[not(ancestor::script) and not(ancestor::style)]").getall())
+        if DEAD_PAGE_MARKERS.search(text):
+            return FailureKind.DEAD_PAGE
+        if LOGIN_WALL_MARKERS.search(text):
+            return FailureKind.LOGIN_WALL
+    return None
+
+
+def is_login_redirect(current_url: str) -> bool:
+    return "login" in (current_url or "").lower()
+
+
+class RetryPolicy:
+    """
+    How the page load is retried: the number of attempts, the attempts made through
+    the proxy pool before the residential proxy, the backoff of each failure kind and
+    the failures after which retrying is pointless.
+    """
+    # Backoff of the failure kind: first delay and maximum delay, seconds
+    backoff = {
+        FailureKind.NETWORK: (1.0, 10.0),
+        FailureKind.CAPTCHA: (2.0, 30.0),
+        FailureKind.LOGIN_WALL: (2.0, 30.0),
+        FailureKind.EMPTY_CONTENT: (1.0, 10.0),
+        FailureKind.DRIVER_INIT: (3.0, 30.0),
+    }
+    # After these failures the next attempt goes through the residential proxy
+    escalate = frozenset({FailureKind.CAPTCHA, FailureKind.LOGIN_WALL})
+    # These failures don't depend on the proxy, the page is given up at once
+    fatal = frozenset({FailureKind.DEAD_PAGE})
+
+    def __init__(self, max_attempts: int, pool_attempts: int):
+        self.max_attempts = max_attempts
+        self.pool_attempts = pool_attempts
+
+    def use_residential(self, attempt: int, failures: list[FailureKind]) -> bool:
+        return attempt >= self.pool_attempts or any(failure in self.escalate for failure in failures)
+
+    def should_retry(self, attempt: int, failure: FailureKind) -> bool:
+        return failure not in self.fatal and attempt + 1 < self.max_attempts
+
+    def delay(self, failures: list[FailureKind]) -> float:
+        """
+        Seconds to wait before the next attempt: exponential in the number of failures
+        of the last kind, with jitter so the threads don't retry together.
+        """
+        if not failures:
+            return 0.0
+        first, maximum = self.backoff.get(failures[-1], (1.0, 10.0))
+        repeated = failures.count(failures[-1])
+        return min(maximum, first * 2 ** (repeated - 1)) * random.uniform(0.5, 1.0)
@@ -0,0 +1,148 @@
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+from app.domain.utils.concurrency import ConcurrencyController, controller
+from app.infrastructure.settings import FACEBOOK_MAX_THREADS, FACEBOOK_ORDER_THREADS
+
+
+class Deferred(BaseException):
+    """
+    Raised by a task to give its thread back and run again after delay seconds,
+    e.g. while the page it needs is being fetched by another container.
+    A BaseException, so the catch-all handlers of the pages and the services let it through.
+    """
+
+    def __init__(self, delay: float):
+        super().__init__(delay)
+        self.delay = delay
+
+
+# When the running task was deferred for the first time (time.monotonic()), None if it
+# wasn't. Not set outside the executor: the task can't be deferred there
+task_deferred_since: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar('task_deferred_since')
+
+
+class FairExecutor:
+    """
+    Thread pool shared by all the orders processed in the container.
+    Tasks are queued per order and dispatched round-robin between the orders,
+    so a big order can't starve a small one, and no order gets more than
+    its budget of threads. The number of running tasks is kept under the
+    current limit of the concurrency controller.
+    A task which raises Deferred is queued again after its delay.
+    """
+
+    def __init__(self, max_workers: int, order_budget: int = None, limiter: ConcurrencyController = None):
+        self.max_workers = max_workers
+        self.order_budget = order_budget or max_workers
+        self.limiter = limiter
+        self.running = 0
+        self.cond = threading.Condition()
+        self.queues: OrderedDict[str, deque] = OrderedDict()
+        self.in_flight: defaultdict[str, int] = defaultdict(int)
+        # Deferred tasks: (due time, counter, order id, task)
+        self.delayed: list[tuple[float, int, str, tuple]] = []
+        self.counter = itertools.count()
+        self.threads: list[threading.Thread] = []
+
+    def submit(self, key: str, fn: Callable, *args, **kwargs) -> Future:
+        """
+        Queue a task of the order.
+        :param key: Order id the task belongs to.
+        :param fn: Callable to run.
+        :return: Future with the result of the callable.
+        """
+        future = Future()
+        with self.cond:
+            # The task runs with the context of the caller: the log fields of the order
+            context = contextvars.copy_context()
+            context.run(task_deferred_since.set, None)
+            self.queues.setdefault(key, deque()).append((future, context, fn, args, kwargs))
+            if len(self.threads) < self.max_workers:
+                thread = threading.Thread(target=self._work, name=f'fb-worker-{len(self.threads)}', daemon=True)
+                self.threads.append(thread)
+                thread.start()
+            self.cond.notify()
+        return future
+
+    def pending(self, key: str = None) -> int:
+        """
+        Return the number of queued tasks of the order, or of all the orders.
+        """
+        with self.cond:
+            if key is not None:
+                return len(self.queues.get(key, ())) + sum(1 for task in self.delayed if task[2] == key)
+            return sum(len(q) for q in self.queues.values()) + len(self.delayed)
+
+    def _undefer(self) -> None:
+        # Called with the lock held: the deferred tasks which are due go back to their order's queue
+        now = time.monotonic()
+        while self.delayed and self.delayed[0][0] <= now:
+            _, _, key, task = heapq.heappop(self.delayed)
+            self.queues.setdefault(key, deque()).append(task)
+
+    def _wait_timeout(self) -> Optional[float]:
+        timeout = 1 if self.limiter is not None else None
+        if self.delayed:
+            due = max(0.0, self.delayed[0][0] - time.monotonic())
+            timeout = due if timeout is None else min(timeout, due)
+        return timeout
+
+    def _next(self) -> tuple[str, tuple] | None:
+        # Called with the lock held. The order served last goes to the end of the round.
+        self._undefer()
+        if self.limiter is not None and self.running >= self.limiter.limit:
+            return None
+        for key, queue in self.queues.items():
+            if self.in_flight[key] >= self.order_budget:
+                continue
+            task = queue.popleft()
+            if queue:
+                self.queues.move_to_end(key)
+            else:
+                del self.queues[key]
+            self.in_flight[key] += 1
+            self.running += 1
+            return key, task
+        return None
+
+    def _work(self) -> None:
+        while True:
+            with self.cond:
+                picked = self._next()
+                while picked is None:
+                    # The limit can grow while nothing finishes, deferred tasks become due
+                    self.cond.wait(timeout=self._wait_timeout())
+                    picked = self._next()
+
+            key, task = picked
+            future, context, fn, args, kwargs = task
+            deferred = None
+            # A deferred task is already running
+            if future.running() or future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(context.run(fn, *args, **kwargs))
+                except Deferred as err:
+                    deferred = err
+                    if context[task_deferred_since] is None:
+                        context.run(task_deferred_since.set, time.monotonic())
+                except BaseException as err:
+                    future.set_exception(err)
+
+            with self.cond:
+                if deferred is not None:
+                    heapq.heappush(self.delayed, (time.monotonic() + deferred.delay, next(self.counter), key, task))
+                self.running -= 1
+                self.in_flight[key] -= 1
+                if not self.in_flight[key]:
+                    del self.in_flight[key]
+                self.cond.notify_all()
+
+
+executor = FairExecutor(FACEBOOK_MAX_THREADS, FACEBOOK_ORDER_THREADS, controller)
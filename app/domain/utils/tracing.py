@@ -0,0 +1,141 @@
+"""
+Tracing of the orders: spans of the broker message, the service, every page load
+attempt, parsing and the store writes. The spans carry the log fields of the
+current order (oid, url, proxy, attempt).
+OpenTelemetry is used when TRACING_ENABLED and the sdk is installed, otherwise a
+span costs one check of a global.
+"""
+import atexit
+import functools
+import threading
+from contextlib import contextmanager
+
+from app.domain.utils.logutils import init_logger, log_context
+from app.infrastructure.settings import (
+    LOG_DIR, TRACING_ENABLED, TRACING_FILE, TRACING_ENDPOINT, TRACING_SAMPLE_RATE
+)
+
+logger = init_logger(filename="facebook.log", logdir=str(LOG_DIR))
+
+_tracer = None
+_lock = threading.Lock()
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set_attribute(self, key, value):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+def setup_tracing(service_name: str = 'fb_service') -> None:
+    """
+    Set up the tracer of the process once. Does nothing when the tracing is disabled.
+    """
+    global _tracer
+    if not TRACING_ENABLED:
+        return
+    with _lock:
+        if _tracer is not None:
+            return
+        try:
+            from opentelemetry import trace
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor
+            from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+        except ImportError:
+            logger.warning("TRACING_ENABLED is set, but opentelemetry-sdk is not installed: tracing is off")
+            return
+
+        provider = TracerProvider(
+            resource=Resource.create({'service.name': service_name}),
+            sampler=ParentBased(TraceIdRatioBased(TRACING_SAMPLE_RATE)),
+        )
+        provider.add_span_processor(BatchSpanProcessor(_exporter()))
+        trace.set_tracer_provider(provider)
+        atexit.register(provider.shutdown)
+        _tracer = trace.get_tracer('fb_service')
+        logger.info(f"Tracing to {TRACING_ENDPOINT or TRACING_FILE}")
+
+
+def _exporter():
+    if TRACING_ENDPOINT:
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+            return OTLPSpanExporter(endpoint=TRACING_ENDPOINT)
+        except ImportError:
+            logger.warning("opentelemetry-exporter-otlp-proto-http is not installed, tracing to the file")
+
+    from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+    # One span per line; the worker processes append to the same file
+    out = open(TRACING_FILE, 'a', encoding='utf-8', buffering=1)
+    atexit.register(out.close)
+    return ConsoleSpanExporter(out=out, formatter=lambda span: span.to_json(indent=None) + '\n')
+
+
+def span(name: str, **attributes):
+    """
+    Context manager of a span, child of the current one. The log fields of the
+    order are added to its attributes.
+    """
+    if _tracer is None:
+        return _NO_SPAN
+    attributes = {
+        key: value if isinstance(value, (bool, int, float)) else str(value)
+        for key, value in {**log_context.get(), **attributes}.items() if value is not None
+    }
+    return _tracer.start_as_current_span(name, attributes=attributes)
+
+
+def traced(name: str = None):
+    """
+    Decorator: run the function in a span (named after the function by default).
+    """
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def trace_carrier() -> dict:
+    """
+    The current span as a dict which can be sent to a worker process.
+    """
+    if _tracer is None:
+        return {}
+    from opentelemetry.propagate import inject
+    carrier = {}
+    inject(carrier)
+    return carrier
+
+
+@contextmanager
+def attached(carrier: dict):
+    """
+    Make the span sent by trace_carrier the parent of the spans inside the block.
+    """
+    if _tracer is None or not carrier:
+        yield
+        return
+    from opentelemetry import context
+    from opentelemetry.propagate import extract
+    token = context.attach(extract(carrier))
+    try:
+        yield
+    finally:
+        context.detach(token)
@@ -1,32 +1,116 @@
 import threading
+from hashlib import blake2b
+from typing import Iterator, Optional
 
-from app.infrastructure.schemas import FacebookItem
+import redis
+
+from app.domain.utils.logutils import init_logger
+from app.infrastructure import codec
+from app.infrastructure.redis_pool import get_redis
+from app.infrastructure.schemas import FacebookRecord
+from app.infrastructure.settings import (
+    LOG_DIR, CHECKPOINT_DB, CHECKPOINT_TTL, TRACKER_SPILL_THRESHOLD, TRACKER_INSERT_BATCH
+)
+
+logger = init_logger(filename="facebook.log", logdir=str(LOG_DIR))
 
 
 class ItemTracker:
     """
-    A class to track processed items in a microservice.
+    Tracks the items of one order: the 'web' keys already taken for processing and
+    the processed items waiting for batch_insert.
+    The keys are kept as 64-bit hashes. When an order has more than spill_threshold
+    of them, they are moved to a Redis set, so a huge order doesn't grow the process.
+    The processed items are moved to a Redis list every insert_batch items, and
+    batch_insert reads them back in batches of that size.
     """
+    prefix = 'fb_tracker'
 
-    __processed_items: set[str] = set()
-    __to_insert: list[FacebookItem] = []
-
-    def __init__(self):
+    def __init__(self, oid: str, spill_threshold: int = TRACKER_SPILL_THRESHOLD,
+                 insert_batch: int = TRACKER_INSERT_BATCH, client: Optional[redis.Redis] = None):
+        self.oid = oid
+        self.spill_threshold = spill_threshold
+        self.insert_batch = insert_batch
+        self.client = client
         self.lock = threading.Lock()
+        self.__processed_items: set[int] = set()
+        self.__to_insert: list[FacebookRecord] = []
+        self.__spilled = False
+        self.__items_spilled = False
+
+    @property
+    def key(self) -> str:
+        return f"{self.prefix}:{self.oid}"
+
+    @property
+    def items_key(self) -> str:
+        return f"{self.prefix}:{self.oid}:items"
+
+    @staticmethod
+    def hash_key(web: str) -> int:
+        return int.from_bytes(blake2b(web.encode(), digest_size=8).digest(), 'big')
+
+    def reset(self) -> None:
+        """
+        Remove what a previous run of the order left in Redis. The items it took but
+        didn't save must be processed again; the saved ones come back from the checkpoint.
+        """
+        self.clear()
+        try:
+            self.__redis().delete(self.key, self.items_key)
+        except redis.RedisError as e:
+            logger.error(f"Error resetting tracker of {self.oid} in Redis: {e}")
 
     def processed(self, web: str) -> bool:
         """
-        Add an item to the processed items set.
+        Check whether the item was already taken and mark it as taken.
 
-        :param web: The item to add.
+        :param web: The 'web' key of the item.
+        :return: True if the item was taken before.
         """
-        if web in self.__processed_items:
-            return True
+        hashed = self.hash_key(web)
         with self.lock:
-            self.__processed_items.add(web)
-        return False
+            if not self.__spilled:
+                if hashed in self.__processed_items:
+                    return True
+                self.__processed_items.add(hashed)
+                if self.spill_threshold and len(self.__processed_items) > self.spill_threshold:
+                    self.__spill()
+                return False
 
-    def add(self, item: FacebookItem) -> None:
+        try:
+            # SADD is atomic, the threads and the containers see the same set
+            pipe = self.__redis().pipeline(transaction=False)
+            pipe.sadd(self.key, hashed)
+            pipe.expire(self.key, CHECKPOINT_TTL)
+            added, _ = pipe.execute()
+            return not added
+        except redis.RedisError as e:
+            logger.error(f"Error checking tracker of {self.oid} in Redis: {e}")
+            return False
+
+    def __redis(self) -> redis.Redis:
+        if self.client is None:
+            self.client = get_redis(CHECKPOINT_DB)
+        return self.client
+
+    def __spill(self) -> None:
+        # Called with the lock held
+        try:
+            hashes = list(self.__processed_items)
+            pipe = self.__redis().pipeline(transaction=False)
+            for i in range(0, len(hashes), 10000):
+                pipe.sadd(self.key, *hashes[i:i + 10000])
+            pipe.expire(self.key, CHECKPOINT_TTL)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.error(f"Error moving tracker of {self.oid} to Redis, keeping it in memory: {e}")
+            return
+        self.__spilled = True
+        self.__processed_items.clear()
+        logger.info(f"Tracker of {self.oid} moved to Redis at {len(hashes)} items")
+
+    def add(self, item: FacebookRecord) -> None:
         """
         Add an item to the to_insert list.
 
@@ -34,17 +118,46 @@ class ItemTracker:
         """
         with self.lock:
             self.__to_insert.append(item)
+            if self.insert_batch and len(self.__to_insert) >= self.insert_batch:
+                self.__spill_items()
 
-    def get(self):
-        """
-        Get the list of items to insert.
+    def __spill_items(self) -> None:
+        # Called with the lock held. The records keep their key set through Redis:
+        # from_dict of the exclude_unset dump has the same source keys
+        try:
+            pipe = self.__redis().pipeline(transaction=False)
+            pipe.rpush(self.items_key, *(codec.encode_record(item, exclude_unset=True) for item in self.__to_insert))
+            pipe.expire(self.items_key, CHECKPOINT_TTL)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.error(f"Error moving items of {self.oid} to Redis, keeping them in memory: {e}")
+            return
+        self.__items_spilled = True
+        self.__to_insert.clear()
 
-        :return: The list of items to insert.
+    def batches(self) -> Iterator[list[FacebookRecord]]:
+        """
+        Take the items to insert, in the order they were added, in batches of at most
+        insert_batch items (all the items at once when insert_batch is 0).
         """
         with self.lock:
             items = self.__to_insert.copy()
             self.__to_insert.clear()
-        return items
+            spilled, self.__items_spilled = self.__items_spilled, False
+
+        if spilled:
+            try:
+                client = self.__redis()
+                for start in range(0, client.llen(self.items_key), self.insert_batch):
+                    raw = client.lrange(self.items_key, start, start + self.insert_batch - 1)
+                    yield [codec.decode_record(data) for data in raw]
+                client.delete(self.items_key)
+            except (redis.RedisError, codec.DecodeError) as e:
+                logger.error(f"Error reading items of {self.oid} from Redis: {e}")
+
+        size = self.insert_batch or len(items) or 1
+        for start in range(0, len(items), size):
+            yield items[start:start + size]
 
     def clear(self):
         """
@@ -53,6 +166,11 @@ class ItemTracker:
         with self.lock:
             self.__processed_items.clear()
             self.__to_insert.clear()
-
-
-tracker = ItemTracker()
\ No newline at end of file
+            spilled, self.__spilled = self.__spilled, False
+            items_spilled, self.__items_spilled = self.__items_spilled, False
+        keys = [key for key, used in ((self.key, spilled), (self.items_key, items_spilled)) if used]
+        if keys:
+            try:
+                self.__redis().delete(*keys)
+            except redis.RedisError as e:
+                logger.error(f"Error clearing tracker of {self.oid} in Redis: {e}")
@@ -1,14 +1,32 @@
 import sys
-import psutil
+import threading
 
-from seleniumbase import Driver
+import psutil
 
 from app.domain.utils.logutils import init_logger
 from app.infrastructure.settings import LOG_DIR
 
-sys.argv.append("-n")
 logger = init_logger(filename="facebook.log", logdir=str(LOG_DIR))
 
+_driver_class = None
+_driver_lock = threading.Lock()
+
+
+def _driver():
+    """
+    seleniumbase.Driver, imported on the first browser launch: the import is heavy
+    and the processes which only parse pages never need it.
+    """
+    global _driver_class
+    with _driver_lock:
+        if _driver_class is None:
+            # "-n": the drivers are started from several threads
+            if "-n" not in sys.argv:
+                sys.argv.append("-n")
+            from seleniumbase import Driver
+            _driver_class = Driver
+    return _driver_class
+
 class WebDriverFactory:
     @staticmethod
     def get_common_options(proxy: str = None, cache_path: str = None):
@@ -63,7 +81,7 @@ class SeleniumBaseWebDriver(WebDriverFactory):
     def driver_factory(proxy: str = None):
         try:
             options_list = WebDriverFactory.get_common_options(proxy)
-            driver = Driver(headless=False, uc=True, proxy=proxy)
+            driver = _driver()(headless=False, uc=True, proxy=proxy)
 
             for arg in options_list:
                 driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": f"window.chrome = {arg}"})
@@ -0,0 +1,49 @@
+"""
+JSON codec of the items and the cached values kept in Redis.
+orjson is used when it is installed, the stdlib json otherwise. Both read and
+write plain JSON, so the values written by either one (or by the other services)
+stay readable.
+"""
+import json
+from typing import Any
+
+from app.infrastructure.schemas import FacebookRecord
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson.JSONDecodeError is a subclass of it
+DecodeError = json.JSONDecodeError
+
+if orjson is not None:
+    def loads(data: bytes | str) -> Any:
+        return orjson.loads(data)
+
+    def dumps(value: Any) -> bytes:
+        return orjson.dumps(value)
+else:
+    def loads(data: bytes | str) -> Any:
+        return json.loads(data)
+
+    def dumps(value: Any) -> bytes:
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def decode_item(data: bytes | str) -> dict:
+    """
+    Decode a stored item. Items written before 'link' was renamed to 'web' are normalized.
+    """
+    item = loads(data)
+    if 'link' in item and 'web' not in item:
+        item['web'] = item.pop('link')
+    return item
+
+
+def decode_record(data: bytes | str) -> FacebookRecord:
+    return FacebookRecord.from_dict(loads(data))
+
+
+def encode_record(record: FacebookRecord, exclude_unset: bool = False) -> bytes:
+    return dumps(record.to_dict(exclude_unset=exclude_unset))
@@ -8,38 +8,11 @@ from urllib.parse import urlparse
 from django.urls import reverse
 import hashlib
 
-init_django()
-
-def normalize_url(url):
-    result = ""
-    try:
-        if url and url.strip():
-            url = url.replace("https://", "http://")
-            tld_parts = urlparse(url.strip().rstrip('/'))
-            fqdn = tld_parts.netloc
-            schema = tld_parts.scheme
-            path = tld_parts.path
-            fragment = tld_parts.fragment
-            query = tld_parts.query
-            if fqdn.startswith('www'):
-                fqdn = fqdn.replace('www.', '')
-
-            res = ""
-            if schema:
-                res += f"{schema}://"
-            if fqdn:
-                res += f'{fqdn}'
-            if path:
-                res += f'{path}'
-            if query:
-                res += f'?{query}'
-            if fragment:
-                res += f'#{fragment}'
-            result = res.rstrip('/')
-    except Exception as err:
-        pass
-    return result
+from app.infrastructure.urls import normalize_url, canonicalize_facebook_url, hash_link
 
+# main.py sets Django up once at startup, then this is a no-op. Scripts which
+# import the models directly (loadtest) rely on it
+init_django()
 
 class ParsersSetting(models.Model):
     name = models.CharField(max_length=100, unique=True, primary_key=True)
@@ -252,13 +225,7 @@ class CrawlerLink(models.Model):
 
     @staticmethod
     def hash_link(url: str):
-        result = ""
-        try:
-            # Using SHA-1 to generate a hash of the long_link
-            result = hashlib.sha1(url.encode()).hexdigest()
-        except Exception as err:
-            pass
-        return result
+        return hash_link(url)
 
     @staticmethod
     def extract_domain(url):
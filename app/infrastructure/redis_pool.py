@@ -0,0 +1,24 @@
+import threading
+
+import redis
+
+from app.infrastructure.settings import REDIS_HOST, REDIS_PORT, REDIS_PASS, REDIS_MAX_CONNECTIONS, REDIS_POOL_TIMEOUT
+
+_pools: dict[int, redis.BlockingConnectionPool] = {}
+_lock = threading.Lock()
+
+
+def get_redis(db: int = 0) -> redis.Redis:
+    """
+    Client of the Redis db. The clients of one db share the connection pool of the
+    process, so the services, repositories and threads don't open connections of their
+    own. When all the connections of the pool are busy the caller waits for a free one.
+    """
+    with _lock:
+        pool = _pools.get(db)
+        if pool is None:
+            pool = _pools[db] = redis.BlockingConnectionPool(
+                host=REDIS_HOST, port=REDIS_PORT, password=REDIS_PASS, db=db,
+                max_connections=REDIS_MAX_CONNECTIONS, timeout=REDIS_POOL_TIMEOUT,
+            )
+    return redis.Redis(connection_pool=pool)
@@ -1,54 +1,82 @@
+import functools
+import itertools
+import os
+import threading
+import uuid
 import redis
-import json
-
-from django.db import connections
+import brotli
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Iterator
 
 from app.domain.utils.logutils import init_logger
-from app.domain.utils.tracker import tracker
-from app.infrastructure.models import PaymentOrder, OrderItem
-from app.infrastructure.schemas import FacebookItem
-from app.infrastructure.settings import LOG_DIR, REDIS_HOST, REDIS_PORT, REDIS_PASS
+from app.domain.utils.metrics import timed_store
+from app.domain.utils.tracing import traced
+from app.domain.utils.tracker import ItemTracker
+from app.infrastructure import codec
+from app.infrastructure.redis_pool import get_redis
+from app.infrastructure.schemas import FacebookRecord
+from app.infrastructure.urls import canonicalize_facebook_url, hash_link
+from app.infrastructure.settings import (
+    LOG_DIR, PAGE_CACHE_DB, PAGE_CACHE_TTL, PAGE_CACHE_DEAD_TTL, PAGE_CACHE_INFLIGHT_TTL, SNAPSHOT_DIR, CHECKPOINT_DB, CHECKPOINT_TTL
+)
 
 
 logger = init_logger(filename="facebook.log", logdir=str(LOG_DIR))
 
 
-class RedisRepository:
-    def __init__(self):
-        self.r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, password=REDIS_PASS)
-        self.r4 = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, password=REDIS_PASS, db=4)
-        self.r15 = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, password=REDIS_PASS, db=15)
+def db_connection(func):
+    """
+    Decorator of the ORM calls. They run in the threads of the orders
+    (sync_to_async(thread_sensitive=False)) and Django keeps a connection per thread:
+    a stale connection is dropped before the call and the connection of the thread
+    is closed after it, so it doesn't outlive the call on a pool thread.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        from django.db import close_old_connections, connections
 
-    def get_items(self, key: str) -> list[FacebookItem]:
-        result = []
+        close_old_connections()
         try:
-            if not self.r4.exists(key):
-                return []
+            return func(*args, **kwargs)
+        finally:
+            connections['default'].close()
+    return wrapper
 
+
+class RedisRepository:
+    def __init__(self, tracker: ItemTracker):
+        self.tracker = tracker
+        self.r = get_redis(0)
+        self.r4 = get_redis(4)
+        self.r15 = get_redis(15)
+
+    @timed_store('redis', 'get_items')
+    def get_items(self, key: str) -> list[FacebookRecord]:
+        result = []
+        try:
+            # A missing key reads as an empty list
             items = self.r4.lrange(key, 0, -1)
-            decode_items = [json.loads(i.decode()) for i in items]
+            decode_items = [codec.decode_item(i) for i in items]
             result = [
-                FacebookItem(
-                    **item
-                )
+                FacebookRecord.from_dict(item)
                 for item in decode_items
-                if not tracker.processed(item.get('web',''))
+                if not self.tracker.processed(item.get('web',''))
             ]
         except Exception as e:
             logger.error(f"Error retrieving data from Redis: {e}")
         return result
 
-    def save_items(self, key: str, items: list[FacebookItem]):
+    @traced('redis.save_items')
+    @timed_store('redis', 'save_items')
+    def save_items(self, key: str, items: list[FacebookRecord]):
         try:
             existing_raw = self.r.lrange(key, 0, -1)
             existing = []
 
             # Normalize existing entries: replace 'link' with 'web' if needed
             for item in existing_raw:
-                loaded = json.loads(item)
-                if 'link' in loaded and 'web' not in loaded:
-                    loaded['web'] = loaded.pop('link')
-                existing.append(loaded)
+                existing.append(codec.decode_item(item))
 
             # Build mapping from 'web'
             existing_map = {e['web']: e for e in existing}
@@ -56,33 +84,36 @@ class RedisRepository:
             # Prepare updated items
             added = []
             for item in items:
-                tracker.add(item)
-                dumped = item.model_dump()
+                self.tracker.add(item)
+                dumped = item.to_dict()
                 if dumped['web'] in existing_map:
                     existing_map[dumped['web']] = dumped
                     added.append(dumped)
 
-            self.r.delete(key)
-            self.r.rpush(key, *(json.dumps(e) for e in existing_map.values()))
+            if existing_map:
+                # The list is replaced in one transaction, readers never see it empty
+                pipe = self.r.pipeline(transaction=True)
+                pipe.delete(key)
+                pipe.rpush(key, *(codec.dumps(e) for e in existing_map.values()))
+                pipe.execute()
 
             return len(added)
 
-        except (redis.RedisError, json.JSONDecodeError, KeyError) as e:
+        except (redis.RedisError, codec.DecodeError, KeyError) as e:
             logger.error(f"Error saving items to Redis: {e}")
             return 0
 
     def clean_redis_key(self, key: str) -> None:
         try:
-            if self.r4.exists(key):
-                self.r4.delete(key)
-            else:
+            if not self.r4.delete(key):
                 logger.warning(f"Redis key '{key}' does not exist.")
 
-            if self.r15.exists(key):
-                self.r15.delete(key)
+            self.r15.delete(key)
         except redis.RedisError as e:
             logger.error(f"Error cleaning Redis key '{key}': {e}")
 
+    @traced('redis.batch_insert')
+    @timed_store('redis', 'batch_insert')
     def batch_insert(self, key: str) -> int:
         """
         Add all the items in the tracker to the Redis database.
@@ -90,72 +121,72 @@ class RedisRepository:
         in save_items due to non-matching 'web' keys. So we
         ensure that all items in the tracker are saved to Redis.
         """
-        items = tracker.get()
-        serialized_items = [
-            json.dumps(item.model_dump(exclude_unset=True))
-            for item in items
-        ]
-
-        if serialized_items:
-            self.r.delete(key)
-            self.r.rpush(key, *serialized_items)
-            self.r.expire(key, 60 * 60 * 24 * 7)
-
-        return len(serialized_items)
+        # The items are written in batches to a new list, which then replaces the key:
+        # readers never see it half written, the process holds one batch at a time
+        building = f"{key}:batch_insert"
+        count = 0
+        self.r.delete(building)
+        for items in self.tracker.batches():
+            pipe = self.r.pipeline(transaction=False)
+            # The producer's keys plus the filled fields, as model_dump(exclude_unset=True) wrote them
+            pipe.rpush(building, *(codec.encode_record(item, exclude_unset=True) for item in items))
+            pipe.expire(building, 60 * 60 * 24 * 7)
+            pipe.execute()
+            count += len(items)
+
+        if count:
+            pipe = self.r.pipeline(transaction=True)
+            pipe.rename(building, key)
+            pipe.expire(key, 60 * 60 * 24 * 7)
+            pipe.execute()
+
+        return count
 
     def check_psd_processed(self, key: str) -> bool:
         try:
-            if not self.r15.exists(key):
-                return False
-
-            if self.r15.get(key) == b'3':
-                return True
-
-            return False
+            return self.r15.get(key) == b'3'
         except Exception as e:
             logger.error(f"Error checking Google processed: {e}")
             return False
 
 
 class RedisWebRepository:
-    def __init__(self):
-        self.r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, password=REDIS_PASS, db=0)
+    def __init__(self, tracker: ItemTracker):
+        self.tracker = tracker
+        self.r = get_redis(0)
 
-    def get_items(self, key: str) -> list[FacebookItem]:
+    @timed_store('redis', 'web_get_items')
+    def get_items(self, key: str) -> list[FacebookRecord]:
         result = []
         try:
-            if not self.r.exists(key):
-                return []
-
+            # A missing key reads as an empty list
             items = self.r.lrange(key, 0, -1)
-            decode_items = [json.loads(i.decode()) for i in items]
+            decode_items = [codec.decode_item(i) for i in items]
 
             for item in decode_items:
-                if not tracker.processed(item.get('web', '')):
-                    result.append(FacebookItem(**item))
+                if not self.tracker.processed(item.get('web', '')):
+                    result.append(FacebookRecord.from_dict(item))
 
         except Exception as e:
             logger.error(f"Error retrieving data from Redis: {e}")
         return result
 
-    def save_items(self, key: str, items: list[FacebookItem]):
+    @traced('redis.web_save_items')
+    @timed_store('redis', 'web_save_items')
+    def save_items(self, key: str, items: list[FacebookRecord]):
         try:
             existing_raw = self.r.lrange(key, 0, -1)
             existing_items = []
 
             for item in existing_raw:
-                loaded = json.loads(item)
-                if 'link' in loaded and 'web' not in loaded:
-                    loaded['web'] = loaded.pop('link')
-
-                existing_items.append(loaded)
+                existing_items.append(codec.decode_item(item))
 
             existing_map = {e['web']: e for e in existing_items}
 
             updated_count = 0
             for item in items:
-                tracker.add(item)
-                dumped = item.model_dump()
+                self.tracker.add(item)
+                dumped = item.to_dict()
 
                 if dumped['web'] in existing_map:
                     # Обновляем только непустые поля, сохраняя существующие данные
@@ -180,31 +211,34 @@ class RedisWebRepository:
                     final_items.append(original_item)
 
             if final_items:
-                self.r.delete(key)
-                self.r.rpush(key, *(json.dumps(e) for e in final_items))
-                self.r.expire(key, 60 * 60 * 24 * 7)  # 7 дней
+                pipe = self.r.pipeline(transaction=True)
+                pipe.delete(key)
+                pipe.rpush(key, *(codec.dumps(e) for e in final_items))
+                pipe.expire(key, 60 * 60 * 24 * 7)  # 7 дней
+                pipe.execute()
                 logger.info(f"Saved {len(final_items)} items to Redis key: {key}")
 
             return updated_count
 
-        except (redis.RedisError, json.JSONDecodeError, KeyError) as e:
+        except (redis.RedisError, codec.DecodeError, KeyError) as e:
             logger.error(f"Error saving items to Redis: {e}")
             return 0
 
     def clean_redis_key(self, key: str) -> None:
         try:
-            if self.r.exists(key):
-                self.r.delete(key)
+            if self.r.delete(key):
                 logger.info(f"Cleaned Redis key: {key}")
             else:
                 logger.warning(f"Redis key '{key}' does not exist.")
         except redis.RedisError as e:
             logger.error(f"Error cleaning Redis key '{key}': {e}")
 
+    @traced('redis.web_batch_insert')
+    @timed_store('redis', 'web_batch_insert')
     def batch_insert(self, key: str) -> int:
-        items = tracker.get()
-
-        if not items:
+        batches = self.tracker.batches()
+        first = next(batches, None)
+        if not first:
             logger.info("No items in tracker to batch insert")
             return 0
 
@@ -213,18 +247,13 @@ class RedisWebRepository:
             existing_items = []
 
             for item in existing_raw:
-                loaded = json.loads(item)
-                if 'link' in loaded and 'web' not in loaded:
-                    loaded['web'] = loaded.pop('link')
-
-
-                existing_items.append(loaded)
+                existing_items.append(codec.decode_item(item))
 
             existing_map = {e.get('web', ''): e for e in existing_items}
 
             updated_count = 0
-            for item in items:
-                dumped = item.model_dump(exclude_unset=True)
+            for item in itertools.chain.from_iterable(itertools.chain([first], batches)):
+                dumped = item.to_dict()
 
                 if dumped.get('web') in existing_map:
                     # Обновляем только непустые поля, сохраняя существующие данные
@@ -249,9 +278,11 @@ class RedisWebRepository:
                     final_items.append(original_item)
 
             if final_items:
-                self.r.delete(key)
-                self.r.rpush(key, *(json.dumps(e) for e in final_items))
-                self.r.expire(key, 60 * 60 * 24 * 7)
+                pipe = self.r.pipeline(transaction=True)
+                pipe.delete(key)
+                pipe.rpush(key, *(codec.dumps(e) for e in final_items))
+                pipe.expire(key, 60 * 60 * 24 * 7)
+                pipe.execute()
                 logger.info(f"Batch inserted {updated_count} items, total {len(final_items)} items in Redis key: {key}")
 
             return updated_count
@@ -261,10 +292,334 @@ class RedisWebRepository:
             return 0
 
 
+class FacebookPageCacheRepository:
+    """
+    Parsed facebook pages shared between orders and containers.
+    Keys are built from the canonical page url, so the www./m./pages/... variants
+    of one page hit the same entry. Dead pages are cached separately (negative cache).
+    Pages being fetched are registered with a TTL, so a page is fetched by one container at a time.
+    Urls without a canonical form (a bare profile.php, story.php...) are not cached.
+    """
+    prefix = 'fb_page'
+    RELEASE_SCRIPT = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('DEL', KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(self):
+        self.r = get_redis(PAGE_CACHE_DB)
+        self.release_script = self.r.register_script(self.RELEASE_SCRIPT)
+
+    def _key(self, kind: str, url: str) -> Optional[str]:
+        canonical = canonicalize_facebook_url(url)
+        return f"{self.prefix}:{kind}:{hash_link(canonical)}" if canonical else None
+
+    def get(self, namespace: str, url: str) -> Optional[dict]:
+        """
+        Return the cached page entry: {'fields': [...], 'page': {...}} or None on miss.
+        """
+        key = self._key(namespace, url)
+        if key is None:
+            return None
+        try:
+            cached = self.r.get(key)
+            if cached:
+                return codec.loads(cached)
+        except (redis.RedisError, codec.DecodeError) as e:
+            logger.error(f"Error reading page cache for {url}: {e}")
+        return None
+
+    @traced('redis.cache_set')
+    @timed_store('redis', 'cache_set')
+    def set(self, namespace: str, url: str, fields: list[str], page: dict) -> None:
+        """
+        Cache the parsed page.
+        :param fields: Fields which were awaited on the page before it was parsed.
+        :param page: Parsed page values.
+        """
+        key = self._key(namespace, url)
+        if key is None:
+            return
+        try:
+            value = codec.dumps({'fields': sorted(fields), 'page': page})
+            self.r.set(key, value, ex=PAGE_CACHE_TTL)
+        except redis.RedisError as e:
+            logger.error(f"Error writing page cache for {url}: {e}")
+
+    @timed_store('redis', 'cache_lookup')
+    def lookup(self, namespace: str, tab_url: str, url: str) -> tuple[bool, Optional[dict]]:
+        """
+        Read the dead page mark of the page and the cached entry of its tab in one round trip.
+        :return: True if the page is dead, and the cached entry or None.
+        """
+        dead_key, key = self._key('dead', url), self._key(namespace, tab_url)
+        if dead_key is None or key is None:
+            return False, None
+        try:
+            dead, cached = self.r.mget(dead_key, key)
+            return bool(dead), codec.loads(cached) if cached else None
+        except (redis.RedisError, codec.DecodeError) as e:
+            logger.error(f"Error reading page cache for {tab_url}: {e}")
+            return False, None
+
+    def is_dead(self, url: str) -> bool:
+        key = self._key('dead', url)
+        if key is None:
+            return False
+        try:
+            return bool(self.r.exists(key))
+        except redis.RedisError as e:
+            logger.error(f"Error reading dead page cache for {url}: {e}")
+            return False
+
+    def set_dead(self, url: str) -> None:
+        key = self._key('dead', url)
+        if key is None:
+            return
+        try:
+            self.r.set(key, 1, ex=PAGE_CACHE_DEAD_TTL)
+        except redis.RedisError as e:
+            logger.error(f"Error writing dead page cache for {url}: {e}")
+
+    @timed_store('redis', 'cache_claim')
+    def claim(self, namespace: str, url: str) -> Optional[str]:
+        """
+        Register the fetch of the page, so the other containers wait for its result
+        instead of fetching the page too.
+        :return: Token to release the page with, or None if the page is being fetched already.
+        """
+        token = uuid.uuid4().hex
+        key = self._key(f'inflight:{namespace}', url)
+        if key is None:
+            return token
+        try:
+            if self.r.set(key, token, nx=True, ex=PAGE_CACHE_INFLIGHT_TTL):
+                return token
+            return None
+        except redis.RedisError as e:
+            logger.error(f"Error claiming page {url}: {e}")
+            return token
+
+    def release(self, namespace: str, url: str, token: str) -> None:
+        """
+        Remove the fetch of the page from the registry, if it is still ours.
+        """
+        key = self._key(f'inflight:{namespace}', url)
+        if key is None:
+            return
+        try:
+            self.release_script(keys=[key], args=[token])
+        except redis.RedisError as e:
+            logger.error(f"Error releasing page {url}: {e}")
+
+
+class CheckpointRepository:
+    """
+    Items of an order which are already enriched and saved, so a redelivered order
+    (after a restart or a deploy) continues where it stopped instead of refetching
+    every page. Items are keyed by id for business orders and by 'web' for web/google
+    orders, which have no ids. The checkpoint is removed when the order is finished.
+    """
+    prefix = 'fb_checkpoint'
+
+    def __init__(self, search_type: str):
+        self.search_type = search_type
+        self.r = get_redis(CHECKPOINT_DB)
+
+    def _key(self, oid: str, kind: str = 'items') -> str:
+        return f"{self.prefix}:{self.search_type}:{oid}:{kind}"
+
+    def item_key(self, item: FacebookRecord) -> str:
+        if self.search_type == 'business':
+            return str(item.id or '')
+        return item.web or ''
+
+    @timed_store('redis', 'checkpoint_load')
+    def load(self, oid: str) -> tuple[dict[str, FacebookRecord], int]:
+        """
+        Return the saved items of the order by item key and the number of updated items.
+        """
+        try:
+            pipe = self.r.pipeline(transaction=False)
+            pipe.hgetall(self._key(oid))
+            pipe.get(self._key(oid, 'updated'))
+            saved, updated = pipe.execute()
+            updated = int(updated or 0)
+            items = {key.decode(): codec.decode_record(value) for key, value in saved.items()}
+            return items, updated
+        except (redis.RedisError, codec.DecodeError, ValueError) as e:
+            logger.error(f"Error reading checkpoint of {oid}: {e}")
+            return {}, 0
+
+    @traced('redis.checkpoint_mark_done')
+    @timed_store('redis', 'checkpoint_mark_done')
+    def mark_done(self, oid: str, items: list[FacebookRecord], updated: int) -> None:
+        """
+        Record saved items of the order.
+        :param items: Items written by save_items.
+        :param updated: Number of updated items returned by save_items.
+        """
+        mapping = {
+            key: codec.encode_record(item, exclude_unset=True)
+            for item in items
+            if (key := self.item_key(item))
+        }
+        if not mapping:
+            return
+        try:
+            pipe = self.r.pipeline()
+            pipe.hset(self._key(oid), mapping=mapping)
+            pipe.incrby(self._key(oid, 'updated'), updated or 0)
+            pipe.expire(self._key(oid), CHECKPOINT_TTL)
+            pipe.expire(self._key(oid, 'updated'), CHECKPOINT_TTL)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.error(f"Error writing checkpoint of {oid}: {e}")
+
+    def clear(self, oid: str) -> None:
+        try:
+            self.r.delete(self._key(oid), self._key(oid, 'updated'))
+        except redis.RedisError as e:
+            logger.error(f"Error cleaning checkpoint of {oid}: {e}")
+
+
+class ShardRepository:
+    """
+    State of the orders split into shards (FACEBOOK_SHARD_SIZE), shared by all the
+    containers: the number of shards, the finished ones and the items they updated.
+    The coordinator of the order polls it and sends the final ack.
+    """
+    prefix = 'fb_shard'
+
+    # Повторно доставленный шард не должен учитываться дважды
+    FINISH_SCRIPT = """
+    if redis.call('SADD', KEYS[1], ARGV[1]) == 1 then
+        redis.call('HINCRBY', KEYS[2], 'items_done', ARGV[2])
+        redis.call('HINCRBY', KEYS[2], 'updated', ARGV[3])
+    end
+    redis.call('EXPIRE', KEYS[1], ARGV[4])
+    return redis.call('SCARD', KEYS[1])
+    """
+
+    def __init__(self):
+        self.r = get_redis(CHECKPOINT_DB)
+        self.finish_script = self.r.register_script(self.FINISH_SCRIPT)
+
+    def _key(self, oid: str, kind: str) -> str:
+        return f"{self.prefix}:{oid}:{kind}"
+
+    def start(self, oid: str, shards: int, items: int) -> None:
+        pipe = self.r.pipeline()
+        pipe.delete(self._key(oid, 'done'))
+        pipe.hset(self._key(oid, 'state'), mapping={
+            'shards': shards, 'items': items, 'items_done': 0, 'updated': 0, 'published': 0,
+        })
+        pipe.expire(self._key(oid, 'state'), CHECKPOINT_TTL)
+        pipe.execute()
+
+    def set_published(self, oid: str) -> None:
+        self.r.hset(self._key(oid, 'state'), 'published', 1)
+
+    def is_published(self, oid: str) -> bool:
+        return self.r.hget(self._key(oid, 'state'), 'published') == b'1'
+
+    def finish(self, oid: str, shard: int, items: int, updated: int) -> int:
+        """
+        Record the finished shard.
+        :return: Number of finished shards of the order.
+        """
+        return int(self.finish_script(
+            keys=[self._key(oid, 'done'), self._key(oid, 'state')],
+            args=[shard, items, updated or 0, CHECKPOINT_TTL],
+        ))
+
+    def state(self, oid: str) -> dict[str, int]:
+        pipe = self.r.pipeline(transaction=False)
+        pipe.hgetall(self._key(oid, 'state'))
+        pipe.scard(self._key(oid, 'done'))
+        saved, finished = pipe.execute()
+        state = {k.decode(): int(v) for k, v in saved.items()}
+        state['finished'] = finished
+        return state
+
+    def finished_shards(self, oid: str) -> set[int]:
+        return {int(n) for n in self.r.smembers(self._key(oid, 'done'))}
+
+    def clear(self, oid: str) -> None:
+        self.r.delete(self._key(oid, 'state'), self._key(oid, 'done'))
+
+
+class SnapshotRepository:
+    """
+    Brotli-compressed raw html of the fetched facebook pages on local disk
+    (or any object storage mounted into SNAPSHOT_DIR). Snapshots are content-addressed
+    by the hash of the canonical page url, like CrawlerLink.hash_link, so a page
+    fetched again replaces its previous snapshot.
+    """
+    def __init__(self, root: Path = SNAPSHOT_DIR):
+        self.root = Path(root)
+
+    def _path(self, hashed: str, suffix: str) -> Path:
+        return self.root / hashed[:2] / f"{hashed}{suffix}"
+
+    @staticmethod
+    def _write(path: Path, data: bytes) -> None:
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+    def save(self, url: str, content: str, search_type: str, fields: list[str]) -> str:
+        """
+        Store the page html.
+        :param url: Fetched url.
+        :param content: Page html.
+        :param search_type: Page type which fetched the url.
+        :param fields: Fields which were awaited on the page before the html was taken.
+        :return: Hash of the snapshot or empty string on error.
+        """
+        try:
+            hashed = hash_link(canonicalize_facebook_url(url) or url)
+            self._path(hashed, '').parent.mkdir(parents=True, exist_ok=True)
+
+            self._write(self._path(hashed, '.html.br'), brotli.compress(content.encode('utf-8'), quality=5))
+            self._write(self._path(hashed, '.json'), codec.dumps({
+                'url': url,
+                'search_type': search_type,
+                'fields': fields,
+                'fetched_at': datetime.now().isoformat(),
+            }))
+            return hashed
+        except (OSError, brotli.error) as e:
+            logger.error(f"Error saving snapshot for {url}: {e}")
+            return ""
+
+    def load(self, hashed: str) -> tuple[dict, str]:
+        """
+        Return the snapshot metadata and the page html.
+        """
+        meta = codec.loads(self._path(hashed, '.json').read_bytes())
+        content = brotli.decompress(self._path(hashed, '.html.br').read_bytes()).decode('utf-8')
+        return meta, content
+
+    def hashes(self) -> Iterator[str]:
+        for meta in self.root.glob('*/*.json'):
+            yield meta.stem
+
+
 class OrderItemRepository:
+    """
+    Items of the orders in Postgres. The models are imported on the first query:
+    importing them needs Django set up, which main.py does once at startup.
+    """
 
     @staticmethod
-    def get_items(oid: str) -> list:
+    @timed_store('db', 'order_get_items')
+    @db_connection
+    def get_items(oid: str, ids: Optional[list[int]] = None) -> list:
+        from app.infrastructure.models import PaymentOrder, OrderItem
+
         result = []
         try:
             order = PaymentOrder.objects.filter(order_id__exact=oid).first()
@@ -273,8 +628,10 @@ class OrderItemRepository:
                 return result
 
             qs = OrderItem.objects.filter(order_id=order.id)
+            if ids is not None:
+                qs = qs.filter(id__in=ids)
             result = [
-                FacebookItem(
+                FacebookRecord(
                     id=item.id,
                     logo=item.logo,
                     address=item.address,
@@ -304,7 +661,38 @@ class OrderItemRepository:
         return result
 
     @staticmethod
-    def save_items(oid: str, items: list[FacebookItem]) -> int:
+    @timed_store('db', 'order_get_item_ids')
+    @db_connection
+    def get_item_ids(oid: str) -> list[int]:
+        """
+        Return ids of the order items with a facebook link, the same items get_items returns.
+        """
+        from app.infrastructure.models import PaymentOrder, OrderItem
+
+        result = []
+        try:
+            order = PaymentOrder.objects.filter(order_id__exact=oid).first()
+            if not order:
+                logger.error(f"Order with oid {oid} not found.")
+                return result
+
+            result = list(
+                OrderItem.objects
+                .filter(order_id=order.id, social__contains='facebook.com')
+                .order_by('id')
+                .values_list('id', flat=True)
+            )
+        except Exception as e:
+            logger.error(f"Error retrieving item ids for order {oid}: {e}")
+        return result
+
+    @staticmethod
+    @traced('db.order_save_items')
+    @timed_store('db', 'order_save_items')
+    @db_connection
+    def save_items(oid: str, items: list[FacebookRecord]) -> int:
+        from app.infrastructure.models import PaymentOrder, OrderItem
+
         fields = [
             'logo', 'address', 'phone', 'email', 'web', 'service',
             'descr', 'rating', 'category', 'likes',
@@ -360,7 +748,5 @@ class OrderItemRepository:
 
         except Exception as err:
             logger.error(f"Error occurred during saving: {err}")
-        finally:
-            connections['default'].close()
 
         return num_updated
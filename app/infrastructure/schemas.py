@@ -1,3 +1,6 @@
+from dataclasses import dataclass, field, fields
+from operator import attrgetter
+
 from pydantic import BaseModel
 
 
@@ -26,3 +29,90 @@ class FacebookItem(BaseModel):
     relevance: float = 0.0
     position: int = 0
     order_id: int = 0
+
+
+@dataclass(slots=True)
+class FacebookRecord:
+    """
+    Item of an order inside the service. FacebookItem validates the items at the
+    boundary, the records are what the repositories, the services and the pages pass
+    around: building, copying and merging them costs much less at tens of thousands
+    of items per order.
+    """
+    id: int = 0
+    logo: str = ''
+    address: str = ''
+    phone: str = ''
+    email: str = ''
+    web: str = ''
+    service: str = ''
+    descr: str = ''
+    description: str = ''
+    rating: str = ''
+    category: str = ''
+    likes: str = ''
+    title: str = ''
+    price_range: str = ''
+    price_delivery: str = ''
+    social: str = ''
+    keyword: str = ''
+    builtwith: str = ''
+    keyword_match_log: str = ''
+    relevance_log: str = ''
+    search_type: str = ''
+    relevance: float = 0.0
+    position: int = 0
+    order_id: int = 0
+    # Keys of the stored item the record was read from. They are written back even
+    # with default values, like model_dump(exclude_unset=True) did
+    source_keys: frozenset = field(default=frozenset(), repr=False, compare=False)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'FacebookRecord':
+        """
+        Build the record from a stored item. Values of the expected types are taken
+        as they are, anything else goes through FacebookItem validation.
+        """
+        values = {name: data[name] for name in RECORD_FIELDS if name in data}
+        source_keys = frozenset(values)
+        for name, value in values.items():
+            if type(value) is not RECORD_TYPES[name]:
+                return cls(**FacebookItem(**values).model_dump(), source_keys=source_keys)
+        return cls(**values, source_keys=source_keys)
+
+    def to_dict(self, exclude_unset: bool = False) -> dict:
+        """
+        :param exclude_unset: Leave out the fields which are still at their default and
+            were not in the source item, the format of model_dump(exclude_unset=True).
+        """
+        values = dict(zip(RECORD_FIELDS, record_values(self)))
+        if exclude_unset:
+            return {
+                name: value for name, value in values.items()
+                if value != RECORD_DEFAULTS[name] or name in self.source_keys
+            }
+        return values
+
+    def copy(self) -> 'FacebookRecord':
+        return FacebookRecord(*record_values(self), source_keys=self.source_keys)
+
+
+RECORD_FIELDS = tuple(f.name for f in fields(FacebookRecord) if f.name != 'source_keys')
+RECORD_TYPES = {f.name: type(f.default) for f in fields(FacebookRecord) if f.name in RECORD_FIELDS}
+RECORD_DEFAULTS = {f.name: f.default for f in fields(FacebookRecord) if f.name in RECORD_FIELDS}
+record_values = attrgetter(*RECORD_FIELDS)
+
+
+def merge_records(item: FacebookRecord, page: FacebookRecord, **overrides) -> FacebookRecord:
+    """
+    Keep the values of the item and fill its empty fields from the page.
+    :param overrides: Values which replace the merged ones.
+    """
+    merged = [
+        item_value if item_value or not page_value else page_value
+        for item_value, page_value in zip(record_values(item), record_values(page))
+    ]
+    result = FacebookRecord(*merged, source_keys=item.source_keys)
+    for name, value in overrides.items():
+        setattr(result, name, value)
+    return result
@@ -14,14 +14,43 @@ OUT_DIR = Path.joinpath(BASE_DIR, "data/out")
 
 environ.Env.read_env(Path(BASE_DIR, ".env"))
 
+# Уровень логов, уровни отдельных модулей (app.domain.facebook=DEBUG,seleniumbase=WARNING),
+# формат строк (JSON с полями oid, url, proxy, attempt) и вывод в консоль
+LOG_LEVEL = env('LOG_LEVEL', default='INFO')
+LOG_LEVELS = env.dict('LOG_LEVELS', default={})
+LOG_JSON = env.bool('LOG_JSON', default=False)
+LOG_CONSOLE = env.bool('LOG_CONSOLE', default=True)
+
+# Порт, на котором процесс отдаёт метрики Prometheus (/metrics), 0 - не отдавать.
+# Метрики рабочих процессов (--processes) собираются через PROMETHEUS_MULTIPROC_DIR (по умолчанию временный каталог)
+METRICS_PORT = env.int('METRICS_PORT', default=9100)
+
+# Трейсинг заказов (OpenTelemetry): спаны пишутся в TRACING_FILE (JSON на строку) или,
+# если задан TRACING_ENDPOINT, отправляются коллектору по OTLP/HTTP (http://collector:4318/v1/traces)
+TRACING_ENABLED = env.bool('TRACING_ENABLED', default=False)
+TRACING_FILE = env('TRACING_FILE', default=str(Path(LOG_DIR, 'traces.jsonl')))
+TRACING_ENDPOINT = env('TRACING_ENDPOINT', default='')
+TRACING_SAMPLE_RATE = env.float('TRACING_SAMPLE_RATE', default=1.0)
+
+# Профилирование по запросу: kill -USR2 <pid> или GET :PROFILER_PORT/profile?seconds=30 (0 - без http).
+# Стеки всех потоков снимаются каждые PROFILER_INTERVAL секунд и пишутся в PROFILE_DIR в формате flamegraph
+PROFILER_PORT = env.int('PROFILER_PORT', default=0)
+PROFILER_SECONDS = env.int('PROFILER_SECONDS', default=30)
+PROFILER_INTERVAL = env.float('PROFILER_INTERVAL', default=0.01)
+PROFILE_DIR = Path(env('PROFILE_DIR', default=str(Path(LOG_DIR, 'profiles'))))
+
 RABBITMQ_DEFAULT_USER=env('RABBITMQ_DEFAULT_USER')
 RABBITMQ_DEFAULT_PASS=env('RABBITMQ_DEFAULT_PASS')
 RABBITMQ_HOST=env('RABBITMQ_HOST')
 RABBITMQ_PORT=env('RABBITMQ_PORT')
 RABBITMQ_HEARTBEAT=18000
 RABBITMQ_BLOCKED_CONNECTION_TIMEOUT=10800
+# Задержка перед отправкой ack в izpaysite, секунды
+RABBITMQ_ACK_DELAY = env.float('RABBITMQ_ACK_DELAY', default=5)
+# Минимальный интервал между сообщениями о прогрессе заказа (progress_facebook_{oid}), секунды
+RABBITMQ_PROGRESS_INTERVAL = env.float('RABBITMQ_PROGRESS_INTERVAL', default=30)
 
-WDM_PROXY = "la.residential.rayobyte.com:8000"
+WDM_PROXY = env('WDM_PROXY', default="la.residential.rayobyte.com:8000")
 
 
 DB_NAME = env('DB_NAME')
@@ -36,6 +65,44 @@ GRPC_PORT = env('GRPC_PORT')
 REDIS_HOST = env('REDIS_HOST')
 REDIS_PASS = env('REDIS_PASS')
 REDIS_PORT = env('REDIS_PORT')
+# Соединений в пуле процесса на одну БД Redis и ожидание свободного соединения, секунды
+REDIS_MAX_CONNECTIONS = env.int('REDIS_MAX_CONNECTIONS', default=64)
+REDIS_POOL_TIMEOUT = env.float('REDIS_POOL_TIMEOUT', default=20)
+
+PAGE_CACHE_ENABLED = env.bool('PAGE_CACHE_ENABLED', default=True)
+PAGE_CACHE_DB = env.int('PAGE_CACHE_DB', default=5)
+PAGE_CACHE_TTL = env.int('PAGE_CACHE_TTL', default=60 * 60 * 24 * 3)  # 3 дня
+PAGE_CACHE_DEAD_TTL = env.int('PAGE_CACHE_DEAD_TTL', default=60 * 60 * 6)  # 6 часов
+# Страница, которую уже загружает другой контейнер, не загружается повторно: ждём её результат
+# до PAGE_CACHE_INFLIGHT_WAIT секунд. Регистрация загрузки живёт PAGE_CACHE_INFLIGHT_TTL секунд.
+# Пока ждём, item не держит поток: он откладывается и проверяется снова через PAGE_CACHE_INFLIGHT_RETRY секунд
+PAGE_CACHE_INFLIGHT_TTL = env.int('PAGE_CACHE_INFLIGHT_TTL', default=180)
+PAGE_CACHE_INFLIGHT_WAIT = env.int('PAGE_CACHE_INFLIGHT_WAIT', default=180)
+PAGE_CACHE_INFLIGHT_RETRY = env.float('PAGE_CACHE_INFLIGHT_RETRY', default=3)
+
+SNAPSHOT_ENABLED = env.bool('SNAPSHOT_ENABLED', default=False)
+SNAPSHOT_DIR = Path(env('SNAPSHOT_DIR', default=str(Path.joinpath(BASE_DIR, "data/snapshots"))))
+
+# Темп загрузки страниц: общий token bucket для facebook.com (запросов в секунду) и по одному на каждый прокси
+# из пула. RATE_LIMIT_SHARED - общие для всех контейнеров бакеты в Redis
+RATE_LIMIT_ENABLED = env.bool('RATE_LIMIT_ENABLED', default=True)
+RATE_LIMIT_SHARED = env.bool('RATE_LIMIT_SHARED', default=False)
+RATE_LIMIT_DB = env.int('RATE_LIMIT_DB', default=7)
+RATE_LIMIT_DOMAIN_RATE = env.float('RATE_LIMIT_DOMAIN_RATE', default=5)
+RATE_LIMIT_DOMAIN_BURST = env.float('RATE_LIMIT_DOMAIN_BURST', default=10)
+RATE_LIMIT_PROXY_RATE = env.float('RATE_LIMIT_PROXY_RATE', default=0.2)
+RATE_LIMIT_PROXY_BURST = env.float('RATE_LIMIT_PROXY_BURST', default=1)
+
+# Чекпоинты заказов: уже обработанные items пропускаются при повторной доставке заказа
+CHECKPOINT_ENABLED = env.bool('CHECKPOINT_ENABLED', default=True)
+CHECKPOINT_DB = env.int('CHECKPOINT_DB', default=6)
+CHECKPOINT_TTL = env.int('CHECKPOINT_TTL', default=60 * 60 * 24 * 7)  # 7 дней
+# Заказ web/google с большим числом items держит хеши уже взятых items в Redis (CHECKPOINT_DB),
+# а не в памяти процесса (0 - всегда в памяти)
+TRACKER_SPILL_THRESHOLD = env.int('TRACKER_SPILL_THRESHOLD', default=200000)
+# Обработанные items ждут batch_insert в Redis пачками по TRACKER_INSERT_BATCH, в памяти - не больше одной пачки
+# (0 - все в памяти)
+TRACKER_INSERT_BATCH = env.int('TRACKER_INSERT_BATCH', default=5000)
 
 DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
 DBENGINE = 'psqlextra.backend'
@@ -62,4 +129,29 @@ INSTALLED_APPS = [
     'app.infrastructure'
 ]
 
-FACEBOOK_THREADS = 22
+FACEBOOK_THREADS = env.int('FACEBOOK_THREADS', default=22)
+# Число одновременных загрузок страниц подстраивается (AIMD) под успешность загрузок, время загрузки,
+# CPU/RAM хоста и число рабочих прокси: FACEBOOK_THREADS - начальное значение, дальше оно меняется
+# в пределах FACEBOOK_MIN_THREADS..FACEBOOK_MAX_THREADS
+FACEBOOK_ADAPTIVE_THREADS = env.bool('FACEBOOK_ADAPTIVE_THREADS', default=True)
+FACEBOOK_MIN_THREADS = env.int('FACEBOOK_MIN_THREADS', default=4)
+FACEBOOK_MAX_THREADS = env.int(
+    'FACEBOOK_MAX_THREADS', default=FACEBOOK_THREADS * 2 if FACEBOOK_ADAPTIVE_THREADS else FACEBOOK_THREADS)
+# Не больше FACEBOOK_THREADS_PER_PROXY загрузок на один рабочий прокси пула (0 - без ограничения)
+FACEBOOK_THREADS_PER_PROXY = env.int('FACEBOOK_THREADS_PER_PROXY', default=2)
+# Максимум потоков на один заказ, когда в контейнере обрабатывается несколько заказов
+FACEBOOK_ORDER_THREADS = env.int('FACEBOOK_ORDER_THREADS', default=FACEBOOK_MAX_THREADS)
+# Количество заказов, которые контейнер принимает из очереди одновременно
+FACEBOOK_PREFETCH = env.int('FACEBOOK_PREFETCH', default=1)
+# Заказы business больше FACEBOOK_SHARD_SIZE items делятся на шарды, которые обрабатывают
+# все контейнеры business (0 - не делить). Координатор проверяет шарды раз в FACEBOOK_SHARD_POLL секунд
+FACEBOOK_SHARD_SIZE = env.int('FACEBOOK_SHARD_SIZE', default=0)
+FACEBOOK_SHARD_POLL = env.float('FACEBOOK_SHARD_POLL', default=5)
+# Если за FACEBOOK_SHARD_STALE секунд не закончился ни один шард, незаконченные шарды публикуются снова;
+# через FACEBOOK_SHARD_TIMEOUT секунд координатор перестает ждать и отправляет ack с тем, что обновлено
+FACEBOOK_SHARD_STALE = env.int('FACEBOOK_SHARD_STALE', default=60 * 60)
+FACEBOOK_SHARD_TIMEOUT = env.int('FACEBOOK_SHARD_TIMEOUT', default=60 * 60 * 24)
+# Воркер-процессы (main.py --processes K): FACEBOOK_THREADS делятся между процессами,
+# процесс перезапускается, когда он вместе с браузерами занимает больше FACEBOOK_PROCESS_MAX_RSS_MB (0 - никогда)
+FACEBOOK_PROCESSES = env.int('FACEBOOK_PROCESSES', default=0)
+FACEBOOK_PROCESS_MAX_RSS_MB = env.int('FACEBOOK_PROCESS_MAX_RSS_MB', default=3072)
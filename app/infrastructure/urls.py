@@ -0,0 +1,99 @@
+"""
+Url helpers shared by the models and the repositories. They don't need Django,
+so the page cache and the snapshots can use them without setting Django up.
+"""
+import hashlib
+from urllib.parse import urlparse, parse_qs, urlencode
+
+# Query parameters which tell one post, photo, video or shared link from another
+IDENTIFYING_PARAMS = ('id', 'fbid', 'story_fbid', 'v', 'u')
+# Paths which are not a page by themselves, only their identifying parameters make them one
+ENDPOINTS = ('watch', 'share', 'sharer')
+
+
+def normalize_url(url):
+    result = ""
+    try:
+        if url and url.strip():
+            url = url.replace("https://", "http://")
+            tld_parts = urlparse(url.strip().rstrip('/'))
+            fqdn = tld_parts.netloc
+            schema = tld_parts.scheme
+            path = tld_parts.path
+            fragment = tld_parts.fragment
+            query = tld_parts.query
+            if fqdn.startswith('www'):
+                fqdn = fqdn.replace('www.', '')
+
+            res = ""
+            if schema:
+                res += f"{schema}://"
+            if fqdn:
+                res += f'{fqdn}'
+            if path:
+                res += f'{path}'
+            if query:
+                res += f'?{query}'
+            if fragment:
+                res += f'#{fragment}'
+            result = res.rstrip('/')
+    except Exception as err:
+        pass
+    return result
+
+
+def canonicalize_facebook_url(url):
+    """
+    Reduce the variants of a facebook page url (www., m., web., /pages/<name>/<id>,
+    profile.php?id=<id>, trailing slashes, tracking query) to one canonical form.
+    The identifying query parameters (IDENTIFYING_PARAMS) are kept, so the posts,
+    photos and videos don't collapse into one url. Facebook urls which don't point
+    at anything (a bare profile.php, story.php or watch/) give an empty string.
+    Urls of other sites are returned normalized.
+    """
+    result = ""
+    try:
+        url_ = normalize_url(url)
+        if not url_:
+            return result
+        if '://' not in url_:
+            url_ = f"http://{url_}"
+
+        tld_parts = urlparse(url_)
+        fqdn = tld_parts.netloc.lower().split(':')[0]
+        if not (fqdn == 'fb.com' or fqdn == 'facebook.com' or fqdn.endswith('.facebook.com')):
+            return normalize_url(url)
+
+        segments = [s for s in tld_parts.path.split('/') if s]
+        query = parse_qs(tld_parts.query)
+        if segments and segments[0].lower() == 'profile.php' and query.get('id'):
+            segments = [query.pop('id')[0]]
+            if query.get('sk'):
+                segments.append(query['sk'][0])
+        elif len(segments) > 1 and segments[0].lower() == 'pages':
+            ids = [s for s in segments[1:] if s.isdigit()]
+            if ids:
+                segments = [ids[0]] + segments[segments.index(ids[0]) + 1:]
+
+        params = [(name, query[name][0]) for name in IDENTIFYING_PARAMS if query.get(name)]
+        endpoint = not segments or segments[-1].lower().endswith('.php') or segments[-1].lower() in ENDPOINTS
+        if endpoint and not params:
+            return result
+
+        result = "https://facebook.com/" + "/".join(s.lower() for s in segments)
+        result = result.rstrip('/')
+        if params:
+            result += f"?{urlencode(params)}"
+    except Exception as err:
+        pass
+    return result
+
+
+def hash_link(url: str):
+    result = ""
+    try:
+        # Using SHA-1 to generate a hash of the long_link
+        result = hashlib.sha1(url.encode()).hexdigest()
+    except Exception as err:
+        pass
+    return result
@@ -1,19 +1,145 @@
-import time
+import heapq
+import itertools
 import json, aio_pika, asyncio
+import redis
+from contextlib import suppress
 from typing import Optional, Tuple
 
-from app.domain.utils.logutils import init_logger
-from app.infrastructure.settings import RABBITMQ_HOST, RABBITMQ_PORT, RABBITMQ_DEFAULT_USER, RABBITMQ_DEFAULT_PASS, LOG_DIR
+from app.domain.utils.logutils import init_logger, log_fields
+from app.domain.utils.tracing import span
+from app.infrastructure.settings import RABBITMQ_HOST, RABBITMQ_PORT, RABBITMQ_DEFAULT_USER, RABBITMQ_DEFAULT_PASS, LOG_DIR, \
+    FACEBOOK_PREFETCH, RABBITMQ_ACK_DELAY, RABBITMQ_PROGRESS_INTERVAL, FACEBOOK_SHARD_SIZE, FACEBOOK_SHARD_POLL, \
+    FACEBOOK_SHARD_STALE, FACEBOOK_SHARD_TIMEOUT
 
 from aio_pika.abc import AbstractRobustConnection, AbstractIncomingMessage
-from aio_pika import ExchangeType, Message
+from aio_pika import ExchangeType, Message, DeliveryMode
 from asgiref.sync import sync_to_async
 from app.applications.services import FacebookGoogleService, FacebookWebService, FacebookBusinessService
+from app.domain.utils.progress import OrderProgress
+from app.infrastructure.repositories import OrderItemRepository, ShardRepository
 
 logger = init_logger(filename="facebook.log", logdir=str(LOG_DIR))
 
+# Паузы между повторами запросов к состоянию шардов, когда Redis недоступен
+SHARD_RETRY_DELAY = 1.0
+SHARD_MAX_RETRY_DELAY = 60.0
+SHARD_ATTEMPTS = 6
+
+
+async def shard_call(func, *args, attempts: int = SHARD_ATTEMPTS):
+    """
+    Run a ShardRepository call in a worker thread: its Redis client blocks (up to
+    REDIS_POOL_TIMEOUT for a connection) and must not stall the loop. Redis errors
+    are retried with backoff.
+    :param attempts: Raise the Redis error after this many attempts.
+    """
+    delay = SHARD_RETRY_DELAY
+    for attempt in itertools.count(1):
+        try:
+            return await sync_to_async(func, thread_sensitive=False)(*args)
+        except redis.RedisError as err:
+            if attempt >= attempts:
+                raise
+            logger.warning(f"Shard state {func.__name__} failed: {err}, retrying in {delay:.0f}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, SHARD_MAX_RETRY_DELAY)
+
+
+class BrokerPublisher:
+    """
+    Publishes to one exchange over a long-lived channel with publisher confirms.
+    Messages are delivered after their delay by a background task; the messages
+    which become due together are published as one batch and confirmed together.
+    """
+
+    def __init__(self, connection: AbstractRobustConnection, exchange_name: str, durable: bool = False,
+                 persistent: bool = False):
+        self.connection = connection
+        self.exchange_name = exchange_name
+        self.durable = durable
+        self.delivery_mode = DeliveryMode.PERSISTENT if persistent else None
+        self.channel = None
+        self.exchange = None
+        self.pending: list[tuple[float, int, str, bytes, asyncio.Future]] = []
+        self.counter = itertools.count()
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    async def start(self) -> 'BrokerPublisher':
+        self.channel = await self.connection.channel(publisher_confirms=True)
+        self.exchange = await self.channel.declare_exchange(
+            self.exchange_name, durable=self.durable, type=ExchangeType.DIRECT)
+        self.task = asyncio.create_task(self.__flush_loop())
+        return self
+
+    async def close(self) -> None:
+        if self.task:
+            self.task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self.task
+        # Deliver what is left without waiting for the delay
+        if self.pending:
+            batch, self.pending = self.pending, []
+            await self.__publish_batch(batch)
+        if self.channel:
+            await self.channel.close()
+
+    def publish(self, routing_key: str, payload: dict, delay: float = 0) -> asyncio.Future:
+        """
+        Schedule the message.
+        :param routing_key: Routing key of the message.
+        :param payload: Message body, sent as JSON.
+        :param delay: Seconds to wait before the message is published.
+        :return: Future resolved when the broker confirms the message.
+        """
+        loop = asyncio.get_running_loop()
+        confirmed = loop.create_future()
+        body = json.dumps(payload).encode('utf-8')
+        heapq.heappush(self.pending, (loop.time() + delay, next(self.counter), routing_key, body, confirmed))
+        self.wakeup.set()
+        return confirmed
+
+    async def __flush_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            self.wakeup.clear()
+            if not self.pending:
+                await self.wakeup.wait()
+                continue
+
+            wait = self.pending[0][0] - loop.time()
+            if wait > 0:
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=wait)
+                continue
+
+            batch = []
+            now = loop.time()
+            while self.pending and self.pending[0][0] <= now:
+                batch.append(heapq.heappop(self.pending))
+            await self.__publish_batch(batch)
+
+    async def __publish_batch(self, batch: list[tuple[float, int, str, bytes, asyncio.Future]]) -> None:
+        results = await asyncio.gather(
+            *(self.exchange.publish(Message(body=body, delivery_mode=self.delivery_mode), routing_key=routing_key)
+              for _, _, routing_key, body, _ in batch),
+            return_exceptions=True
+        )
+        for (_, _, routing_key, _, confirmed), result in zip(batch, results):
+            if confirmed.done():
+                continue
+            if isinstance(result, BaseException):
+                confirmed.set_exception(result)
+            else:
+                confirmed.set_result(result)
+        if len(batch) > 1:
+            logger.info(f"Published {len(batch)} messages to {self.exchange_name} in one batch")
+
 
 class RabbitMQBroker:
+    SHARD_QUEUE = 'send_to_facebook_b_shard_q'
+    SHARD_ROUTING_KEY = 'facebook_b_shard'
+
     def __init__(
         self,
         search_type: str = 'business',
@@ -35,12 +161,27 @@ class RabbitMQBroker:
             self.password = password
         self.search_type = search_type
         self.connection: Optional[AbstractRobustConnection] = None
+        self.ack_publisher: Optional[BrokerPublisher] = None
+        self.shard_publisher: Optional[BrokerPublisher] = None
+
+    @property
+    def sharding(self) -> bool:
+        return self.search_type == 'business' and FACEBOOK_SHARD_SIZE > 0
 
     async def __aenter__(self):
         self.connection = await self.connect()
+        if self.connection:
+            self.ack_publisher = await BrokerPublisher(self.connection, 'ack_from_facebook_ex').start()
+            if self.sharding:
+                self.shard_publisher = await BrokerPublisher(
+                    self.connection, 'send_to_facebook_ex', durable=True, persistent=True).start()
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if self.shard_publisher:
+            await self.shard_publisher.close()
+        if self.ack_publisher:
+            await self.ack_publisher.close()
         if self.connection:
             await self.connection.close()
 
@@ -74,34 +215,62 @@ class RabbitMQBroker:
 
             async with self.connection.channel() as channel:
                 await channel.declare_exchange(exchange_name, durable=True, type=ExchangeType.DIRECT)
-                await channel.set_qos(prefetch_count=1)
+                await channel.set_qos(prefetch_count=FACEBOOK_PREFETCH)
                 queue = await channel.declare_queue(queue_name, durable=True)
                 await queue.bind(exchange=exchange_name, routing_key=routing_key)
 
                 await queue.consume(self.__on_message)
-                logger.info("Waiting messages from izpaysite...")
+                logger.info(f"Waiting messages from izpaysite (prefetch={FACEBOOK_PREFETCH})...")
+
+                if self.sharding:
+                    async with self.connection.channel() as shard_channel:
+                        # По одному шарду за раз, чтобы шарды распределялись между контейнерами
+                        await shard_channel.set_qos(prefetch_count=1)
+                        shard_queue = await shard_channel.declare_queue(self.SHARD_QUEUE, durable=True)
+                        await shard_queue.bind(exchange=exchange_name, routing_key=self.SHARD_ROUTING_KEY)
+                        await shard_queue.consume(self.__on_shard)
+                        logger.info(f"Waiting shards of big orders (shard size={FACEBOOK_SHARD_SIZE})...")
+                        await asyncio.Future()
+
                 await asyncio.Future()
         except Exception as err:
             logger.error(err)
 
     async def publish_to_izpaysite(self, oid: str, updated_amount: int):
-        exchange_name = 'ack_from_facebook_ex'
         routing_key = f"ack_facebook_{oid}"
         try:
-            async with self.connection.channel() as channel:
-                exchange = await channel.declare_exchange(exchange_name, durable=False, type=ExchangeType.DIRECT)
-
-                message_body = json.dumps({
-                    'oid': oid,
-                    'updated_amount': updated_amount,
-                }).encode('utf-8')
-
-                message = Message(body=message_body)
-                time.sleep(5)
-                await exchange.publish(message, routing_key=routing_key)
+            await self.ack_publisher.publish(routing_key, {
+                'oid': oid,
+                'updated_amount': updated_amount,
+            }, delay=RABBITMQ_ACK_DELAY)
         except Exception as err:
             logger.error(err)
 
+    def publish_progress(self, oid: str, event: dict) -> None:
+        """
+        Publish the progress of the order to progress_facebook_{oid}.
+        Must be called from the event loop thread.
+        """
+        confirmed = self.ack_publisher.publish(f"progress_facebook_{oid}", {
+            'search_type': self.search_type,
+            **event,
+        })
+        confirmed.add_done_callback(self.__log_progress_error)
+
+    @staticmethod
+    def __log_progress_error(confirmed: asyncio.Future) -> None:
+        if not confirmed.cancelled() and confirmed.exception():
+            logger.error(f"Progress not published: {confirmed.exception()}")
+
+    def progress_callback(self, oid: str):
+        # The services run in worker threads, progress is handed over to the loop
+        loop = asyncio.get_running_loop()
+
+        def on_progress(event: dict) -> None:
+            loop.call_soon_threadsafe(self.publish_progress, oid, event)
+
+        return on_progress
+
     async def __on_message(self, message: AbstractIncomingMessage):
         try:
             async with message.process(ignore_processed=True):
@@ -109,31 +278,147 @@ class RabbitMQBroker:
                 new_message = json.loads(new_message.decode('utf-8'))
                 oid = new_message['oid']
                 keyword = new_message.get('keyword', None)
-                updated_amount = await self.process(oid, keyword=keyword)
+                try:
+                    with log_fields(oid=oid, search_type=self.search_type), span('broker.on_message'):
+                        updated_amount = await self.process(oid, keyword=keyword)
+                except redis.RedisError as err:
+                    # The shards of the order can't be coordinated now: the order comes back later
+                    logger.error(f"Order {oid} is requeued, shard state is not available: {err}")
+                    await message.nack(requeue=True)
+                    return
 
                 await message.ack()
                 await self.publish_to_izpaysite(oid, updated_amount)
         except Exception as err:
             logger.error(err)
 
+    @staticmethod
+    async def get_item_ids(oid: str) -> list[int]:
+        return await sync_to_async(OrderItemRepository.get_item_ids, thread_sensitive=False)(oid)
+
+    async def publish_shards(self, oid: str, keyword: Optional[str], chunks: list[list[int]], shards: list[int]) -> None:
+        await asyncio.gather(*(
+            self.shard_publisher.publish(self.SHARD_ROUTING_KEY, {
+                'oid': oid,
+                'keyword': keyword,
+                'shard': n,
+                'item_ids': chunks[n],
+            })
+            for n in shards
+        ))
+
+    async def process_sharded(self, oid: str, keyword: Optional[str], item_ids: list[int]) -> int:
+        """
+        Split the business order into shards for all the business containers,
+        wait until every shard is finished and return the total updated amount.
+        Shards which don't finish for FACEBOOK_SHARD_STALE are published again;
+        after FACEBOOK_SHARD_TIMEOUT the order is acked with what is updated.
+        Raises redis.RedisError if the shards can't be published.
+        """
+        shards = ShardRepository()
+        chunks = [item_ids[i:i + FACEBOOK_SHARD_SIZE] for i in range(0, len(item_ids), FACEBOOK_SHARD_SIZE)]
+        if not await shard_call(shards.is_published, oid):
+            await shard_call(shards.start, oid, len(chunks), len(item_ids))
+            await self.publish_shards(oid, keyword, chunks, list(range(len(chunks))))
+            await shard_call(shards.set_published, oid)
+            logger.info(f"Order {oid}: {len(item_ids)} items split into {len(chunks)} shards")
+        else:
+            # Заказ доставлен повторно, шарды уже в очереди
+            logger.info(f"Order {oid}: waiting for the shards published before")
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + FACEBOOK_SHARD_TIMEOUT
+        progressed = loop.time()
+        progress = OrderProgress(oid, self.progress_callback(oid), RABBITMQ_PROGRESS_INTERVAL)
+        progress.add_total(len(item_ids))
+        items_done = updated = finished = 0
+        state = {}
+        while True:
+            try:
+                state = await shard_call(shards.state, oid, attempts=1)
+            except redis.RedisError as err:
+                # Шарды продолжают работать, состояние прочитается на следующей проверке
+                logger.warning(f"Order {oid}: shard state is not available: {err}")
+            else:
+                if state.get('items_done', 0) > items_done:
+                    progress.saved(state['items_done'] - items_done, state['updated'] - updated)
+                    items_done, updated = state['items_done'], state['updated']
+                if state['finished'] >= state.get('shards', len(chunks)):
+                    break
+                if state['finished'] > finished:
+                    finished, progressed = state['finished'], loop.time()
+
+            if loop.time() >= deadline:
+                logger.error(f"Order {oid}: shards are not finished in {FACEBOOK_SHARD_TIMEOUT}s, "
+                             f"{finished}/{len(chunks)} finished, {updated} items updated")
+                return updated
+            if loop.time() - progressed >= FACEBOOK_SHARD_STALE:
+                # Ни один шард не закончился: контейнер с шардом мог упасть, а сообщение - потеряться
+                with suppress(redis.RedisError):
+                    done = await shard_call(shards.finished_shards, oid, attempts=1)
+                    stale = [n for n in range(len(chunks)) if n not in done]
+                    await self.publish_shards(oid, keyword, chunks, stale)
+                    logger.warning(f"Order {oid}: no shard finished in {FACEBOOK_SHARD_STALE}s, "
+                                   f"shards {stale} published again")
+                progressed = loop.time()
+            await asyncio.sleep(FACEBOOK_SHARD_POLL)
+
+        with suppress(redis.RedisError):
+            await shard_call(shards.clear, oid)
+        logger.info(f"Order {oid}: all {state.get('shards', 0)} shards finished, {updated} items updated")
+        return updated
+
+    async def __on_shard(self, message: AbstractIncomingMessage):
+        try:
+            async with message.process(ignore_processed=True):
+                shard = json.loads(message.body.decode('utf-8'))
+                oid, n, item_ids = shard['oid'], shard['shard'], shard['item_ids']
+                logger.info(f"Order {oid}: processing shard {n} with {len(item_ids)} items")
+                with log_fields(oid=oid, search_type=self.search_type, shard=n), span('broker.on_shard'):
+                    updated_amount = await sync_to_async(
+                        FacebookBusinessService(
+                            oid=oid, search_type=self.search_type, keyword=shard.get('keyword'),
+                            item_ids=item_ids, run_key=f"{oid}:shard{n}"
+                        ).process, thread_sensitive=False)()
+
+                try:
+                    await shard_call(ShardRepository().finish, oid, n, len(item_ids), updated_amount)
+                except redis.RedisError as err:
+                    # The shard must be counted, or the coordinator waits for it: it is
+                    # processed again (the saved items are resumed from its checkpoint)
+                    logger.error(f"Order {oid}: shard {n} is requeued, it can't be recorded: {err}")
+                    await message.nack(requeue=True)
+                    return
+                await message.ack()
+        except Exception as err:
+            logger.error(err)
+
     async def process(self, oid: str, keyword: str = None) -> int:
+        # Each order runs in its own thread, so several orders can be processed at once
+        # when FACEBOOK_PREFETCH > 1. The fetches of all orders share the FairExecutor threads.
         updated_amount = 0
         try:
-            if self.search_type == 'business':
+            on_progress = self.progress_callback(oid)
+            item_ids = await self.get_item_ids(oid) if self.sharding else []
+            if len(item_ids) > FACEBOOK_SHARD_SIZE:
+                updated_amount = await self.process_sharded(oid, keyword, item_ids)
+            elif self.search_type == 'business':
                 updated_amount = await sync_to_async(
                     FacebookBusinessService(
-                        oid=oid, search_type=self.search_type, keyword=keyword
-                    ).process)()
+                        oid=oid, search_type=self.search_type, keyword=keyword, on_progress=on_progress
+                    ).process, thread_sensitive=False)()
             elif self.search_type == 'web':
                 updated_amount = await sync_to_async(
                     FacebookWebService(
-                        oid=oid, search_type=self.search_type
-                    ).process)()
+                        oid=oid, search_type=self.search_type, on_progress=on_progress
+                    ).process, thread_sensitive=False)()
             elif self.search_type == 'google':
                 updated_amount = await sync_to_async(
                     FacebookGoogleService(
-                        oid=oid, search_type=self.search_type
-                    ).process)()
+                        oid=oid, search_type=self.search_type, on_progress=on_progress
+                    ).process, thread_sensitive=False)()
+        except redis.RedisError:
+            raise
         except Exception as err:
             logger.error(err)
         return updated_amount
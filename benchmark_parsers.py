@@ -0,0 +1,143 @@
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import psutil
+
+from app.domain.utils.logutils import init_logger
+from app.infrastructure.settings import LOG_DIR, SNAPSHOT_DIR
+
+logger = init_logger(filename="facebook.log", logdir=str(LOG_DIR))
+
+PAGE_TYPES = ('business', 'web')
+# Корпус страниц, который лежит в репозитории
+FIXTURE_DIR = Path(__file__).resolve().parent / 'tests' / 'fixtures' / 'pages'
+
+
+def load_corpus(corpus: Path) -> dict[str, str]:
+    """
+    Load saved facebook pages: html snapshots written by SnapshotRepository
+    and/or plain *.html files saved from the browser.
+    :param corpus: Corpus directory.
+    :return: Page html by page key (snapshot hash or file name).
+    """
+    from app.infrastructure.repositories import SnapshotRepository
+
+    pages = {}
+    snapshots = SnapshotRepository(corpus)
+    for hashed in snapshots.hashes():
+        _, pages[hashed] = snapshots.load(hashed)
+    for path in sorted(corpus.glob('*.html')):
+        pages[path.name] = path.read_text(encoding='utf8', errors='replace')
+    return pages
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def run(pages: dict[str, str], repeat: int) -> tuple[dict, dict]:
+    """
+    Run extract_item of every page type over the corpus.
+    :return: Report by page type and the extracted items by page type and page key.
+    """
+    from app.applications.services import FacebookPageFactory
+    from app.infrastructure.schemas import FacebookRecord
+
+    process = psutil.Process()
+    report, results = {}, {}
+    for search_type in PAGE_TYPES:
+        page = FacebookPageFactory.create_page(search_type)
+        timings, items = [], {}
+        peak_rss = process.memory_info().rss
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for key, content in pages.items():
+                t = time.perf_counter()
+                item = page.extract_item(content, FacebookRecord())
+                timings.append(time.perf_counter() - t)
+                items[key] = item.to_dict() if item else None
+                peak_rss = max(peak_rss, process.memory_info().rss)
+        elapsed = time.perf_counter() - started
+
+        report[search_type] = {
+            'pages': len(timings),
+            'pages_per_sec': round(len(timings) / elapsed, 2) if elapsed else 0.0,
+            'p50_ms': round(statistics.median(timings) * 1000, 3) if timings else 0.0,
+            'p99_ms': round(percentile(timings, 0.99) * 1000, 3),
+            'peak_rss_mb': round(peak_rss / 2 ** 20, 1),
+        }
+        results[search_type] = items
+    return report, results
+
+
+def compare(results: dict, baseline: dict) -> list[str]:
+    """
+    Return the differences between the extracted items and the baseline.
+    """
+    diffs = []
+    for search_type, items in baseline.items():
+        for key, expected in items.items():
+            actual = results.get(search_type, {}).get(key, 'missing')
+            if actual == expected:
+                continue
+            if isinstance(actual, dict) and isinstance(expected, dict):
+                fields = sorted(f for f in expected.keys() | actual.keys() if actual.get(f) != expected.get(f))
+                diffs.append(f"{search_type} {key}: {', '.join(fields)}")
+            else:
+                diffs.append(f"{search_type} {key}: {expected!r} != {actual!r}")
+    return diffs
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        prog='BenchmarkParsers',
+        description='Benchmark the facebook page parsers over a corpus of saved pages'
+    )
+    parser.add_argument('-c', '--corpus', default=str(FIXTURE_DIR),
+                        help='Directory with html snapshots and/or saved *.html pages (default: the test fixtures)')
+    parser.add_argument('-s', '--snapshots', action='store_true',
+                        help=f'Use the snapshots of the service ({SNAPSHOT_DIR}) as the corpus')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='Passes over the corpus')
+    parser.add_argument('-b', '--baseline', default=None,
+                        help='Baseline JSON file with the expected items (default: <corpus>/baseline.json)')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Write the extracted items as the new baseline instead of checking them')
+    args = parser.parse_args()
+
+    corpus = SNAPSHOT_DIR if args.snapshots else Path(args.corpus)
+    baseline_path = Path(args.baseline) if args.baseline else corpus / 'baseline.json'
+
+    pages = load_corpus(corpus)
+    if not pages:
+        logger.error(f"No saved pages found in {corpus}")
+        return 1
+
+    report, results = run(pages, args.repeat)
+    for search_type, stats in report.items():
+        logger.info(f"{search_type}: " + ', '.join(f"{k}={v}" for k, v in stats.items()))
+
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps(results, ensure_ascii=False, indent=1, sort_keys=True), encoding='utf8')
+        logger.info(f"Baseline with {len(pages)} pages written to {baseline_path}")
+        return 0
+
+    if not baseline_path.exists():
+        logger.warning(f"No baseline at {baseline_path}, output is not checked. Use --save-baseline to create it.")
+        return 0
+
+    diffs = compare(results, json.loads(baseline_path.read_text(encoding='utf8')))
+    for diff in diffs:
+        logger.error(f"Output changed: {diff}")
+    logger.info(f"Output check: {len(diffs)} pages differ from {baseline_path}")
+    return 1 if diffs else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
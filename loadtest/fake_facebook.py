@@ -0,0 +1,94 @@
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from zlib import crc32
+
+# Used when no recorded pages are given: carries the markers of every field in
+# FIELD_MARKERS (intro and about tabs), so the workers don't sit out the
+# ready_xpaths timeout waiting for a missing one
+SAMPLE_PAGE = (
+    '<html id="facebook"><head><title>Load test page</title></head><body>'
+    '<div role="main">'
+    '<svg><g><image xlink:href="https://scontent.example/loadtest-logo.jpg"></image></g></svg>'
+    '<h1>Load test page</h1>'
+    '<div class="xieb3on"><div><span>Load test page description</span></div></div>'
+    '<div><div><img src="/rsrc/Dc7-7AgwkwS.png"/></div><div><span>+1 555 0100</span></div></div>'
+    '<div><div><img src="/rsrc/8k_Y-oVxbuU.png"/></div><div><span>1 Test street</span></div></div>'
+    '<div><div><img src="/rsrc/2PIcyqpptfD.png"/></div><div><span>loadtest@example.com</span></div></div>'
+    '<div><div><i data-visualcompletion="css-img" style="background-position: -63px -126px"></i></div>'
+    '<div><span>+1 555 0100</span></div></div>'
+    '<div><div><i data-visualcompletion="css-img" style="background-position: -84px -126px"></i></div>'
+    '<div><span>1 Test street</span></div></div>'
+    '<div><div><i data-visualcompletion="css-img" style="background-position: 0px -155px"></i></div>'
+    '<div><span>loadtest@example.com</span></div></div>'
+    '</div></body></html>'
+)
+
+
+CAPTCHA_PAGE = (
+    '<html id="facebook"><head><title>Just a moment...</title></head>'
+    '<body><div>Checking your browser</div></body></html>'
+)
+
+
+class FakeFacebookServer:
+    """
+    Local HTTP server which stands in for facebook.com. Every path is answered
+    with one of the recorded pages (picked by the path, so a page url always gets
+    the same html), after a random latency and with a configurable captcha rate.
+    """
+
+    def __init__(self, pages: list[str], host: str = '127.0.0.1', port: int = 0,
+                 latency: tuple[float, float] = (0.2, 1.0), captcha_rate: float = 0.0):
+        self.pages = pages or [SAMPLE_PAGE]
+        self.latency = latency
+        self.captcha_rate = captcha_rate
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'captcha': 0}
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name='fake-facebook', daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def page_url(self, n: int) -> str:
+        # The path keeps "facebook.com" so the workers pick the link from item.social
+        return f"{self.base_url}/www.facebook.com/loadtest-page-{n}"
+
+    def start(self) -> 'FakeFacebookServer':
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _render(self, path: str) -> str:
+        with self.lock:
+            self.stats['requests'] += 1
+            if random.random() < self.captcha_rate:
+                self.stats['captcha'] += 1
+                return CAPTCHA_PAGE
+        return self.pages[crc32(path.split('?')[0].rstrip('/').encode()) % len(self.pages)]
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                time.sleep(random.uniform(*fake.latency))
+                body = fake._render(self.path).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
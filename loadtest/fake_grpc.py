@@ -0,0 +1,45 @@
+from concurrent import futures
+
+import grpc
+
+from app.generated.file_extractor import extractor_pb2, extractor_pb2_grpc
+from app.generated.similarity import similarity_pb2, similarity_pb2_grpc
+
+
+class FakeFileExtractorService(extractor_pb2_grpc.FileExtractorServiceServicer):
+    def __init__(self, proxies: list[str]):
+        self.proxies = proxies
+
+    def GetProxies(self, request, context):
+        return extractor_pb2.GetProxiesResponse(proxies=self.proxies)
+
+
+class FakeSimilarityService(similarity_pb2_grpc.SimilarityServiceServicer):
+    def CountRatioS(self, request, context):
+        return similarity_pb2.CountRatioSResponse(ratio=1.0)
+
+    def CountRatio(self, request, context):
+        return similarity_pb2.CountRatioResponse(ratio=1.0)
+
+    def ExtractWordsFromText(self, request, context):
+        return similarity_pb2.ExtractWordsFromTextResponse(result=request.text.split())
+
+    def SimpleRatioWithLog(self, request, context):
+        return similarity_pb2.SimpleRatioWithLogResponse(
+            result=similarity_pb2.SimpleRatioWithLogResponseMap(ratio=1.0, ratio_log='loadtest'))
+
+    def GetNltkSynonyms(self, request, context):
+        return similarity_pb2.GetNltkSynonymsResponse(result=[])
+
+
+def start_fake_grpc(host: str = '127.0.0.1', port: int = 0, proxies: list[str] = None) -> tuple[grpc.Server, int]:
+    """
+    Start in-process SimilarityService and FileExtractorService servers.
+    :return: The server and the bound port.
+    """
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+    similarity_pb2_grpc.add_SimilarityServiceServicer_to_server(FakeSimilarityService(), server)
+    extractor_pb2_grpc.add_FileExtractorServiceServicer_to_server(FakeFileExtractorService(proxies or []), server)
+    port = server.add_insecure_port(f'{host}:{port}')
+    server.start()
+    return server, port
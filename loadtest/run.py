@@ -0,0 +1,228 @@
+"""
+End-to-end load test of one search type.
+
+Starts a fake facebook.com HTTP server and fake SimilarityService/FileExtractorService
+gRPC servers, seeds N orders into the local Postgres/Redis (docker-compose up -d postgres
+redis rabbitmq), drives them through RabbitMQBroker and reports items/sec and the order
+latency distribution.
+
+    python -m loadtest.run --business --orders 5 --items 200 --latency 0.2,1.5 --captcha-rate 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+import uuid
+from pathlib import Path
+
+from loadtest.fake_facebook import FakeFacebookServer
+from loadtest.fake_grpc import start_fake_grpc
+
+ROUTING_KEYS = {'business': 'facebook_b', 'web': 'facebook_w', 'google': 'facebook_g'}
+QUEUES = {'business': 'send_to_facebook_b_q', 'web': 'send_to_facebook_w_q', 'google': 'send_to_facebook_g_q'}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='LoadTest', description='End-to-end load test of the facebook service')
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('-b', '--business', dest='search_type', action='store_const', const='business')
+    group.add_argument('-w', '--web', dest='search_type', action='store_const', const='web')
+    group.add_argument('-g', '--google', dest='search_type', action='store_const', const='google')
+    parser.add_argument('--orders', type=int, default=3, help='Number of orders')
+    parser.add_argument('--items', type=int, default=50, help='Items per order')
+    parser.add_argument('--pages', type=int, default=0,
+                        help='Distinct facebook pages shared by all items (default: one page per item)')
+    parser.add_argument('--corpus', default=None, help='Recorded pages: html snapshots and/or *.html files')
+    parser.add_argument('--latency', default='0.2,1.0', help='Fake facebook latency range in seconds: min,max')
+    parser.add_argument('--captcha-rate', type=float, default=0.0, help='Share of responses with a captcha page')
+    parser.add_argument('--timeout', type=float, default=3600, help='Give up after this many seconds')
+    parser.add_argument('--report', default=None, help='Write the report as JSON to this file')
+    parser.add_argument('--keep', action='store_true', help='Keep the seeded orders after the run')
+    return parser.parse_args()
+
+
+def make_items(fb: FakeFacebookServer, oid: str, count: int, pages: int) -> list[dict]:
+    return [
+        {
+            'title': f'loadtest item {i}',
+            'web': f'http://{oid}-{i}.loadtest.example',
+            'social': fb.page_url(i % pages if pages else i),
+            'keyword': 'loadtest',
+        }
+        for i in range(count)
+    ]
+
+
+def _redis(db: int):
+    import redis
+    from app.infrastructure.settings import REDIS_HOST, REDIS_PORT, REDIS_PASS
+
+    return redis.Redis(host=REDIS_HOST, port=REDIS_PORT, password=REDIS_PASS, db=db)
+
+
+def _ensure_tables() -> None:
+    from django.db import connection
+    from app.infrastructure.models import PaymentOrder, OrderItem, CrawlerLink
+
+    existing = connection.introspection.table_names()
+    with connection.schema_editor() as editor:
+        for model in (PaymentOrder, CrawlerLink, OrderItem):
+            if model._meta.db_table not in existing:
+                editor.create_model(model)
+
+
+def seed(search_type: str, oid: str, items: list[dict]) -> None:
+    if search_type == 'business':
+        from app.infrastructure.models import PaymentOrder, OrderItem
+
+        _ensure_tables()
+        order = PaymentOrder.objects.create(order_id=oid, keyword=['loadtest'])
+        OrderItem.objects.bulk_create([OrderItem(order=order, **item) for item in items], batch_size=500)
+    elif search_type == 'web':
+        _redis(0).rpush(oid, *(json.dumps(item) for item in items))
+    elif search_type == 'google':
+        _redis(4).rpush(oid, *(json.dumps(item) for item in items))
+        _redis(15).set(oid, 3)
+
+
+def cleanup(search_type: str, oids: list[str]) -> None:
+    if search_type == 'business':
+        from app.infrastructure.models import PaymentOrder
+
+        PaymentOrder.objects.filter(order_id__in=oids).delete()
+    else:
+        for db in (0, 4, 15):
+            _redis(db).delete(*oids)
+
+
+async def drive(search_type: str, oids: list[str], timeout: float) -> dict[str, dict]:
+    """
+    Publish the orders the way izpaysite does and wait for every ack.
+    :return: Publish/ack times and updated amount by order id.
+    """
+    import aio_pika
+    from aio_pika import ExchangeType, Message, DeliveryMode
+    from app.presentation.broker import RabbitMQBroker
+
+    results = {oid: {} for oid in oids}
+    finished = asyncio.Event()
+
+    async with RabbitMQBroker(search_type=search_type, env_settings=True) as broker:
+        consumer = asyncio.create_task(broker.consume_from_izpaysite())
+        connection = await aio_pika.connect_robust(
+            f"amqp://{broker.login}:{broker.password}@{broker.host}:{broker.port}/")
+        async with connection:
+            channel = await connection.channel()
+
+            ack_exchange = await channel.declare_exchange('ack_from_facebook_ex', durable=False,
+                                                          type=ExchangeType.DIRECT)
+            ack_queue = await channel.declare_queue(exclusive=True)
+            for oid in oids:
+                await ack_queue.bind(ack_exchange, routing_key=f"ack_facebook_{oid}")
+
+            async def on_ack(message: aio_pika.abc.AbstractIncomingMessage):
+                data = json.loads(message.body.decode('utf-8'))
+                if data.get('oid') in results and 'acked' not in results[data['oid']]:
+                    results[data['oid']].update(acked=time.perf_counter(), updated=data.get('updated_amount', 0))
+                if all('acked' in r for r in results.values()):
+                    finished.set()
+
+            await ack_queue.consume(on_ack, no_ack=True)
+
+            order_exchange = await channel.declare_exchange('send_to_facebook_ex', durable=True,
+                                                            type=ExchangeType.DIRECT)
+            order_queue = await channel.declare_queue(QUEUES[search_type], durable=True)
+            await order_queue.bind(order_exchange, routing_key=ROUTING_KEYS[search_type])
+
+            for oid in oids:
+                results[oid]['published'] = time.perf_counter()
+                await order_exchange.publish(
+                    Message(body=json.dumps({'oid': oid, 'keyword': 'loadtest'}).encode('utf-8'),
+                            delivery_mode=DeliveryMode.PERSISTENT),
+                    routing_key=ROUTING_KEYS[search_type])
+
+            try:
+                await asyncio.wait_for(finished.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+        consumer.cancel()
+    return results
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def make_report(results: dict[str, dict], items_per_order: int, fb: FakeFacebookServer) -> dict:
+    acked = [r for r in results.values() if 'acked' in r]
+    latencies = [r['acked'] - r['published'] for r in acked]
+    started = min(r['published'] for r in results.values())
+    wall = (max(r['acked'] for r in acked) - started) if acked else 0.0
+    items = items_per_order * len(acked)
+    return {
+        'orders': len(results),
+        'orders_acked': len(acked),
+        'items': items,
+        'items_updated': sum(r['updated'] for r in acked),
+        'wall_s': round(wall, 2),
+        'items_per_sec': round(items / wall, 3) if wall else 0.0,
+        'order_latency_s': {
+            'min': round(min(latencies), 2) if latencies else 0.0,
+            'p50': round(statistics.median(latencies), 2) if latencies else 0.0,
+            'p90': round(percentile(latencies, 0.9), 2),
+            'p99': round(percentile(latencies, 0.99), 2),
+            'max': round(max(latencies), 2) if latencies else 0.0,
+        },
+        'facebook_requests': fb.stats['requests'],
+        'facebook_captcha': fb.stats['captcha'],
+    }
+
+
+def main():
+    args = parse_args()
+    latency = tuple(float(v) for v in args.latency.split(','))
+
+    # The fakes must be up and the environment set before the app settings are imported
+    grpc_server, grpc_port = start_fake_grpc()
+    os.environ['GRPC_HOST'] = '127.0.0.1'
+    os.environ['GRPC_PORT'] = str(grpc_port)
+    os.environ['WDM_PROXY'] = ''
+
+    from app.domain.utils.logutils import init_logger
+    from app.infrastructure.settings import LOG_DIR
+
+    logger = init_logger(filename="loadtest.log", logdir=str(LOG_DIR))
+
+    pages = []
+    if args.corpus:
+        from benchmark_parsers import load_corpus
+
+        pages = list(load_corpus(Path(args.corpus)).values())
+    fb = FakeFacebookServer(pages, latency=latency, captcha_rate=args.captcha_rate).start()
+    logger.info(f"Fake facebook at {fb.base_url} with {len(fb.pages)} pages, fake gRPC at 127.0.0.1:{grpc_port}")
+
+    oids = [f"loadtest_{uuid.uuid4().hex[:12]}" for _ in range(args.orders)]
+    for oid in oids:
+        seed(args.search_type, oid, make_items(fb, oid, args.items, args.pages))
+    logger.info(f"Seeded {args.orders} {args.search_type} orders x {args.items} items")
+
+    try:
+        results = asyncio.run(drive(args.search_type, oids, args.timeout))
+        report = make_report(results, args.items, fb)
+        logger.info(f"LOAD TEST {args.search_type.upper()}: {json.dumps(report)}")
+        if args.report:
+            Path(args.report).write_text(json.dumps(report, indent=1), encoding='utf8')
+    finally:
+        if not args.keep:
+            cleanup(args.search_type, oids)
+        fb.stop()
+        grpc_server.stop(grace=None)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,39 @@
+import time
+_started = time.perf_counter()
+
+import argparse
 import asyncio
-from app.infrastructure.settings import LOG_DIR
+import sys
+from contextlib import contextmanager
+
+from app.infrastructure.settings import LOG_DIR, FACEBOOK_PROCESSES, METRICS_PORT
 from app.domain.utils.logutils import init_logger
-from app.presentation.broker import RabbitMQBroker
-import argparse
+from app.domain.utils.metrics import start_metrics_server
+from app.domain.utils.profiler import install_profiler
+from app.domain.utils.tracing import setup_tracing
+from app.applications.workers import worker_pool
 
 logger = init_logger(filename="facebook.log", logdir=str(LOG_DIR))
 
+# Время и число импортированных модулей по этапам запуска
+_stages: list[tuple[str, float, int]] = [('core', time.perf_counter() - _started, len(sys.modules))]
+
+
+@contextmanager
+def startup_stage(name: str):
+    started, modules = time.perf_counter(), len(sys.modules)
+    try:
+        yield
+    finally:
+        _stages.append((name, time.perf_counter() - started, len(sys.modules) - modules))
+
+
+def log_startup() -> None:
+    stages = ', '.join(f"{name} {seconds * 1000:.0f}ms ({modules} modules)" for name, seconds, modules in _stages)
+    logger.info(f"Started in {time.perf_counter() - _started:.2f}s: {stages} "
+                f"(python -X importtime main.py for the breakdown by module)")
+
+
 async def main():
     try:
         parser = argparse.ArgumentParser(
@@ -22,6 +50,8 @@ async def main():
         group.add_argument('-g', '--google',
                            help='Consume data from web query',
                            action='store_true')
+        parser.add_argument('-p', '--processes', type=int, default=FACEBOOK_PROCESSES,
+                            help='Process the items in this many worker processes (0 - in this process)')
 
         args, unknown = parser.parse_known_args()
 
@@ -36,10 +66,33 @@ async def main():
             logger.error("Search type is not declared: business")
 
         logger.info(f"STARTING Facebook {search_type.upper()}")
+        with startup_stage('django'):
+            from manage import init_django
+            init_django()
+        with startup_stage('broker'):
+            from app.presentation.broker import RabbitMQBroker
+        if args.processes == 0:
+            # The worker processes import the page modules themselves
+            with startup_stage(f'pages[{search_type}]'):
+                from app.applications.services import FacebookPageFactory
+                FacebookPageFactory.page_class(search_type)
+
+        if METRICS_PORT:
+            start_metrics_server(METRICS_PORT)
+        setup_tracing(f'fb_service_{search_type}')
+        # main() runs in the thread of the broker's asyncio loop
+        install_profiler(loop_thread=True)
+        if args.processes > 0:
+            with startup_stage('workers'):
+                worker_pool.start(args.processes)
+        log_startup()
         async with RabbitMQBroker(search_type=search_type, env_settings=True) as broker:
             await broker.consume_from_izpaysite()
     except Exception as err:
         logger.error(f"Error: {err}")
+    finally:
+        if worker_pool.running:
+            worker_pool.stop()
 
 if __name__ == '__main__':
     asyncio.run(main())
@@ -1,6 +1,5 @@
 import os
 import sys
-from django.core.management import execute_from_command_line
 
 
 def init_django():
@@ -15,5 +14,7 @@ def init_django():
 
 
 if __name__ == "__main__":
+    from django.core.management import execute_from_command_line
+
     init_django()
     execute_from_command_line(sys.argv)
@@ -0,0 +1,91 @@
+import argparse
+import json
+import os
+import time
+from concurrent import futures
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from app.domain.utils.logutils import init_logger
+from app.infrastructure.settings import LOG_DIR, OUT_DIR, SNAPSHOT_DIR
+
+logger = init_logger(filename="facebook.log", logdir=str(LOG_DIR))
+
+_pages = {}
+
+
+def _init_worker():
+    # Page registrations live next to the services
+    from app.applications.services import FacebookPageFactory
+
+    for search_type in ('business', 'web'):
+        _pages[search_type] = FacebookPageFactory.create_page(search_type)
+
+
+def reparse(root: str, hashed: str, search_type: Optional[str]) -> Optional[dict]:
+    """
+    Run extract_item of the page type over one stored snapshot.
+    :param root: Snapshot directory.
+    :param hashed: Snapshot hash.
+    :param search_type: Page type to parse with, the type stored with the snapshot if None.
+    :return: Snapshot metadata with the extracted item.
+    """
+    from app.infrastructure.repositories import SnapshotRepository
+    from app.infrastructure.schemas import FacebookRecord
+
+    try:
+        meta, content = SnapshotRepository(root).load(hashed)
+        page = _pages[search_type or meta.get('search_type', 'business')]
+        item = page.extract_item(content, FacebookRecord())
+        if item is None:
+            return None
+        return {**meta, 'hash': hashed, 'item': item.to_dict(exclude_unset=True)}
+    except Exception as err:
+        logger.error(f"Error re-parsing snapshot {hashed}: {err}")
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='ReparseSnapshots',
+        description='Re-run the facebook page parsers over stored html snapshots without refetching'
+    )
+    parser.add_argument('-d', '--dir', default=str(SNAPSHOT_DIR), help='Snapshot directory')
+    parser.add_argument('-t', '--type', choices=('business', 'web'), default=None,
+                        help='Parse with this page type instead of the one stored with the snapshot')
+    parser.add_argument('-p', '--processes', type=int, default=os.cpu_count(), help='Number of parser processes')
+    parser.add_argument('-o', '--out', default=None, help='Output JSON lines file')
+    parser.add_argument('--update-cache', action='store_true',
+                        help='Replace the shared page cache entries with the re-parsed values')
+    args = parser.parse_args()
+
+    from app.infrastructure.repositories import SnapshotRepository, FacebookPageCacheRepository
+
+    out = Path(args.out) if args.out else Path(OUT_DIR, f"reparse_{datetime.now():%Y%m%d_%H%M%S}.jsonl")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    cache = FacebookPageCacheRepository() if args.update_cache else None
+
+    hashes = list(SnapshotRepository(args.dir).hashes())
+    logger.info(f"Re-parsing {len(hashes)} snapshots from {args.dir} in {args.processes} processes")
+
+    started = time.perf_counter()
+    parsed = 0
+    with futures.ProcessPoolExecutor(max_workers=args.processes, initializer=_init_worker) as executor, \
+            open(out, mode='w', encoding='utf8') as f:
+        results = executor.map(reparse, [args.dir] * len(hashes), hashes, [args.type] * len(hashes),
+                               chunksize=16)
+        for result in results:
+            if result is None:
+                continue
+            f.write(json.dumps(result, ensure_ascii=False) + '\n')
+            if cache:
+                namespace = args.type or result.get('search_type', 'business')
+                cache.set(namespace, result['url'], result.get('fields', []), result['item'])
+            parsed += 1
+
+    logger.info(f"Re-parsed {parsed}/{len(hashes)} snapshots in {time.perf_counter() - started:.1f}s -> {out}")
+
+
+if __name__ == '__main__':
+    main()
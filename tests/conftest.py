@@ -0,0 +1,18 @@
+import os
+import sys
+from pathlib import Path
+
+# Settings require the connection variables; the tests don't connect anywhere
+for name, value in {
+    'RABBITMQ_DEFAULT_USER': 'test', 'RABBITMQ_DEFAULT_PASS': 'test', 'RABBITMQ_HOST': 'localhost', 'RABBITMQ_PORT': '5672',
+    'DB_NAME': 'test', 'DB_USER': 'test', 'DB_PASSWORD': 'test', 'DB_HOST': 'localhost', 'DB_PORT': '5432',
+    'REDIS_HOST': 'localhost', 'REDIS_PASS': 'test', 'REDIS_PORT': '6379',
+    'GRPC_HOST': 'localhost', 'GRPC_PORT': '50051',
+}.items():
+    os.environ.setdefault(name, value)
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+# The spawned worker processes import the app too
+os.environ['PYTHONPATH'] = os.pathsep.join(filter(None, [str(ROOT), os.environ.get('PYTHONPATH')]))
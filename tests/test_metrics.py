@@ -0,0 +1,28 @@
+import multiprocessing as mp
+
+# Imported before prometheus_client: it turns the multiprocess mode on
+from app.domain.utils.metrics import FETCH_ATTEMPTS, mark_process_dead, metrics_registry
+
+
+def count_attempts(n: int) -> None:
+    for _ in range(n):
+        FETCH_ATTEMPTS.labels('test', 'ok').inc()
+
+
+def test_worker_process_metrics_are_served():
+    """
+    The attempts counted by the worker processes are summed up with the ones of this
+    process, and are still there after the workers exited.
+    """
+    count_attempts(1)
+    ctx = mp.get_context('spawn')
+    processes = [ctx.Process(target=count_attempts, args=(2,)) for _ in range(2)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=60)
+        mark_process_dead(process.pid)
+
+    registry = metrics_registry()
+    assert registry.get_sample_value('fb_fetch_attempts_total', {'tier': 'test', 'result': 'ok'}) == 5
+    assert registry.get_sample_value('fb_executor_queue_depth') == 0
@@ -0,0 +1,38 @@
+import json
+from pathlib import Path
+
+import pytest
+from parsel import Selector
+
+from app.applications.services import FacebookPageFactory
+
+PAGES_DIR = Path(__file__).parent / 'fixtures' / 'pages'
+SNAPSHOTS = sorted(PAGES_DIR.glob('*.html'))
+
+
+@pytest.fixture(scope='module')
+def pages():
+    return {search_type: FacebookPageFactory.create_page(search_type) for search_type in ('business', 'web')}
+
+
+@pytest.mark.parametrize('snapshot', SNAPSHOTS, ids=[path.stem for path in SNAPSHOTS])
+def test_parse_page(pages, snapshot):
+    """
+    parse_page of every page type gives the fields saved in <snapshot>.json.
+    """
+    selector = Selector(text=snapshot.read_text(encoding='utf8'))
+    expected = json.loads(snapshot.with_suffix('.json').read_text(encoding='utf8'))
+
+    for search_type, page in pages.items():
+        assert page.parse_page(selector).to_dict(exclude_unset=True) == expected[search_type], search_type
+
+
+def test_benchmark_baseline():
+    """
+    benchmark_parsers finds no changes against the baseline of the fixture corpus.
+    """
+    from benchmark_parsers import FIXTURE_DIR, load_corpus, run, compare
+
+    _, results = run(load_corpus(FIXTURE_DIR), repeat=1)
+
+    assert compare(results, json.loads((FIXTURE_DIR / 'baseline.json').read_text(encoding='utf8'))) == []
@@ -0,0 +1,52 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.domain.utils import rate_limiter
+from app.domain.utils.rate_limiter import TokenBucket
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limiter, 'time', SimpleNamespace(monotonic=clock))
+    return clock
+
+
+def test_burst_is_free(clock):
+    bucket = TokenBucket(rate=2, burst=3)
+
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+
+
+def test_waiting_requests_are_paced(clock):
+    bucket = TokenBucket(rate=2, burst=1)
+
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == pytest.approx(0.5)
+    assert bucket.reserve() == pytest.approx(1.0)
+
+
+def test_refill(clock):
+    bucket = TokenBucket(rate=2, burst=2)
+    bucket.reserve()
+    bucket.reserve()
+
+    clock.now += 0.5
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == pytest.approx(0.5)
+
+
+def test_refill_is_capped_by_burst(clock):
+    bucket = TokenBucket(rate=10, burst=2)
+
+    clock.now += 60
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, pytest.approx(0.1)]
@@ -0,0 +1,81 @@
+from pathlib import Path
+
+import pytest
+
+from app.domain.utils.retry import FailureKind, RetryPolicy, classify_content, is_login_redirect
+
+PAGES_DIR = Path(__file__).parent / 'fixtures' / 'pages'
+
+
+def test_login_redirect():
+    assert is_login_redirect('https://www.facebook.com/login/?next=https%3A%2F%2Fwww.facebook.com%2Fbluefox')
+    assert not is_login_redirect('https://www.facebook.com/bluefox')
+    assert not is_login_redirect(None)
+
+
+def test_residential_after_pool_attempts_or_escalation():
+    policy = RetryPolicy(max_attempts=5, pool_attempts=2)
+
+    assert not policy.use_residential(0, [])
+    assert not policy.use_residential(1, [FailureKind.NETWORK])
+    assert policy.use_residential(2, [FailureKind.NETWORK, FailureKind.NETWORK])
+    assert policy.use_residential(1, [FailureKind.CAPTCHA])
+    assert policy.use_residential(1, [FailureKind.LOGIN_WALL])
+
+
+def test_should_retry():
+    policy = RetryPolicy(max_attempts=3, pool_attempts=2)
+
+    assert policy.should_retry(0, FailureKind.NETWORK)
+    assert policy.should_retry(1, FailureKind.CAPTCHA)
+    assert not policy.should_retry(2, FailureKind.NETWORK)
+    assert not policy.should_retry(0, FailureKind.DEAD_PAGE)
+
+
+def test_backoff_grows_with_repeated_failures(monkeypatch):
+    monkeypatch.setattr('app.domain.utils.retry.random.uniform', lambda a, b: 1.0)
+    policy = RetryPolicy(max_attempts=10, pool_attempts=2)
+
+    assert policy.delay([]) == 0.0
+    assert policy.delay([FailureKind.NETWORK]) == 1.0
+    assert policy.delay([FailureKind.NETWORK] * 3) == 4.0
+    assert policy.delay([FailureKind.NETWORK] * 10) == 10.0
+    # Only the failures of the last kind count
+    assert policy.delay([FailureKind.NETWORK, FailureKind.NETWORK, FailureKind.CAPTCHA]) == 2.0
+
+
+@pytest.mark.parametrize('content, expected', [
+    ('', FailureKind.EMPTY_CONTENT),
+    ('<html><head><title>Just a moment...</title></head><body></body></html>', FailureKind.CAPTCHA),
+    ('<html><head><title>Page Not Found | Facebook</title></head><body></body></html>', FailureKind.DEAD_PAGE),
+    ("<html><head><title>Facebook</title></head><body><div>This content isn't available right now</div></body></html>",
+     FailureKind.DEAD_PAGE),
+    ('<html><head><title>Facebook</title></head><body><div>You must be 18 years old to view</div></body></html>',
+     FailureKind.DEAD_PAGE),
+])
+def test_classify_failures(content, expected):
+    assert classify_content(content) == expected
+
+
+def test_classify_live_page():
+    assert classify_content((PAGES_DIR / 'business_intro.html').read_text(encoding='utf8')) is None
+
+
+def test_markers_in_scripts_of_live_page():
+    # Every page carries the translations of the messages in its scripts
+    content = (
+        '<html><head><title>Blue Fox Cafe | Facebook</title></head><body>'
+        '<script>{"text":"This content isn\'t available"}</script><h1>Blue Fox Cafe</h1></body></html>'
+    )
+    assert classify_content(content) is None
+
+
+@pytest.mark.parametrize('text', ['Log in to see more from Blue Fox Cafe', 'You must log in to continue'])
+def test_login_prompt_is_not_a_dead_page(text):
+    # A logged out visitor of a live page sees these too: the load is retried, the page is not negative-cached
+    without_h1 = f'<html><head><title>Facebook</title></head><body><div>{text}</div></body></html>'
+    with_h1 = f'<html><head><title>Blue Fox Cafe</title></head><body><h1>Blue Fox Cafe</h1><div>{text}</div></body></html>'
+
+    assert classify_content(without_h1) == FailureKind.LOGIN_WALL
+    assert classify_content(with_h1) is None
+    assert RetryPolicy(max_attempts=3, pool_attempts=1).should_retry(0, FailureKind.LOGIN_WALL)
@@ -0,0 +1,37 @@
+import time
+
+from app.domain.utils.scheduler import Deferred, FairExecutor, task_deferred_since
+
+
+def test_deferred_task_runs_again():
+    executor = FairExecutor(max_workers=1)
+    calls = []
+
+    def task():
+        calls.append(task_deferred_since.get())
+        if len(calls) < 3:
+            raise Deferred(0.05)
+        return 'done'
+
+    future = executor.submit('order', task)
+
+    assert future.result(timeout=5) == 'done'
+    assert calls[0] is None
+    # The time of the first deferral is kept for the next runs
+    assert calls[1] is not None and calls[1] == calls[2]
+
+
+def test_deferred_task_gives_its_thread_back():
+    executor = FairExecutor(max_workers=1)
+    started = time.monotonic()
+
+    def waiting():
+        raise Deferred(60)
+
+    executor.submit('a', waiting)
+    other = executor.submit('b', lambda: 'other')
+
+    assert other.result(timeout=5) == 'other'
+    assert time.monotonic() - started < 5
+    assert executor.pending() == 1
+    assert executor.pending('a') == 1
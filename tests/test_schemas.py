@@ -0,0 +1,46 @@
+from app.infrastructure.schemas import FacebookItem, FacebookRecord, merge_records
+
+
+def test_merge_keeps_item_values():
+    item = FacebookRecord(id=1, title='Blue Fox', phone='', email='')
+    page = FacebookRecord(title='Blue Fox Cafe', phone='+372 555 0101', email='')
+
+    merged = merge_records(item, page)
+
+    assert merged.id == 1
+    assert merged.title == 'Blue Fox'
+    assert merged.phone == '+372 555 0101'
+    assert merged.email == ''
+    # The inputs are not changed
+    assert item.phone == ''
+
+
+def test_merge_overrides():
+    item = FacebookRecord(description='Short')
+    page = FacebookRecord(description='A longer description')
+
+    assert merge_records(item, page, description=page.description).description == 'A longer description'
+
+
+def test_merge_keeps_source_keys():
+    item = FacebookRecord.from_dict({'id': 3, 'phone': '', 'order_id': 7})
+
+    merged = merge_records(item, FacebookRecord(phone='123', title='Title'))
+
+    assert merged.to_dict(exclude_unset=True) == {'id': 3, 'phone': '123', 'title': 'Title', 'order_id': 7}
+
+
+def test_to_dict_exclude_unset_matches_model_dump():
+    data = {'id': 5, 'logo': '', 'social': 'https://facebook.com/x', 'relevance': 0.0}
+
+    record = FacebookRecord.from_dict(data)
+
+    assert record.to_dict(exclude_unset=True) == FacebookItem(**data).model_dump(exclude_unset=True)
+    assert record.to_dict() == FacebookItem(**data).model_dump()
+
+
+def test_from_dict_validates_other_types():
+    record = FacebookRecord.from_dict({'id': '5', 'relevance': 1})
+
+    assert record.id == 5
+    assert record.relevance == 1.0
@@ -0,0 +1,60 @@
+import pytest
+
+from app.domain.utils.tracker import ItemTracker
+from app.infrastructure.schemas import FacebookRecord
+
+fakeredis = pytest.importorskip('fakeredis')
+
+
+@pytest.fixture
+def client():
+    return fakeredis.FakeRedis()
+
+
+def test_processed_in_memory(client):
+    tracker = ItemTracker('o1', client=client)
+
+    assert not tracker.processed('https://a.example')
+    assert tracker.processed('https://a.example')
+    assert not client.exists(tracker.key)
+
+
+def test_processed_after_spill(client):
+    tracker = ItemTracker('o1', spill_threshold=2, client=client)
+    for web in ('a', 'b', 'c'):
+        assert not tracker.processed(web)
+
+    assert client.scard(tracker.key) == 3
+    assert tracker.processed('a')
+    assert not tracker.processed('d')
+    assert client.ttl(tracker.key) > 0
+
+
+def test_reset_drops_what_a_crashed_run_left(client):
+    ItemTracker('o1', spill_threshold=1, client=client).processed('a')
+    ItemTracker('o1', spill_threshold=1, client=client).processed('b')
+
+    tracker = ItemTracker('o1', spill_threshold=1, client=client)
+    tracker.reset()
+    tracker.processed('c')
+    tracker.processed('d')
+
+    assert not tracker.processed('a')
+
+
+def test_items_are_kept_in_redis_in_batches(client):
+    tracker = ItemTracker('o1', insert_batch=3, client=client)
+    items = [FacebookRecord.from_dict({'id': n, 'web': f'w{n}', 'logo': ''}) for n in range(7)]
+    for item in items:
+        tracker.add(item)
+
+    # Only the last, incomplete batch is in memory
+    assert client.llen(tracker.items_key) == 6
+    batches = list(tracker.batches())
+
+    assert [len(batch) for batch in batches] == [3, 3, 1]
+    assert [item for batch in batches for item in batch] == items
+    # The key set of the stored items is kept
+    assert batches[0][0].to_dict(exclude_unset=True) == {'id': 0, 'web': 'w0', 'logo': ''}
+    assert not client.exists(tracker.items_key)
+    assert list(tracker.batches()) == []
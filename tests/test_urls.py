@@ -0,0 +1,65 @@
+import pytest
+
+from app.infrastructure.repositories import FacebookPageCacheRepository
+from app.infrastructure.urls import canonicalize_facebook_url
+
+
+@pytest.mark.parametrize('url, expected', [
+    ('https://www.facebook.com/BlueFoxCafe/', 'https://facebook.com/bluefoxcafe'),
+    ('http://m.facebook.com/bluefoxcafe?ref=page_internal', 'https://facebook.com/bluefoxcafe'),
+    ('https://web.facebook.com/bluefoxcafe//', 'https://facebook.com/bluefoxcafe'),
+    ('facebook.com/bluefoxcafe/about', 'https://facebook.com/bluefoxcafe/about'),
+    ('https://www.facebook.com/pages/Blue-Fox-Cafe/123456789', 'https://facebook.com/123456789'),
+    ('https://www.facebook.com/pages/Blue-Fox-Cafe/123456789/about', 'https://facebook.com/123456789/about'),
+    ('https://www.facebook.com/profile.php?id=100064', 'https://facebook.com/100064'),
+    ('https://www.facebook.com/profile.php?id=100064&sk=about', 'https://facebook.com/100064/about'),
+    ('https://fb.com/bluefoxcafe', 'https://facebook.com/bluefoxcafe'),
+    # Posts, photos, videos and shared links keep the parameters which identify them
+    ('https://www.facebook.com/story.php?story_fbid=123&id=456&ref=share', 'https://facebook.com/story.php?id=456&story_fbid=123'),
+    ('https://m.facebook.com/permalink.php?id=456&story_fbid=789', 'https://facebook.com/permalink.php?id=456&story_fbid=789'),
+    ('https://www.facebook.com/photo.php?fbid=99&set=a.1', 'https://facebook.com/photo.php?fbid=99'),
+    ('https://www.facebook.com/watch/?v=555&ref=sharing', 'https://facebook.com/watch?v=555'),
+    ('https://www.facebook.com/sharer.php?u=bluefox.example', 'https://facebook.com/sharer.php?u=bluefox.example'),
+])
+def test_canonicalize_facebook_url(url, expected):
+    assert canonicalize_facebook_url(url) == expected
+
+
+@pytest.mark.parametrize('url', [
+    'https://www.facebook.com/profile.php',
+    'https://www.facebook.com/story.php?ref=share',
+    'https://www.facebook.com/watch/',
+    'https://www.facebook.com/',
+])
+def test_urls_without_page(url):
+    assert canonicalize_facebook_url(url) == ''
+
+
+def test_different_posts_have_different_keys():
+    urls = [
+        'https://www.facebook.com/story.php?story_fbid=1&id=10',
+        'https://www.facebook.com/story.php?story_fbid=2&id=10',
+        'https://www.facebook.com/photo.php?fbid=1',
+        'https://www.facebook.com/photo.php?fbid=2',
+        'https://www.facebook.com/watch/?v=1',
+        'https://www.facebook.com/watch/?v=2',
+    ]
+    assert len({canonicalize_facebook_url(url) for url in urls}) == len(urls)
+
+
+def test_page_cache_skips_urls_without_page():
+    cache = FacebookPageCacheRepository.__new__(FacebookPageCacheRepository)
+
+    assert cache._key('business', 'https://www.facebook.com/profile.php') is None
+    assert cache._key('business', 'https://www.facebook.com/BlueFoxCafe/') == \
+        cache._key('business', 'https://m.facebook.com/bluefoxcafe')
+
+
+@pytest.mark.parametrize('url, expected', [
+    ('https://www.bluefox.example/menu/', 'http://bluefox.example/menu'),
+    ('https://notfacebook.com/page', 'http://notfacebook.com/page'),
+    ('', ''),
+    (None, ''),
+])
+def test_canonicalize_other_urls(url, expected):
+    assert canonicalize_facebook_url(url) == expected
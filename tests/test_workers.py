@@ -0,0 +1,58 @@
+import time
+
+import psutil
+import pytest
+
+from app.applications.workers import WorkerPool
+from app.infrastructure.schemas import FacebookRecord
+
+
+@pytest.fixture
+def recycling_pool():
+    # 1 MB is less than any process, so the worker is recycled after every item
+    pool = WorkerPool().start(1, threads=2, max_rss_mb=1)
+    yield pool
+    pool.stop()
+
+
+def test_items_survive_worker_replacement(recycling_pool):
+    """
+    Every item is done although the only worker is replaced after each of them:
+    the items sent while the slot is empty wait for the new worker.
+    """
+    # Without a facebook link in social the page returns the item without a browser
+    items = [FacebookRecord(id=n, title=f'Item {n}', social='https://twitter.com/x') for n in range(10)]
+
+    futures = [recycling_pool.submit('business', item) for item in items]
+    results = [future.result(timeout=120) for future in futures]
+
+    assert [result.id for result in results] == list(range(10))
+    assert [result.title for result in results] == [item.title for item in items]
+    assert recycling_pool.running
+
+
+def test_stopped_pool_is_not_running():
+    pool = WorkerPool()
+    assert not pool.running
+
+
+def test_stop_while_workers_are_replaced():
+    """
+    A worker which is started by a replacement after stop() doesn't outlive the pool.
+    """
+    pool = WorkerPool().start(1, threads=1, max_rss_mb=1)
+    futures = [pool.submit('business', FacebookRecord(id=n, social='https://twitter.com/x')) for n in range(3)]
+    futures[0].result(timeout=120)
+    # The worker is recycled after the item, the replacement is on its way
+    pool.stop()
+
+    def workers():
+        # The resource tracker of multiprocessing is a child too
+        return [child for child in psutil.Process().children()
+                if 'spawn_main' in ' '.join(child.cmdline()) and child.status() != psutil.STATUS_ZOMBIE]
+
+    deadline = time.monotonic() + 60
+    while workers() and time.monotonic() < deadline:
+        time.sleep(0.5)
+    assert not workers()
+    assert not pool.processes